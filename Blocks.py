@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+# Evaluate calls to block-bodied methods: straight-line locals, constant ifs and returns
+from collections.abc import Callable
+
+from tree_sitter import Node
+
+from Environment import Environment, Type
+from Resolver import CSEvaluator, Compiled, _unquote
+from Syntax import node_text
+
+
+# A condition evaluates to True or False, or None when it is not constant
+Condition = Callable[[Environment], "bool | None"]
+
+# Returned by a step that cannot be followed (a throw, a loop that may return, a condition that is not constant)
+_UNKNOWN = object()
+
+# Statements that are skipped unless they contain one of these
+_SKIPPED_UNLESS = {"return_statement", "yield_statement", "assignment_expression", "++", "--"}
+
+
+def _contains(node: Node, types: set[str]) -> bool:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.type in types:
+            return True
+        if node.type not in ("local_function_statement", "lambda_expression", "anonymous_method_expression"):
+            stack.extend(node.children)  # ++ and -- are anonymous
+    return False
+
+
+class BlockBody:
+    """
+    The block body of a method compiled for calls, e.g.
+
+        string Url(string id) { var path = $"{Root}/items"; if (id == null) { return path; } return $"{path}/{id}"; }
+
+    Local declarations and assignments to locals and parameters run in order, an if statement takes
+    the branch its condition selects once the arguments are bound (==, !=, !, && and || over resolved
+    values and literals), and the first return gives the result. Calls and other statements without a
+    return in them are skipped. run() gives None when the result depends on anything else, e.g. a
+    local updated with ++ or --.
+
+    Built once per method from its tree, with the expressions compiled by CSEvaluator.
+    """
+
+    def __init__(self, block: Node, source: memoryview, parameters: list[str]):
+        self.parameters = set(parameters)
+        self.locals: set[str] = set()
+        self.expressions: list[str] = []
+        self.has_local_functions = False
+        self.steps = self._statements(block, source)
+
+    def references(self) -> set[str]:
+        """Names the body refers to, apart from its parameters and locals."""
+        found: set[str] = set()
+        for expression in self.expressions:
+            found |= CSEvaluator.references(expression)
+        return found - self.parameters - self.locals
+
+    def run(self, environment: Environment) -> str | None:
+        """The returned value with the parameters defined in environment, or None."""
+        result = self._execute(self.steps, environment)
+        return None if result is _UNKNOWN else result
+
+    def _expression(self, node: Node, source: memoryview) -> Compiled:
+        expression = node_text(source, node)
+        self.expressions.append(expression)
+        return CSEvaluator.compile(expression)
+
+    def _statements(self, block: Node, source: memoryview) -> list[tuple]:
+        steps = []
+        for statement in block.named_children:
+            steps.extend(self._statement(statement, source))
+        return steps
+
+    def _statement(self, node: Node, source: memoryview) -> list[tuple]:
+        kind = node.type
+        if kind == "block":
+            return self._statements(node, source)
+        if kind == "local_declaration_statement":
+            return self._declaration(node, source)
+        if kind == "expression_statement" and node.named_child_count:
+            expression = node.named_children[0]
+            if expression.type == "assignment_expression":
+                return self._assignment(expression, source)
+            if expression.type in ("postfix_unary_expression", "prefix_unary_expression"):
+                return self._increment(expression, source)
+            return []  # a call; its result is not used
+        if kind == "if_statement":
+            alternative = node.child_by_field_name("alternative")
+            consequence = self._statement(node.child_by_field_name("consequence"), source)
+            alternative = self._statement(alternative, source) if alternative is not None else []
+            if not consequence and not alternative:
+                return []  # e.g. only calls: whichever branch runs, the result is the same
+            return [("if", self._condition(node.child_by_field_name("condition"), source), consequence, alternative)]
+        if kind == "return_statement":
+            value = self._expression(node.named_children[0], source) if node.named_child_count else (lambda environment: "")
+            return [("return", value)]
+        if kind == "local_function_statement":
+            self.has_local_functions = True
+            return []
+        if kind == "throw_statement" or _contains(node, _SKIPPED_UNLESS):
+            return [("unknown",)]
+        return []
+
+    def _declaration(self, node: Node, source: memoryview) -> list[tuple]:
+        steps = []
+        for declaration in node.named_children:
+            if declaration.type != "variable_declaration":
+                continue
+            var_type = declaration.child_by_field_name("type")
+            cstype = node_text(source, var_type).strip() if var_type is not None and var_type.type == "predefined_type" else "string"
+            for declarator in declaration.named_children:
+                if declarator.type != "variable_declarator":
+                    continue
+                name = declarator.child_by_field_name("name")
+                values = [child for child in declarator.named_children if child != name]
+                value = self._expression(values[-1], source) if values else (lambda environment: "")
+                self.locals.add(node_text(source, name))
+                steps.append(("define", node_text(source, name), value, cstype))
+        return steps
+
+    def _assignment(self, node: Node, source: memoryview) -> list[tuple]:
+        left, right = node.child_by_field_name("left"), node.child_by_field_name("right")
+        operator = node.child_by_field_name("operator")
+        name = node_text(source, left)
+        if left.type != "identifier" or (name not in self.locals and name not in self.parameters):
+            return []  # a field or a member of an object: not part of the result
+        if operator is None or operator.type not in ("=", "+="):
+            return [("unknown",)]
+        return [("assign", name, self._expression(right, source), operator.type == "+=")]
+
+    def _increment(self, node: Node, source: memoryview) -> list[tuple]:
+        """n++, --n and the like: an update of a local or parameter is not followed."""
+        if node.named_child_count != 1 or not any(child.type in ("++", "--") for child in node.children):
+            return []
+        operand = node.named_children[0]
+        name = node_text(source, operand)
+        if operand.type != "identifier" or (name not in self.locals and name not in self.parameters):
+            return []  # a field or a member of an object: not part of the result
+        return [("unknown",)]
+
+    def _condition(self, node: Node, source: memoryview) -> Condition:
+        kind = node.type
+        if kind == "parenthesized_expression" and node.named_child_count == 1:
+            return self._condition(node.named_children[0], source)
+        if kind == "boolean_literal":
+            constant = node_text(source, node) == "true"
+            return lambda environment: constant
+        if kind == "prefix_unary_expression" and node.children[0].type == "!" and node.named_child_count == 1:
+            operand = self._condition(node.named_children[0], source)
+            return lambda environment: None if (value := operand(environment)) is None else not value
+        if kind == "binary_expression":
+            operator = node.child_by_field_name("operator").type
+            left, right = node.child_by_field_name("left"), node.child_by_field_name("right")
+            if operator in ("&&", "||"):
+                return self._logical(operator, self._condition(left, source), self._condition(right, source))
+            if operator in ("==", "!="):
+                return self._comparison(operator == "==", self._expression(left, source), self._expression(right, source))
+            return lambda environment: None
+        value = self._expression(node, source)
+
+        def boolean(environment: Environment) -> bool | None:
+            unresolved = CSEvaluator.unresolved_count
+            result = value(environment)
+            if CSEvaluator.unresolved_count != unresolved or result not in ("true", "false"):
+                return None
+            return result == "true"
+        return boolean
+
+    @staticmethod
+    def _logical(operator: str, left: Condition, right: Condition) -> Condition:
+        deciding = operator == "||"  # the left value that decides without looking at the right one
+
+        def logical(environment: Environment) -> bool | None:
+            first = left(environment)
+            if first is deciding:
+                return deciding
+            second = right(environment)
+            if second is deciding:
+                return deciding
+            if first is None or second is None:
+                return None
+            return not deciding
+        return logical
+
+    @staticmethod
+    def _comparison(equal: bool, left: Compiled, right: Compiled) -> Condition:
+        def comparison(environment: Environment) -> bool | None:
+            unresolved = CSEvaluator.unresolved_count
+            same = _unquote(left(environment)) == _unquote(right(environment))
+            if CSEvaluator.unresolved_count != unresolved:
+                return None
+            return same == equal
+        return comparison
+
+    def _execute(self, steps: list[tuple], environment: Environment):
+        for step in steps:
+            kind = step[0]
+            if kind == "define":
+                _, name, value, cstype = step
+                environment.define(name, Type(value(environment), cstype))
+            elif kind == "assign":
+                _, name, value, append = step
+                result = value(environment)
+                current = environment.get(name)
+                if append:
+                    before = current.value if current is not None else ""
+                    if before.isdigit() and result.isdigit():
+                        result = str(int(before) + int(result))
+                    else:
+                        result = f'"{_unquote(before)}{_unquote(result)}"'
+                environment.assign(name, Type(result, current.cstype if current is not None else "string"))
+            elif kind == "if":
+                condition = step[1](environment)
+                if condition is None:
+                    return _UNKNOWN
+                result = self._execute(step[2] if condition else step[3], environment)
+                if result is not None:
+                    return result
+            elif kind == "return":
+                return step[1](environment)
+            else:
+                return _UNKNOWN
+        return None
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+# Evaluate class-level symbols once each, in dependency order
+import heapq
+import logging
+
+from collections.abc import Iterable
+
+from Environment import Environment, Type
+from metrics import METRICS
+from Resolver import CSEvaluator
+
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyGraph:
+    """
+    Symbols (fields and properties) with their initializer expressions and the names each initializer refers to.
+
+    evaluate_all() evaluates every symbol exactly once in topological order, so a field may refer to
+    a property declared after it. reevaluate() redoes only the symbols downstream of the changed names,
+    which may be symbols or outside names such as globals.
+    Symbols on a dependency cycle are reported in cycles and keep their initializer text, unresolved.
+    """
+
+    def __init__(self, environment: Environment):
+        self.environment = environment
+        self.initializers: dict[str, str] = {}  # in declaration order
+        self.references: dict[str, set[str]] = {}
+        self.dependents: dict[str, set[str]] = {}
+        self.cycles: list[list[str]] = []
+        self.evaluations = 0
+        self._position: dict[str, int] = {}
+
+    def add(self, name: str, initializer: str, references: Iterable[str]):
+        """Add a symbol, or replace the initializer of an existing one."""
+        for reference in self.references.get(name, ()):
+            self.dependents[reference].discard(name)
+        self.initializers[name] = initializer
+        self._position.setdefault(name, len(self._position))
+        self.references[name] = set(references)
+        for reference in self.references[name]:
+            self.dependents.setdefault(reference, set()).add(name)
+
+    def downstream(self, changed: Iterable[str]) -> set[str]:
+        """The symbols among changed plus every symbol that depends on one of them, directly or not."""
+        found = set()
+        stack = list(changed)
+        while stack:
+            name = stack.pop()
+            if name in self.initializers:
+                if name in found:
+                    continue
+                found.add(name)
+            stack.extend(self.dependents.get(name, ()))
+        return found
+
+    def evaluate_all(self) -> list[str]:
+        """Evaluate every symbol; returns the evaluation order."""
+        self.cycles = []
+        return self._evaluate(list(self.initializers))
+
+    def reevaluate(self, changed: Iterable[str]) -> list[str]:
+        """Re-evaluate the symbols affected by a change to the given names; returns those symbols in evaluation order."""
+        symbols = self.downstream(changed)
+        # Cached call results may have been computed from the old values
+        CSEvaluator.call_cache.clear()
+        self.cycles = [cycle for cycle in self.cycles if not symbols.intersection(cycle)]
+        return self._evaluate([name for name in self.initializers if name in symbols])
+
+    def _evaluate(self, symbols: list[str]) -> list[str]:
+        order, remaining = self._topological_order(symbols)
+        for name in order:
+            self._evaluate_symbol(name)
+        if remaining:
+            for component in self._components(remaining):
+                if len(component) > 1 or component[0] in self.references[component[0]]:
+                    # A cycle has no value to start from: keep the initializers, unresolved
+                    self.cycles.append(component)
+                    logger.warning("DEPENDENCY CYCLE: %s", " -> ".join(component + component[:1]))
+                    if METRICS.enabled:
+                        METRICS.count("dependency_cycles")
+                    for name in component:
+                        self.environment.define(name, Type(self.initializers[name], "unknown"))
+                    continue
+                self._evaluate_symbol(component[0])
+                order.append(component[0])
+        return order
+
+    def _topological_order(self, symbols: list[str]) -> tuple[list[str], list[str]]:
+        """
+        Kahn's algorithm over the given symbols, preferring declaration order among ready symbols.
+        Returns the ordered symbols and the ones left over because they are on or behind a cycle.
+        """
+        pending = set(symbols)
+        indegree = {name: len(self.references[name] & pending) for name in symbols}
+        ready = [(self._position[name], name) for name in symbols if indegree[name] == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, name = heapq.heappop(ready)
+            order.append(name)
+            for dependent in self.dependents.get(name, ()):
+                if dependent in indegree:
+                    indegree[dependent] -= 1
+                    if indegree[dependent] == 0:
+                        heapq.heappush(ready, (self._position[dependent], dependent))
+        ordered = set(order)
+        return order, [name for name in symbols if name not in ordered]
+
+    def _components(self, symbols: list[str]) -> list[list[str]]:
+        """Strongly connected components of the given symbols (Tarjan), dependencies first."""
+        pending = set(symbols)
+        index: dict[str, int] = {}
+        lowlink: dict[str, int] = {}
+        stack: list[str] = []
+        on_stack: set[str] = set()
+        components: list[list[str]] = []
+
+        def visit(name: str):
+            index[name] = lowlink[name] = len(index)
+            stack.append(name)
+            on_stack.add(name)
+            for reference in self.references[name] & pending:
+                if reference not in index:
+                    visit(reference)
+                    lowlink[name] = min(lowlink[name], lowlink[reference])
+                elif reference in on_stack:
+                    lowlink[name] = min(lowlink[name], index[reference])
+            if lowlink[name] == index[name]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == name:
+                        break
+                components.append(sorted(component, key=self._position.__getitem__))
+
+        for name in symbols:
+            if name not in index:
+                visit(name)
+        return components
+
+    def _evaluate_symbol(self, name: str):
+        initializer = self.initializers[name]
+        try:
+            # Try to resolve the expression
+            resolved_value = CSEvaluator.evaluate(initializer, self.environment)
+            type_obj = Type(resolved_value, CSEvaluator._determine_type(resolved_value))
+        except Exception as e:
+            logger.warning("COULD NOT BE RESOLVED: %s = %s (%s)", name, initializer, e)
+            if METRICS.enabled:
+                METRICS.count("evaluation_errors")
+            # Store the unresolved value
+            type_obj = Type(initializer, "unknown")
+        self.environment.define(name, type_obj)
+        self.evaluations += 1
@@ -1,42 +1,93 @@
 from __future__ import annotations
 
+import sys
+
 
 class Type:
+    __slots__ = ("value", "cstype")
     cstype: str
 
     def __init__(self, value, cstype: str):
         self.value = value
         self.cstype = cstype
-    
+
     def __str__(self) -> str:
         return f"'{self.value}'"
-    
+
     def __repr__(self) -> str:
         return self.__str__()
 
 
+# How often each name was newly defined in any environment. A cached lookup of a name is
+# valid while this count is unchanged: a new definition may shadow the scope it was found in.
+_generations: dict[str, int] = {}
+
+
 class Environment:
+    __slots__ = ("enclosing", "values", "_resolved")
+
+    # Environments that compute names on lookup (Symbols.IndexEnvironment) set this;
+    # a scope-chain lookup hands over to their get() instead of reading values
+    computed = False
+
     def __init__(self, enclosing: Environment | None = None):
         self.enclosing: Environment | None = enclosing # enclosing is the globals
         self.values: dict[str, Type] = {}
+        # name -> (generation, scope it was found in or None); created on the first lookup that misses
+        self._resolved: dict[str, tuple[int, Environment | None]] | None = None
 
     def define(self, name: str, value: Type):
         """Define a new variable in the current environment."""
+        if name not in self.values:
+            name = sys.intern(name)
+            _generations[name] = _generations.get(name, 0) + 1
         self.values[name] = value
 
+    def replace_values(self, values: dict[str, Type]):
+        """Replace all variables at once (e.g. after an edit renamed some), invalidating cached lookups."""
+        for name in self.values.keys() ^ values.keys():
+            _generations[name] = _generations.get(name, 0) + 1
+        self.values = {sys.intern(name): value for name, value in values.items()}
+
     def get(self, name: str) -> Type | None:
         """Get a variable from the current environment or parent."""
-        if name in self.values:
-            return self.values[name]
-        if self.enclosing:
-            return self.enclosing.get(name)
-        return None
+        values = self.values
+        if name in values:
+            return values[name]
+        resolved = self._resolved
+        if resolved is None:
+            resolved = self._resolved = {}
+        generation = _generations.get(name, 0)
+        entry = resolved.get(name)
+        if entry is not None and entry[0] == generation:
+            scope = entry[1]
+        else:
+            # Walk the chain once; later lookups of this name jump straight to the scope
+            scope = self.enclosing
+            while scope is not None and not scope.computed and name not in scope.values:
+                scope = scope.enclosing
+            resolved[name] = (generation, scope)
+        if scope is None:
+            return None
+        if scope.computed:
+            return scope.get(name)
+        return scope.values.get(name)
 
     def assign(self, name: str, value: Type) -> bool:
         """Assign an existing variable, searching in enclosing environments."""
-        if name in self.values:
-            self.values[name] = value
-            return True
-        if self.enclosing:
-            return self.enclosing.assign(name, value)
+        scope = self
+        while scope is not None:
+            if name in scope.values:
+                scope.values[name] = value
+                return True
+            scope = scope.enclosing
         return False
+
+    def inherited_scope(self, base_name: str, enclosing: Environment) -> Environment | None:
+        """
+        An environment holding the members a class inherits from base_name, in front of enclosing.
+        Only a symbol index (Symbols.IndexEnvironment) knows about other classes; plain environments ask their parent.
+        """
+        if self.enclosing:
+            return self.enclosing.inherited_scope(base_name, enclosing)
+        return None
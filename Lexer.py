@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+# Split C# string expressions into literal text and interpolation holes in one pass over the source
+import re
+
+
+_OPENING = "([{"
+_CLOSING = ")]}"
+_IDENTIFIER_PATTERN = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+
+# The characters each scan stops at; the text in between is skipped by one regex search
+_STRING_STOPS = re.compile(r'[\\"{}]')
+_RAW_STRING_STOPS = re.compile(r'["{]')
+_LITERAL_STOPS = re.compile(r'["$@\']')
+_CODE_STOPS = "\"$@'()[]{}"
+_code_stops: dict[str, re.Pattern] = {}
+
+
+def _stops(separators: str = "") -> re.Pattern:
+    """The pattern finding literals, brackets and the given separators in code."""
+    pattern = _code_stops.get(separators)
+    if pattern is None:
+        pattern = _code_stops[separators] = re.compile(f"[{re.escape(_CODE_STOPS + separators)}]")
+    return pattern
+
+
+def _literal_start(text: str, i: int) -> bool:
+    """Whether the stop at text[i] starts a string or character literal (a $ or @ may also start a name)."""
+    c = text[i]
+    return c == '"' or c == "'" or is_string_start(text, i)
+
+
+def _skip_literal(text: str, i: int) -> int:
+    """Return the index just past the string or character literal starting at text[i]."""
+    if text[i] != "'":
+        return lex_string(text, i)
+    end = text.find("'", i + 3 if text.startswith("\\", i + 1) else i + 2)
+    return len(text) if end < 0 else end + 1
+
+
+class Hole:
+    """An interpolation hole {code,alignment:format}, or a term of a concatenation that is not a string literal."""
+    __slots__ = ("code", "alignment", "format")
+
+    def __init__(self, code: str, alignment: str | None = None, format: str | None = None):
+        self.code = code
+        self.alignment = alignment
+        self.format = format
+
+    def __repr__(self) -> str:
+        return f"Hole({self.code!r}, {self.alignment!r}, {self.format!r})"
+
+
+def is_string_start(text: str, i: int) -> bool:
+    """Whether a string literal starts at text[i]: "...", @"...", $"...", $@"...", @$"...", \"""...\""" or $$\"""...\"""."""
+    c = text[i]
+    if c == '"':
+        return True
+    if c != "$" and c != "@":
+        return False
+    i += 1
+    while i < len(text) and text[i] in "$@":
+        i += 1
+    return i < len(text) and text[i] == '"'
+
+
+def lex_string(text: str, i: int, segments: list[str | Hole] | None = None) -> int:
+    """
+    Return the index just past the string literal starting at text[i] (at its $ or @ prefix, if any).
+    With segments, appends its value as it would be at run time: literal text ({{, }} and "" in a verbatim
+    string unescaped, a raw string dedented) and a Hole per interpolation. Backslash escapes stay as written.
+    """
+    dollars = verbatim = 0
+    while text[i] in "$@":
+        if text[i] == "$":
+            dollars += 1
+        else:
+            verbatim = 1
+        i += 1
+    quotes = 0
+    while text.startswith('"', i + quotes):
+        quotes += 1
+    if quotes >= 3:
+        return _lex_raw_string(text, i + quotes, quotes, dollars, segments)
+
+    i += 1  # opening quote
+    literal_start = i
+    while (match := _STRING_STOPS.search(text, i)) is not None:
+        i = match.start()
+        c = text[i]
+        if c == "\\":
+            if not verbatim:
+                i += 2
+                continue
+        elif c == '"':
+            if verbatim and text.startswith('""', i):
+                if segments is not None:
+                    segments.append(text[literal_start:i + 1])
+                i = literal_start = i + 2
+                continue
+            break
+        elif dollars:
+            if text.startswith(c * 2, i):
+                if segments is not None:
+                    segments.append(text[literal_start:i + 1])
+                i = literal_start = i + 2
+                continue
+            if c == "{":
+                if segments is not None:
+                    segments.append(text[literal_start:i])
+                i = literal_start = _lex_hole(text, i + 1, 1, segments)
+                continue
+        i += 1
+    else:
+        i = len(text)
+    if segments is not None:
+        segments.append(text[literal_start:i])
+    return i + 1
+
+
+def _lex_raw_string(text: str, i: int, quotes: int, dollars: int, segments: list[str | Hole] | None) -> int:
+    """
+    A raw string from its content at text[i]: ends at as many quotes as it opened with. An interpolated one
+    opens a hole at as many { as it has $; fewer are literal text. A multi-line one drops its first and last
+    line and the indentation of its closing line from every line.
+    """
+    closing = '"' * quotes
+    pieces: list[str | Hole] = []
+    content_start = literal_start = i
+    while (match := _RAW_STRING_STOPS.search(text, i)) is not None:
+        i = match.start()
+        if text[i] == '"':
+            if text.startswith(closing, i):
+                break
+            i += 1
+        elif dollars:
+            run = i
+            while run < len(text) and text[run] == "{":
+                run += 1
+            if run - i >= dollars:
+                pieces.append(text[literal_start:run - dollars])
+                i = literal_start = _lex_hole(text, run, dollars, pieces)
+            else:
+                i = run
+        else:
+            i += 1
+    else:
+        i = len(text)
+    pieces.append(text[literal_start:i])
+    end = i + quotes
+
+    if segments is not None:
+        if text.startswith(("\n", "\r\n"), content_start):
+            last_line = text.rfind("\n", content_start, i)
+            indentation = "\n" + text[last_line + 1:i]
+            pieces = [piece.replace("\r\n", "\n").replace(indentation, "\n") if isinstance(piece, str) else piece for piece in pieces]
+            pieces[0] = pieces[0][1:]
+            pieces[-1] = pieces[-1][:-1]
+        segments.extend(pieces)
+    return end
+
+
+def _lex_hole(text: str, i: int, braces: int, segments: list[str | Hole] | None) -> int:
+    """Return the index just past the hole whose code starts at text[i]; appends it to segments."""
+    start = i
+    alignment_start = format_start = None
+    depth = 0
+    pattern = _stops(",:")
+    while (match := pattern.search(text, i)) is not None:
+        i = match.start()
+        c = text[i]
+        if _literal_start(text, i):
+            i = _skip_literal(text, i)
+            continue
+        if c in _OPENING:
+            depth += 1
+        elif c in _CLOSING:
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0 and c == "," and alignment_start is None:
+            alignment_start = i + 1
+        elif depth == 0 and c == ":" and not text.startswith("::", i) and text[i - 1] != ":":
+            format_start = i + 1
+            i = text.find("}", i)  # the format runs up to the closing brace
+            if i < 0:
+                i = len(text)
+            break
+        i += 1
+    else:
+        i = len(text)
+    if segments is not None:
+        end = i if format_start is None else format_start - 1
+        code = text[start:end if alignment_start is None else alignment_start - 1].strip()
+        alignment = None if alignment_start is None else text[alignment_start:end].strip()
+        segments.append(Hole(code, alignment, None if format_start is None else text[format_start:i]))
+    return i + braces
+
+
+def string_segments(expression: str) -> list[str | Hole] | None:
+    """
+    The value of a string expression as literal text and holes, in one pass: a string literal of any kind
+    or a + concatenation, whose terms that are not a single string literal become holes. None when the
+    expression is neither, e.g. a call or a single name.
+    """
+    segments: list[str | Hole] = []
+    terms = literals = 0
+    depth = 0
+    term_start = scanned = i = 0
+    blank = True  # nothing but whitespace in the current term so far
+    literal: list[str | Hole] | None = None  # the segments of the literal the current term consists of
+    pattern = _stops("+")
+    while True:
+        match = pattern.search(expression, i)
+        i = len(expression) if match is None else match.start()
+        if expression[scanned:i].strip():
+            blank, literal = False, None
+        if i < len(expression) and (expression[i] != "+" or depth != 0):
+            c = expression[i]
+            if c == "'":
+                blank, literal = False, None
+                i = _skip_literal(expression, i)
+            elif _literal_start(expression, i):
+                if depth == 0 and blank:
+                    literal = []
+                    i = lex_string(expression, i, literal)
+                else:
+                    literal = None
+                    i = lex_string(expression, i)
+                blank = False
+            else:
+                if c in _OPENING:
+                    depth += 1
+                elif c in _CLOSING:
+                    depth -= 1
+                blank, literal = False, None
+                i += 1
+            scanned = i
+            continue
+        # End of a term: a top-level + or the end of the expression
+        terms += 1
+        if literal is not None:
+            literals += 1
+            segments.extend(literal)
+        elif code := expression[term_start:i].strip():
+            segments.append(Hole(code))
+        if i >= len(expression):
+            break
+        blank, literal = True, None
+        i = term_start = scanned = i + 1
+    if terms == 1 and not literals:
+        return None
+    return segments
+
+
+def skip_code(text: str, i: int, closing: str) -> int:
+    """Return the index just past the given closing bracket, skipping nested brackets and literals."""
+    depth = 0
+    pattern = _stops()
+    while (match := pattern.search(text, i)) is not None:
+        i = match.start()
+        c = text[i]
+        if _literal_start(text, i):
+            i = _skip_literal(text, i)
+            continue
+        if c in _OPENING:
+            depth += 1
+        elif c in _CLOSING:
+            if depth == 0 and c == closing:
+                return i + 1
+            depth -= 1
+        i += 1
+    return len(text)
+
+
+def split_top_level(text: str, separator: str) -> list[str]:
+    """
+    Split text on separator where it is not inside a string or character literal or brackets.
+    """
+    parts = []
+    depth = 0
+    start = i = 0
+    pattern = _stops(separator)
+    while (match := pattern.search(text, i)) is not None:
+        i = match.start()
+        c = text[i]
+        if _literal_start(text, i):
+            i = _skip_literal(text, i)
+            continue
+        if c in _OPENING:
+            depth += 1
+        elif c in _CLOSING:
+            depth -= 1
+        elif c == separator and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+        i += 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def identifiers(text: str, found: set[str]):
+    """Add the identifiers used as code in text, including inside interpolation holes but not in literals or format specs."""
+    start = i = 0
+    while (match := _LITERAL_STOPS.search(text, i)) is not None:
+        i = match.start()
+        if not _literal_start(text, i):
+            i += 1
+            continue
+        found.update(_IDENTIFIER_PATTERN.findall(text, start, i))
+        if text[i] == "'":
+            i = start = _skip_literal(text, i)
+            continue
+        segments: list[str | Hole] = []
+        i = start = lex_string(text, i, segments)
+        for segment in segments:
+            if isinstance(segment, Hole):
+                identifiers(segment.code, found)
+                if segment.alignment:
+                    identifiers(segment.alignment, found)
+    found.update(_IDENTIFIER_PATTERN.findall(text, start))
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+# Structured attributes, request endpoints and an index to query test metadata across a suite
+import sys
+
+from tree_sitter import Node
+
+from Resolver import _unquote
+from Syntax import node_text
+
+
+class Attribute:
+    """
+    One attribute of an attribute list, e.g. Swagger(Path = Paths.None, ResponseCode = 200):
+    its name, positional arguments and named arguments, all as source text.
+    """
+
+    def __init__(self, name: str, arguments: list[str], named: dict[str, str]):
+        self.name = name
+        self.arguments = arguments
+        self.named = named
+
+    @property
+    def short_name(self) -> str:
+        """The name without a namespace or an Attribute suffix: Data.SetUpAttribute -> SetUp."""
+        name = self.name.rsplit(".", 1)[-1]
+        return name[:-len("Attribute")] if name.endswith("Attribute") and name != "Attribute" else name
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "arguments": list(self.arguments), "named": dict(self.named)}
+
+    @classmethod
+    def from_dict(cls, record: dict) -> Attribute:
+        return cls(record["name"], list(record["arguments"]), dict(record["named"]))
+
+    def __repr__(self) -> str:
+        return f"Attribute({self.name!r}, {self.arguments!r}, {self.named!r})"
+
+
+def parse_attribute_list(node: Node, source: memoryview) -> list[Attribute]:
+    """The attributes of an attribute_list node ([Test, Category("x")] holds two)."""
+    attributes = []
+    for attribute in node.named_children:
+        if attribute.type != "attribute":
+            continue
+        name = attribute.child_by_field_name("name")
+        arguments: list[str] = []
+        named: dict[str, str] = {}
+        for child in attribute.named_children:
+            if child.type != "attribute_argument_list":
+                continue
+            for argument in child.named_children:
+                if argument.type != "attribute_argument":
+                    continue
+                parts = argument.named_children
+                if len(parts) == 1 and parts[0].type == "assignment_expression":
+                    # Name = value
+                    left, right = parts[0].child_by_field_name("left"), parts[0].child_by_field_name("right")
+                    named[node_text(source, left)] = node_text(source, right)
+                elif len(parts) == 2 and parts[0].type == "identifier":
+                    # Name: value
+                    named[node_text(source, parts[0])] = node_text(source, parts[1])
+                elif parts:
+                    arguments.append(node_text(source, parts[-1]))
+        attributes.append(Attribute(node_text(source, name) if name is not None else "", arguments, named))
+    return attributes
+
+
+def normalize_operation(operation: str) -> str:
+    """OperationType.Post, "Post" and post all become POST."""
+    return _unquote(str(operation)).rsplit(".", 1)[-1].upper()
+
+
+def normalize_endpoint(endpoint: str) -> str:
+    return endpoint.rstrip("/") or "/"
+
+
+def swagger_fields(attributes: list[Attribute]) -> tuple[str | None, str | None, str | None]:
+    """The normalized operation, the response code and the path of the first Swagger attribute, None where absent."""
+    swagger = next((attribute for attribute in attributes if attribute.short_name == "Swagger"), None)
+    if swagger is None:
+        return None, None, None
+    operation = swagger.named.get("Operation")
+    return normalize_operation(operation) if operation is not None else None, swagger.named.get("ResponseCode"), swagger.named.get("Path")
+
+
+class AttributeIndex:
+    """
+    Test methods of a whole suite, indexed by method and class name, attribute name, Swagger operation, Swagger response code
+    and resolved endpoint (also by its path without scheme and host, or a leading part of that path), built from scan records.
+
+    query() intersects the matching sets, so a lookup costs a few dict and set operations
+    however many methods were indexed.
+    """
+
+    def __init__(self):
+        self.entries: list[dict] = []
+        self._by_method: dict[str, set[int]] = {}
+        self._by_class: dict[str, set[int]] = {}
+        self._by_attribute: dict[str, set[int]] = {}
+        self._by_operation: dict[str, set[int]] = {}
+        self._by_response_code: dict[str, set[int]] = {}
+        self._by_endpoint: dict[str, set[int]] = {}
+
+    @classmethod
+    def from_records(cls, records: list[dict]) -> AttributeIndex:
+        index = cls()
+        for record in records:
+            index.add_record(record)
+        return index
+
+    def add_record(self, record: dict):
+        """Index every method of a file record (see scanner.file_record)."""
+        for class_record in record.get("classes", ()):
+            for method in class_record["methods"]:
+                self._add_method(record["file"], class_record, method)
+
+    def _add_method(self, file: str, class_record: dict, method: dict):
+        from urllib.parse import urlsplit  # only the index needs it, so parsing a file does not import it
+
+        attributes = [Attribute.from_dict(attribute) for attribute in method.get("parsed_attributes", ())]
+        operation, response_code, path = swagger_fields(attributes)
+        entry = {
+            "file": file,
+            "class_name": class_record["class_name"],
+            "super_class_name": class_record["super_class_name"],
+            "method_name": method["method_name"],
+            "attributes": [attribute.to_dict() for attribute in attributes],
+            "operation": operation,
+            "response_code": response_code,
+            "path": path,
+            "endpoints": list(method.get("endpoints", ())),
+        }
+        position = len(self.entries)
+        self.entries.append(entry)
+
+        self._by_method.setdefault(entry["method_name"], set()).add(position)
+        self._by_class.setdefault(entry["class_name"], set()).add(position)
+        for attribute in attributes:
+            self._by_attribute.setdefault(attribute.name, set()).add(position)
+            self._by_attribute.setdefault(attribute.short_name, set()).add(position)
+        if entry["operation"]:
+            self._by_operation.setdefault(entry["operation"], set()).add(position)
+        if entry["response_code"]:
+            self._by_response_code.setdefault(entry["response_code"], set()).add(position)
+        for endpoint in entry["endpoints"]:
+            self._by_endpoint.setdefault(normalize_endpoint(endpoint), set()).add(position)
+            # The path and each leading part of it, in whole segments: /api/Share/1 is also found as /api/Share and /api
+            path = normalize_endpoint(urlsplit(endpoint).path)
+            while path and path != "/":
+                self._by_endpoint.setdefault(path, set()).add(position)
+                path, _, segment = path.rpartition("/")
+                if not segment:
+                    break  # a relative path has no leading / to stop at
+
+    def query(self, attribute: str | None = None, operation: str | None = None,
+              response_code: int | str | None = None, endpoint: str | None = None,
+              method_name: str | None = None, class_name: str | None = None) -> list[dict]:
+        """
+        Methods matching every given criterion, in the order they were indexed.
+        endpoint matches a full resolved endpoint, its path, or the path's leading segments.
+        """
+        selected = []
+        if method_name is not None:
+            selected.append(self._by_method.get(method_name, set()))
+        if class_name is not None:
+            selected.append(self._by_class.get(class_name, set()))
+        if attribute is not None:
+            selected.append(self._by_attribute.get(attribute, set()))
+        if operation is not None:
+            selected.append(self._by_operation.get(normalize_operation(operation), set()))
+        if response_code is not None:
+            selected.append(self._by_response_code.get(str(response_code), set()))
+        if endpoint is not None:
+            selected.append(self._by_endpoint.get(normalize_endpoint(endpoint), set()))
+        if not selected:
+            return list(self.entries)
+        selected.sort(key=len)
+        positions = set(selected[0]).intersection(*selected[1:])
+        return [self.entries[position] for position in sorted(positions)]
+
+
+def main(argv: list[str] | None = None) -> int:
+    import argparse
+    import json
+
+    from scanner import scan  # imported here: the scanner imports the parser, which imports this module
+
+    arg_parser = argparse.ArgumentParser(prog="parsing query", description="Scan a directory and list the test methods matching the given attribute, Swagger operation, response code, endpoint, method and class.")
+    arg_parser.add_argument("root", help="directory (or single .cs file) to scan")
+    arg_parser.add_argument("--attribute", default=None, help="attribute name, e.g. Test or Swagger")
+    arg_parser.add_argument("--operation", default=None, help="Swagger operation, e.g. POST")
+    arg_parser.add_argument("--response-code", default=None, help="Swagger response code, e.g. 200")
+    arg_parser.add_argument("--endpoint", default=None, help="resolved endpoint, or only its path")
+    arg_parser.add_argument("--method", default=None, help="method name")
+    arg_parser.add_argument("--class", dest="class_name", default=None, help="class name")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count, 1 = no pool)")
+    arg_parser.add_argument("--index", action="store_true", help="index declarations across all files first")
+    args = arg_parser.parse_args(argv)
+
+    result = scan(args.root, workers=args.workers, index=args.index)
+    index = AttributeIndex.from_records(result["files"])
+    for entry in index.query(args.attribute, args.operation, args.response_code, args.endpoint, args.method, args.class_name):
+        print(json.dumps(entry))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,114 @@
+import logging
 import re
+import sys
+import time
 
-from Environment import Environment, Type
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import lru_cache
+
+from Environment import Environment
+from Lexer import Hole, identifiers, skip_code, split_top_level, string_segments
+from metrics import METRICS
+
+
+logger = logging.getLogger(__name__)
+
+
+# A compiled expression: evaluates against an environment and returns the resolved value
+Compiled = Callable[[Environment], str]
+
+_CALL_PATTERN = re.compile(r'^([a-zA-Z_][a-zA-Z0-9_]*)\((.*)\)$', re.DOTALL)
+_MEMBER_ACCESS_PATTERN = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*(\.[a-zA-Z_][a-zA-Z0-9_]*)+$')
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    return value
+
+
+def _constant(value: str) -> Compiled:
+    return lambda environment: value
+
+
+def _formatted(value: Compiled, alignment: str | None, spec: str | None) -> Compiled:
+    """Apply the alignment and format of a hole like {id,5:D3}; D and X format integers, other formats keep the value."""
+    width = int(alignment) if alignment and alignment.lstrip("-").isdigit() else 0
+    kind, digits = (spec[:1], spec[1:]) if spec else ("", "")
+    precision = int(digits) if digits.isdigit() else 0
+
+    def formatted(environment: Environment) -> str:
+        result = _unquote(value(environment))
+        if kind and kind in "DdXx" and result.lstrip("-").isdigit():
+            number = int(result)
+            if kind in "Dd":
+                result = ("-" if number < 0 else "") + str(abs(number)).zfill(precision)
+            else:
+                result = format(number, "x" if kind == "x" else "X").zfill(precision)
+        return result.rjust(width) if width > 0 else result.ljust(-width)
+    return formatted
+
+
+class CallCache:
+    """
+    Bounded LRU of method call results keyed by (method, evaluated argument values),
+    with counters for hits, misses and evictions.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._results: OrderedDict[tuple, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> str | None:
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            if METRICS.enabled:
+                METRICS.count("call_cache_misses")
+            return None
+        self._results.move_to_end(key)
+        self.hits += 1
+        if METRICS.enabled:
+            METRICS.count("call_cache_hits")
+        return result
+
+    def put(self, key: tuple, result: str):
+        if self.maxsize <= 0:
+            return
+        self._results[key] = result
+        self._results.move_to_end(key)
+        self._evict()
+
+    def resize(self, maxsize: int):
+        self.maxsize = maxsize
+        self._evict()
+
+    def _evict(self):
+        while len(self._results) > max(self.maxsize, 0):
+            self._results.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._results), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self) -> int:
+        return len(self._results)
 
 
 class CSEvaluator:
+    # Results of calls to methods, see CSharpMethod.invoke
+    call_cache = CallCache()
+    # Incremented for every unresolved variable or call; results that saw one are not cached
+    unresolved_count = 0
+
     @staticmethod
     def evaluate(expression: str, environment: Environment) -> str:
         """Evaluate C# expressions and return the resolved value"""
@@ -13,136 +118,142 @@ class CSEvaluator:
         # b is stored as abcdefghi
         # ...
 
-        if not expression or not expression.strip():
+        if not expression:
             return ""
-        
+        if METRICS.enabled:
+            return CSEvaluator._evaluate_measured(expression, environment)
+        return CSEvaluator.compile(expression)(environment)
+
+    @staticmethod
+    def _evaluate_measured(expression: str, environment: Environment) -> str:
+        METRICS.count("evaluations")
+        started = time.perf_counter()
+        with METRICS.phase("evaluation"):
+            result = CSEvaluator.compile(expression)(environment)
+        METRICS.observe_expression(expression, time.perf_counter() - started)
+        return result
+
+    @staticmethod
+    def compile(expression: str) -> Compiled:
+        """
+        Compile an expression once into a closure over its parts; results are memoized by source text,
+        so evaluating the same initializer or method body again only runs the closure.
+        """
+        return _compile_cached(expression)
+
+    @staticmethod
+    def references(expression: str) -> frozenset[str]:
+        """
+        Names an expression refers to: identifiers in code and interpolation holes, not words inside string literals.
+        """
+        return _references_cached(expression)
+
+    @staticmethod
+    def _compile(expression: str) -> Compiled:
         expression = expression.strip()
-        
-        # Handle string interpolation: $"Hello {name}!"
-        if expression.startswith('$"') and expression.endswith('"'):
-            return CSEvaluator._resolve_string_interpolation(expression, environment)
-        
-        # Handle function/method call: Foo("bar")
-        func_call_match = re.match(r'^([a-zA-Z_][a-zA-Z0-9_]*)\((.*)\)$', expression)
-        if func_call_match:
+        if not expression:
+            return _constant("")
+
+        # Handle string literals of any kind and concatenations: "abc" + def, $"Hello {name}!", @"C:\dir"
+        segments = string_segments(expression)
+        if segments is not None:
+            return CSEvaluator._compile_segments(segments)
+
+        # Handle function/method call: Foo("bar"), but not Foo("a") == Bar("b")
+        func_call_match = _CALL_PATTERN.match(expression)
+        if func_call_match and skip_code(expression, func_call_match.end(1) + 1, ")") == len(expression):
             func_name = func_call_match.group(1)
-            arg_str = func_call_match.group(2)
-            args = CSEvaluator._parse_args(arg_str)
-            return CSEvaluator._call_method(func_name, args, environment)
+            args = CSEvaluator._parse_args(func_call_match.group(2))
+            arg_fns = [CSEvaluator.compile(arg) for arg in args]
+            return lambda environment: CSEvaluator._call_method(func_name, args, environment, arg_fns)
+
+        # Handle boolean literals
+        if expression.lower() in ['true', 'false']:
+            return _constant(expression.lower())
+
+        # null is a literal, not a name to look up
+        if expression == "null":
+            return _constant("null")
 
-        # Handle string concatenation: "abc" + "def" or a + "def"
-        if '+' in expression:
-            return CSEvaluator._resolve_string_concatenation(expression, environment)
-        
         # Handle simple variable reference: a
         if CSEvaluator._is_simple_identifier(expression):
-            return CSEvaluator._resolve_variable_reference(expression, environment)
-        
-        # Handle string literals: "Hello"
-        if expression.startswith('"') and expression.endswith('"'):
-            return expression
-        
+            name = sys.intern(expression)  # the environments intern the names they define
+            return lambda environment: CSEvaluator._resolve_variable_reference(name, environment)
+
+        # Handle member access: Paths.Users, resolvable when a symbol index is in scope
+        if _MEMBER_ACCESS_PATTERN.match(expression):
+            return lambda environment: CSEvaluator._resolve_member_access(expression, environment)
+
         # Handle numeric literals: 123
         if expression.isdigit():
-            return expression
-        
-        # Handle boolean literals
-        if expression.lower() in ['true', 'false']:
-            return expression.lower()
-        
-        return expression
-    
+            return _constant(expression)
+
+
+        return _constant(expression)
+
     @staticmethod
     def _parse_args(arg_str: str):
-        # This is a simple parser, does not handle nested commas or complex expressions
-        args = []
-        depth = 0
-        current = ''
-        for c in arg_str:
-            if c == ',' and depth == 0:
-                args.append(current.strip())
-                current = ''
-            else:
-                if c == '(':
-                    depth += 1
-                elif c == ')':
-                    depth -= 1
-                current += c
-        if current.strip():
-            args.append(current.strip())
-        return args
+        # Commas inside nested calls or string literals do not split arguments
+        if not arg_str.strip():
+            return []
+        return [arg for arg in split_top_level(arg_str, ",") if arg]
 
     @staticmethod
-    def _call_method(func_name: str, args, environment: Environment) -> str:
+    def _call_method(func_name: str, args, environment: Environment, arg_fns: list[Compiled] | None = None) -> str:
         type_obj = environment.get(func_name)
         if type_obj is not None and hasattr(type_obj, "cstype") and type_obj.cstype == "method":
             method_obj = type_obj.value
-            # Bind arguments to parameters
-            param_names = []
-            for child in method_obj.node.children:
-                if child.type == "parameter_list":
-                    for param in child.children:
-                        if param.type == "parameter":
-                            for param_child in param.children:
-                                if param_child.type == "identifier" and param_child.text:
-                                    param_names.append(param_child.text.decode())
-            # Create a new environment for the call
-            call_env = Environment(method_obj.environment.class_ref.environment)
-            for pname, pval in zip(param_names, args):
-                # Evaluate argument in the calling environment
-                arg_val = CSEvaluator.evaluate(pval, environment)
-                call_env.define(pname, Type(arg_val, "string"))
-            # Evaluate the method's body/expression in the new environment
-            # Find the arrow_expression_clause
-            for child in method_obj.node.children:
-                if child.type == "arrow_expression_clause":
-                    expr = method_obj.source[child.start_byte:child.end_byte].decode().replace("=>", "").strip()
-                    return CSEvaluator.evaluate(expr, call_env)
-            # If block, you could extend to support block bodies
-        print(f"UNRESOLVED FUNC CALL: {func_name}({', '.join(args)})")
+            if arg_fns is None:
+                arg_fns = [CSEvaluator.compile(arg) for arg in args]
+            # Evaluate arguments in the calling environment, the body in the method's (cached per argument values)
+            result = method_obj.invoke([arg_fn(environment) for arg_fn in arg_fns[:len(method_obj.parameters)]])
+            if result is not None:
+                return result
+        CSEvaluator.unresolved_count += 1
+        if METRICS.enabled:
+            METRICS.count("unresolved_calls")
+        logger.debug("UNRESOLVED FUNC CALL: %s(%s)", func_name, ", ".join(args))
         return f'"{func_name}({", ".join(args)})"'
-    
+
     @staticmethod
-    def _resolve_string_interpolation(expression: str, environment: Environment) -> str:
-        """Resolve string interpolation like $"Hello {name}!" """
-        # Remove the $ and outer quotes
-        content = expression[2:-1]
-        
-        # Find all interpolation expressions {variable}
-        pattern = r'\{([^}]+)\}'
-        
-        def replace_interpolation(match):
-            expr = match.group(1).strip()
-            value = CSEvaluator.evaluate(expr, environment)
-            if value.startswith('"') and value.endswith('"'):
-                value = value[1:-1]
-            return value
-        
-        result = re.sub(pattern, replace_interpolation, content)
-        return f'"{result}"'
-    
+    def _compile_segments(segments: list[str | Hole]) -> Compiled:
+        """Compile the literal text and holes of a string expression; holes that are constants are folded into the text"""
+        compiled: list[str | Compiled] = []
+        pending = segments[::-1]
+        while pending:
+            segment = pending.pop()
+            if isinstance(segment, str):
+                compiled.append(segment)
+            elif segment.alignment is not None or segment.format is not None:
+                compiled.append(_formatted(CSEvaluator.compile(segment.code), segment.alignment, segment.format))
+            elif segment.code.isdigit():
+                compiled.append(segment.code)
+            elif (nested := string_segments(segment.code)) is not None:
+                pending.extend(nested[::-1])  # a literal or concatenation in a hole, e.g. $"{"a" + b}"
+            else:
+                compiled.append(CSEvaluator.compile(segment.code))
+        return CSEvaluator._join_segments(compiled)
+
     @staticmethod
-    def _resolve_string_concatenation(expression: str, environment: Environment) -> str:
-        """Resolve string concatenation like "abc" + "def" or a + "def" """
-        parts = expression.split('+')
-        resolved_parts = []
-        
-        for part in parts:
-            part = part.strip()
-            if not part:
-                continue
-            
-            # Resolve each part
-            resolved_part = CSEvaluator.evaluate(part, environment)
-            # Remove quotes if it's a string literal
-            if resolved_part.startswith('"') and resolved_part.endswith('"'):
-                resolved_part = resolved_part[1:-1]
-            resolved_parts.append(resolved_part)
-        
-        # Join all parts and wrap in quotes
-        result = ''.join(resolved_parts)
-        return f'"{result}"'
-    
+    def _join_segments(segments: list[str | Compiled]) -> Compiled:
+        """Fold adjacent literal segments, then build a closure that joins them with the unquoted values of the others"""
+        folded: list[str | Compiled] = []
+        for segment in segments:
+            if isinstance(segment, str) and folded and isinstance(folded[-1], str):
+                folded[-1] += segment
+            elif segment != "":
+                folded.append(segment)
+
+        if not folded:
+            return _constant('""')
+        if all(isinstance(segment, str) for segment in folded):
+            return _constant(f'"{"".join(folded)}"')
+
+        def join(environment: Environment) -> str:
+            result = "".join(segment if isinstance(segment, str) else _unquote(segment(environment)) for segment in folded)
+            return f'"{result}"'
+        return join
+
     @staticmethod
     def _resolve_variable_reference(var_name: str, environment: Environment) -> str:
         """Resolve a variable reference to its value"""
@@ -153,9 +264,20 @@ class CSEvaluator:
                 return f'"{var_name}"'
             if isinstance(type_obj.value, str):
                 return type_obj.value
-        print(f'\n -- -- -- -- \nUNRESOLVED VAR"{var_name}"\n -- -- -- -- \n')
+        CSEvaluator.unresolved_count += 1
+        if METRICS.enabled:
+            METRICS.count("unresolved_variables")
+        logger.debug("UNRESOLVED VAR: %s", var_name)
         return f'"{var_name}"'  # Return as string if not found 
     
+    @staticmethod
+    def _resolve_member_access(expression: str, environment: Environment) -> str:
+        """Resolve A.B.C by its dotted name; anything unknown (e.g. a property of a local) stays as written"""
+        type_obj = environment.get(expression)
+        if type_obj is not None and isinstance(type_obj.value, str) and type_obj.cstype != "method":
+            return type_obj.value
+        return expression
+
     @staticmethod
     def _is_simple_identifier(expression: str) -> bool:
         """Check if expression is a simple identifier (variable name)"""
@@ -189,3 +311,15 @@ class CSEvaluator:
             return "string"
         
         return "unknown"
+
+
+@lru_cache(maxsize=65536)
+def _compile_cached(expression: str) -> Compiled:
+    return CSEvaluator._compile(expression)
+
+
+@lru_cache(maxsize=65536)
+def _references_cached(expression: str) -> frozenset[str]:
+    found: set[str] = set()
+    identifiers(expression, found)
+    return frozenset(found)
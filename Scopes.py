@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+# Declarations of one file by fully qualified name: namespaces, nested types, enum members and using directives
+from collections.abc import Callable, Iterator
+
+from tree_sitter import Node
+
+from Environment import Environment, Type
+
+
+TYPE_KINDS = {"class_declaration": "class", "struct_declaration": "struct", "record_declaration": "record",
+              "interface_declaration": "interface", "enum_declaration": "enum"}
+NAMESPACE_KINDS = {"namespace_declaration", "file_scoped_namespace_declaration"}
+# Types extracted as a CSharpClass (when they have a body)
+CLASS_KINDS = {"class", "struct", "record"}
+
+
+def qualify(scope: str, name: str) -> str:
+    return f"{scope}.{name}" if scope else name
+
+
+class PrefixIndex:
+    """
+    Dotted names as a tree of their parts. The names directly under a prefix are one dict lookup,
+    and everything under it is a walk of that subtree only.
+    """
+
+    def __init__(self):
+        self.children: dict[str, dict[str, None]] = {}  # prefix -> names one part longer, in insertion order
+        self.names: set[str] = set()
+
+    def add(self, name: str):
+        self.names.add(name)
+        parent = ""
+        for part in name.split("."):
+            prefix = qualify(parent, part)
+            self.children.setdefault(parent, {})[prefix] = None
+            parent = prefix
+
+    def remove(self, name: str):
+        self.names.discard(name)
+        # Drop the name and the prefixes nothing is left under
+        while name and name not in self.names and not self.children.get(name):
+            self.children.pop(name, None)
+            parent = name.rpartition(".")[0]
+            self.children[parent].pop(name, None)
+            name = parent
+
+    def children_of(self, prefix: str) -> list[str]:
+        """The names and prefixes one part longer than prefix, e.g. Tests.API.AdminInfo.* ("" for the top level)."""
+        return list(self.children.get(prefix, ()))
+
+    def under(self, prefix: str) -> Iterator[str]:
+        """Every name below prefix, depth first in insertion order."""
+        stack = self.children_of(prefix)[::-1]
+        while stack:
+            name = stack.pop()
+            if name in self.names:
+                yield name
+            stack.extend(self.children_of(name)[::-1])
+
+
+class Symbol:
+    """
+    A namespace, type or enum member of the file. Types extracted as a CSharpClass keep their node
+    until it is built and then the class as value; an enum member has its Type as value.
+    """
+    __slots__ = ("name", "kind", "container", "node", "value", "building")
+
+    def __init__(self, name: str, kind: str, container: str, node: Node | None = None, value=None):
+        self.name = name  # fully qualified
+        self.kind = kind
+        self.container = container  # qualified name of the enclosing namespace or type, "" at the top level
+        self.node = node
+        self.value = value
+        self.building = False
+
+    def __repr__(self) -> str:
+        return f"Symbol({self.name!r}, {self.kind!r})"
+
+
+class SymbolTable:
+    """
+    The declarations of a file keyed by fully qualified name, with a prefix index over the names, the
+    namespaces imported by using directives and the using aliases of each scope (a namespace or "").
+
+    resolve() follows C#: from the scope a name is written in outwards, trying the enclosing types and
+    namespaces, then the aliases and imported namespaces of each. Type-relative names (Inner.Value written
+    outside Outer) fall back to the type path suffixes, like SymbolIndex does across files.
+    """
+
+    def __init__(self, build: Callable[[Symbol], object] | None = None):
+        self.symbols: dict[str, Symbol] = {}  # in source order
+        self.prefixes = PrefixIndex()
+        self.suffixes: dict[str, str] = {}  # Inner, Outer.Inner, ... -> the first type declared with that path
+        self.imports: dict[str, list[str]] = {}
+        self.aliases: dict[str, dict[str, str]] = {}
+        self.namespaces: list[str] = [""]
+        self.build = build  # builds the CSharpClass of a symbol on first use
+
+    def add(self, symbol: Symbol, type_path: list[str] | None = None) -> Symbol:
+        self.symbols[symbol.name] = symbol
+        self.prefixes.add(symbol.name)
+        if symbol.kind == "namespace" and symbol.name not in self.namespaces:
+            self.namespaces.append(symbol.name)
+        for start in range(len(type_path or ())):
+            self.suffixes.setdefault(".".join(type_path[start:]), symbol.name)
+        return symbol
+
+    def add_using(self, scope: str, name: str, alias: str | None = None):
+        if alias is not None:
+            self.aliases.setdefault(scope, {})[alias] = name
+        else:
+            self.imports.setdefault(scope, []).append(name)
+
+    def get(self, name: str) -> Symbol | None:
+        return self.symbols.get(name)
+
+    def members(self, prefix: str) -> list[Symbol]:
+        """The symbols declared directly in a namespace or type, by qualified name."""
+        return [self.symbols[name] for name in self.prefixes.children_of(prefix) if name in self.symbols]
+
+    def under(self, prefix: str) -> Iterator[Symbol]:
+        for name in self.prefixes.under(prefix):
+            yield self.symbols[name]
+
+    def types(self) -> Iterator[Symbol]:
+        for symbol in self.symbols.values():
+            if symbol.kind in TYPE_KINDS.values():
+                yield symbol
+
+    def candidates(self, name: str, scope: str = "") -> Iterator[str]:
+        """The qualified names name may stand for when written in scope, in C# lookup order."""
+        first, _, rest = name.partition(".")
+        while True:
+            yield qualify(scope, name)
+            alias = self.aliases.get(scope, {}).get(first)
+            if alias is not None:
+                yield qualify(alias, rest) if rest else alias
+            for namespace in self.imports.get(scope, ()):
+                yield qualify(namespace, name)
+            if not scope:
+                return
+            scope = scope.rpartition(".")[0]
+
+    def resolve(self, name: str, scope: str = "") -> Symbol | None:
+        for candidate in self.candidates(name, scope):
+            symbol = self.symbols.get(candidate)
+            if symbol is not None:
+                return symbol
+        qualified = self.suffixes.get(name)
+        return self.symbols[qualified] if qualified is not None else None
+
+    def value(self, name: str) -> Type | None:
+        """
+        The value of a member written Type.Member in the file (a field, property or const of a class, or an
+        enum member), looked up from each namespace of the file; None if the file does not declare it.
+        """
+        type_name, _, member = name.rpartition(".")
+        for scope in self.namespaces:
+            symbol = self.resolve(type_name, scope)
+            if symbol is None:
+                continue
+            found = self.symbols.get(f"{symbol.name}.{member}")
+            if found is not None and isinstance(found.value, Type):
+                return found.value
+            if symbol.kind in CLASS_KINDS and symbol.value is None and symbol.node is not None and self.build is not None:
+                self.build(symbol)
+            environment = getattr(symbol.value, "environment", None)
+            if environment is not None:
+                found = environment.values.get(member)
+                if found is not None and isinstance(found.value, str) and found.cstype != "method":
+                    return found
+            return None
+        return None
+
+    def qualified_candidates(self, name: str) -> Iterator[str]:
+        """Names that name may stand for through the using directives of the file, for lookups in other files."""
+        type_name, _, member = name.rpartition(".")
+        seen = {name}
+        for scope in self.namespaces:
+            for candidate in self.candidates(type_name, scope):
+                qualified = qualify(candidate, member)
+                if qualified not in seen:
+                    seen.add(qualified)
+                    yield qualified
+
+
+class FileEnvironment(Environment):
+    """
+    The file-level environment: Type.Member names (Paths.Admin, Outer.Inner.Value, Alias.Member) are looked up
+    in the file's SymbolTable first, then under the names the using directives make of them, in the enclosing
+    environment (e.g. a symbol index), and last as written.
+    """
+    __slots__ = ("table",)
+    computed = True
+
+    def __init__(self, table: SymbolTable, enclosing: Environment | None = None):
+        super().__init__(enclosing)
+        self.table = table
+
+    def get(self, name: str) -> Type | None:
+        found = self.values.get(name)
+        if found is not None or "." not in name:
+            return found if found is not None else super().get(name)
+        found = self.table.value(name)
+        if found is None and self.enclosing is not None:
+            for qualified in self.table.qualified_candidates(name):
+                found = self.enclosing.get(qualified)
+                if found is not None:
+                    break
+        return found if found is not None else super().get(name)
@@ -0,0 +1,400 @@
+from __future__ import annotations
+
+# Repo-wide index of type and member declarations, resolved lazily
+import hashlib
+import os
+import re
+
+from tree_sitter import Node
+
+from cache import ExtractionCache
+from Environment import Environment, Type
+from parser import ParseLimitError, ParseLimits, Patterns, node_text, parse_tree, source_view
+from Resolver import CSEvaluator
+from Scopes import NAMESPACE_KINDS, TYPE_KINDS, PrefixIndex
+
+
+_IDENTIFIER = re.compile(rb"[A-Za-z_][A-Za-z0-9_]*")
+
+# Keys the symbols of a file in an ExtractionCache, next to the records of the same content
+_SYMBOLS_FINGERPRINT = "symbols"
+
+
+class Declaration:
+    """
+    One declared symbol. Members keep their initializer text; the value is evaluated on first lookup.
+    """
+
+    def __init__(self, name: str, kind: str, file: str, initializer: str | None = None, container: str | None = None):
+        self.name = name  # fully qualified
+        self.kind = kind
+        self.file = file
+        self.initializer = initializer
+        self.container = container  # fully qualified name of the declaring type
+        self.value: Type | None = None
+        self._resolving = False
+
+    def __repr__(self) -> str:
+        return f"Declaration({self.name!r}, {self.kind!r})"
+
+
+class SymbolIndex:
+    """
+    Maps fully qualified names (and type-relative names such as Paths.None) of types, fields, properties,
+    consts and enum members across all files to their declarations, plus each type's base type.
+
+    Pass index.environment as the globals of a CSharpFile: names the globals do not define are then
+    looked up here, and classes can see the members they inherit from base classes in other files.
+    """
+    _query = Patterns("""
+    (namespace_declaration name: (_) @name) @namespace
+    (file_scoped_namespace_declaration name: (_) @name) @namespace
+    (class_declaration name: (identifier) @name) @type
+    (struct_declaration name: (identifier) @name) @type
+    (record_declaration name: (identifier) @name) @type
+    (interface_declaration name: (identifier) @name) @type
+    (enum_declaration name: (identifier) @name) @type
+    (enum_member_declaration name: (identifier) @name value: (_)? @value) @enum_member
+    (field_declaration
+      (variable_declaration (variable_declarator name: (identifier) @name "=" (_) @value))) @field
+    (property_declaration name: (identifier) @name value: (arrow_expression_clause (_) @value)) @property
+    (property_declaration name: (identifier) @name (accessor_list) value: (_) @value) @property
+    """, group="symbols")
+
+    def __init__(self, globals: Environment | None = None):
+        self.declarations: dict[str, Declaration] = {}
+        self.by_name: dict[str, list[Declaration]] = {}  # type-relative names -> declarations
+        self.bases: dict[str, str] = {}  # type -> name of its base type, as written
+        self.prefixes = PrefixIndex()  # the qualified names, for listing everything under a namespace or type
+        self.files: set[str] = set()
+        self.references: dict[str, frozenset[str]] = {}  # file -> every identifier in it, for dependents()
+        self.environment = IndexEnvironment(self, globals)
+
+    @classmethod
+    def build(cls, paths: list[str], globals: Environment | None = None, limits: ParseLimits | None = None,
+              cache: ExtractionCache | None = None) -> SymbolIndex:
+        """
+        Index every file in one pass (parse and query only, nothing is evaluated).
+        Files over the size or parse time limits are left out. With a cache, the symbols of a file
+        whose content was indexed before are read from it instead of parsing the file again.
+        """
+        index = cls(globals)
+        for path in paths:
+            try:
+                with open(path, "rb") as file:
+                    if limits is not None:
+                        limits.check_size(os.fstat(file.fileno()).st_size)
+                    source = file.read()
+                key = cache.key(source, _SYMBOLS_FINGERPRINT) if cache is not None else None
+                symbols = cache.get(key, counted=False) if key is not None else None
+                if symbols is None:
+                    symbols = cls.file_symbols(source, limits.parse_timeout if limits is not None else None)
+                    if key is not None:
+                        cache.put(key, symbols)
+                index.add_symbols(path, symbols)
+            except ParseLimitError:
+                continue
+        return index
+
+    def bind(self, globals: Environment | None):
+        """Use other globals (e.g. in a worker process) and forget values resolved against the old ones."""
+        self.environment = IndexEnvironment(self, globals)
+        for declaration in self.declarations.values():
+            declaration.value = None
+
+    def add_file(self, path: str, source: bytes, timeout: float | None = None):
+        self.add_symbols(path, self.file_symbols(source, timeout))
+
+    @classmethod
+    def file_symbols(cls, source: bytes, timeout: float | None = None) -> dict:
+        """
+        The declarations, base types and identifiers of one file as plain data, which add_symbols() indexes.
+        Kept by content (in an ExtractionCache or the database), it spares parsing an unchanged file again.
+        """
+        source = source_view(source)
+        tree = parse_tree(source, timeout)
+        declarations = []  # [qualified name, kind, initializer, container, type path]
+        bases = {}
+        file_namespace = ""
+        scopes: dict[int, tuple[str, list[str]]] = {}  # type node id -> (qualified name, type path)
+
+        for _, captures in cls._query.matches(tree.root_node):
+            name = captures["name"][0]
+            name_text = node_text(source, name)
+
+            if "namespace" in captures:
+                if captures["namespace"][0].type == "file_scoped_namespace_declaration":
+                    file_namespace = name_text
+                continue
+
+            if "type" in captures:
+                node = captures["type"][0]
+                namespace, type_path = cls._scope(node, source, file_namespace, scopes)
+                type_path = type_path + [name_text]
+                qualified = ".".join(filter(None, [namespace] + type_path))
+                scopes[node.id] = (qualified, type_path)
+                declarations.append([qualified, TYPE_KINDS[node.type], None, None, type_path])
+                base = cls._base_name(node, source)
+                if base:
+                    bases[qualified] = base
+                continue
+
+            member = (captures.get("enum_member") or captures.get("field") or captures["property"])[0]
+            container = cls._container(member)
+            if container is None or container.id not in scopes:
+                continue
+            container_name, type_path = scopes[container.id]
+            if "enum_member" in captures:
+                kind = "enum_member"
+                initializer = f'"{name_text}"'
+            else:
+                kind = "field" if "field" in captures else "property"
+                initializer = None
+            if "value" in captures:
+                value = captures["value"][0]
+                initializer = node_text(source, value)
+            declarations.append([f"{container_name}.{name_text}", kind, initializer, container_name, type_path + [name_text]])
+        return {
+            "declarations": declarations,
+            "bases": bases,
+            # Comments and strings included: a file is at worst re-extracted when it did not need to be
+            "references": sorted({str(name, "ascii") for name in _IDENTIFIER.findall(source)}),
+        }
+
+    def add_symbols(self, path: str, symbols: dict):
+        """Index the symbols of a file, as file_symbols() returned them."""
+        self.files.add(path)
+        self.references[path] = frozenset(symbols["references"])
+        for name, kind, initializer, container, type_path in symbols["declarations"]:
+            self._add(Declaration(name, kind, path, initializer, container), type_path)
+        self.bases.update(symbols["bases"])
+
+    def remove_file(self, path: str):
+        """Forget the declarations of a file, e.g. before adding it again after an edit."""
+        if path not in self.files:
+            return
+        self.files.discard(path)
+        self.references.pop(path, None)
+        removed = {name for name, declaration in self.declarations.items() if declaration.file == path}
+        for name in removed:
+            del self.declarations[name]
+            self.bases.pop(name, None)
+            self.prefixes.remove(name)
+        for key in list(self.by_name):
+            kept = [declaration for declaration in self.by_name[key] if declaration.file != path]
+            if kept:
+                self.by_name[key] = kept
+            else:
+                del self.by_name[key]
+        # A name also declared in another file (e.g. a partial class) falls back to that declaration
+        for declarations in self.by_name.values():
+            for declaration in declarations:
+                if declaration.name in removed and declaration.name not in self.declarations:
+                    self.declarations[declaration.name] = declaration
+                    self.prefixes.add(declaration.name)
+        # Values resolved through the removed declarations are stale
+        for declaration in self.declarations.values():
+            declaration.value = None
+
+    def _add(self, declaration: Declaration, type_path: list[str]):
+        self.declarations[declaration.name] = declaration
+        self.prefixes.add(declaration.name)
+        # Outer.Inner.Member can also be written Inner.Member
+        for start in range(len(type_path)):
+            self.by_name.setdefault(".".join(type_path[start:]), []).append(declaration)
+
+    @staticmethod
+    def _container(node: Node) -> Node | None:
+        node = node.parent
+        while node is not None and node.type not in TYPE_KINDS:
+            node = node.parent
+        return node
+
+    @classmethod
+    def _scope(cls, node: Node, source: memoryview, file_namespace: str,
+               scopes: dict[int, tuple[str, list[str]]]) -> tuple[str, list[str]]:
+        """Namespace and enclosing type names of a type declaration."""
+        container = cls._container(node)
+        if container is not None and container.id in scopes:
+            qualified, type_path = scopes[container.id]
+            return qualified[:-len(".".join(type_path))].rstrip("."), type_path
+        namespaces = []
+        parent = node.parent
+        while parent is not None:
+            if parent.type in NAMESPACE_KINDS:
+                name = parent.child_by_field_name("name")
+                namespaces.append(node_text(source, name))
+            parent = parent.parent
+        namespaces.append(file_namespace)
+        return ".".join(filter(None, reversed(namespaces))), []
+
+    @staticmethod
+    def _base_name(node: Node, source: memoryview) -> str:
+        for child in node.children:
+            if child.type == "base_list":
+                for base in child.named_children:
+                    if base.type == "generic_name":
+                        base = base.named_children[0]
+                    return node_text(source, base)
+        return ""
+
+    def lookup(self, name: str) -> Declaration | None:
+        declaration = self.declarations.get(name)
+        if declaration is None:
+            candidates = self.by_name.get(name)
+            if candidates:
+                declaration = candidates[0]
+        return declaration
+
+    def under(self, prefix: str) -> list[Declaration]:
+        """Every declaration below a namespace or type, e.g. Tests.API.AdminInfo, without scanning the others."""
+        return [self.declarations[name] for name in self.prefixes.under(prefix)]
+
+    def resolve(self, name: str) -> Type | None:
+        """The value of a field, property, const or enum member by qualified or type-relative name."""
+        declaration = self.lookup(name)
+        if declaration is None:
+            return None
+        return self._value(declaration)
+
+    def member(self, type_name: str, member_name: str) -> Type | None:
+        """The value of a member declared by a type or inherited from its base types."""
+        seen = set()
+        declaration = self.lookup(type_name)
+        while declaration is not None and declaration.name not in seen:
+            seen.add(declaration.name)
+            found = self.declarations.get(f"{declaration.name}.{member_name}")
+            if found is not None:
+                return self._value(found)
+            base = self.bases.get(declaration.name)
+            declaration = self.lookup(base) if base else None
+        return None
+
+    def _value(self, declaration: Declaration) -> Type | None:
+        if declaration.initializer is None or declaration._resolving:
+            return None
+        if declaration.value is None:
+            declaration._resolving = True
+            try:
+                # Sibling members of the declaring type are in scope of the initializer
+                scope = MemberEnvironment(self, declaration.container, self.environment)
+                value = CSEvaluator.evaluate(declaration.initializer, scope)
+                declaration.value = Type(value, CSEvaluator._determine_type(value))
+            finally:
+                declaration._resolving = False
+        return declaration.value
+
+    def fingerprint(self) -> str:
+        """Hash of every declaration and base type, e.g. to key cached results that used this index."""
+        digest = hashlib.sha256()
+        for name in sorted(self.declarations):
+            declaration = self.declarations[name]
+            digest.update(f"{name}:{declaration.kind}={declaration.initializer}\n".encode())
+        for name in sorted(self.bases):
+            digest.update(f"{name}<{self.bases[name]}\n".encode())
+        return digest.hexdigest()[:16]
+
+
+    def digests(self) -> dict[str, tuple[str, str]]:
+        """The kind and a hash of the initializer (and base type) of each declaration, to compare with a later state."""
+        return {name: (declaration.kind, hashlib.sha256(f"{declaration.initializer}<{self.bases.get(name, '')}".encode()).hexdigest()[:16])
+                for name, declaration in self.declarations.items()}
+
+    @staticmethod
+    def changes(before: dict[str, tuple[str, str]], after: dict[str, tuple[str, str]]) -> dict[str, str]:
+        """The declarations added, removed or changed between two digests(), with their kind."""
+        changed = {name: entry[0] for name, entry in before.items() if after.get(name) != entry}
+        changed.update((name, entry[0]) for name, entry in after.items() if before.get(name) != entry)
+        return changed
+
+    def dependents(self, changed: dict[str, str]) -> set[str]:
+        """
+        The files that may resolve a name through one of the changed declarations (see changes()), i.e. whose
+        records may change although their content did not. A member counts as used by a file that has its
+        name and the name of its type or of a type deriving from it, or only its name when the file does not
+        declare a member of that name itself (a bare name is looked up in the index last). A type counts as
+        used by a file that has its name or the name of a type deriving from it. Declarations whose
+        initializers use a changed one count as changed too.
+        """
+        declared: dict[str, set[str]] = {}  # file -> names of the members it declares
+        for name, declaration in self.declarations.items():
+            if declaration.container is not None:
+                declared.setdefault(declaration.file, set()).add(name.rpartition(".")[2])
+        types: set[str] = set()  # names of changed types and the types deriving from them
+        members: dict[str, set[str]] = {}  # name of a changed member -> names of its types and the types deriving from them
+        # Sibling and inherited members are in scope of an initializer without their type's name
+        initializers = [(name, declaration.kind, declared[declaration.file],
+                         {str(identifier, "ascii") for identifier in _IDENTIFIER.findall(declaration.initializer.encode())}
+                         | {declaration.container.rpartition(".")[2]})
+                        for name, declaration in self.declarations.items()
+                        if declaration.initializer is not None and name not in changed]
+        pending = changed
+        while pending:
+            for name, kind in pending.items():
+                owner, _, simple = name.rpartition(".")
+                if kind in TYPE_KINDS.values():
+                    types |= self._derived(simple)
+                else:
+                    members.setdefault(simple, set()).update(self._derived(owner.rpartition(".")[2]))
+            pending = {name: kind for name, kind, own, used in initializers if self._uses(used, own, types, members)}
+            initializers = [entry for entry in initializers if entry[0] not in pending]
+        return {path for path, used in self.references.items() if self._uses(used, declared.get(path, set()), types, members)}
+
+    @staticmethod
+    def _uses(used: set[str] | frozenset[str], own: set[str], types: set[str], members: dict[str, set[str]]) -> bool:
+        if not types.isdisjoint(used):
+            return True
+        return any(member in used and (member not in own or not owners.isdisjoint(used)) for member, owners in members.items())
+
+    def _derived(self, type_name: str) -> set[str]:
+        """The simple name of a type and of every type deriving from it, directly or not, by base names as written."""
+        derived = {type_name}
+        grown = True
+        while grown:
+            grown = False
+            for name, base in self.bases.items():
+                simple = name.rpartition(".")[2]
+                if simple not in derived and base.rpartition(".")[2] in derived:
+                    derived.add(simple)
+                    grown = True
+        return derived
+
+
+class IndexEnvironment(Environment):
+    """
+    Outermost environment: names the globals it encloses do not define are looked up in a SymbolIndex.
+    """
+    __slots__ = ("index",)
+    computed = True
+
+    def __init__(self, index: SymbolIndex, enclosing: Environment | None = None):
+        super().__init__(enclosing)
+        self.index = index
+
+    def get(self, name: str) -> Type | None:
+        found = super().get(name)
+        if found is None:
+            found = self.index.resolve(name)
+        return found
+
+    def inherited_scope(self, base_name: str, enclosing: Environment) -> Environment | None:
+        return MemberEnvironment(self.index, base_name, enclosing)
+
+
+class MemberEnvironment(Environment):
+    """
+    The members of a type and of the types it derives from, looked up in a SymbolIndex before the enclosing environment.
+    """
+    __slots__ = ("index", "type_name")
+    computed = True
+
+    def __init__(self, index: SymbolIndex, type_name: str | None, enclosing: Environment | None = None):
+        super().__init__(enclosing)
+        self.index = index
+        self.type_name = type_name
+
+    def get(self, name: str) -> Type | None:
+        found = self.index.member(self.type_name, name) if self.type_name else None
+        if found is None:
+            found = super().get(name)
+        return found
@@ -0,0 +1,9 @@
+from __future__ import annotations
+
+# Source text of tree-sitter nodes, shared by the parser and the modules it imports
+from tree_sitter import Node
+
+
+def node_text(source: memoryview, node: Node) -> str:
+    """Decode the source text of a node; slicing the memoryview does not copy the bytes first."""
+    return str(source[node.start_byte:node.end_byte], "utf-8", "replace")
@@ -0,0 +1,34 @@
+"""
+Command line entry point: `python -m parsing <command> ...` from the parent directory,
+or `python <path to this repo> <command> ...`.
+"""
+import os
+import sys
+
+# The modules in this repo import each other flat (`from parser import ...`)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "scan": "scanner",
+    "query": "Metadata",
+    "export": "exporter",
+    "bench": "benchmark",
+    "serve": "daemon",
+    "ask": "daemon:ask",
+    "stats": "store",
+    "db": "database",
+    "diff": "gitdiff",  # module:function when the command is not the module's main()
+}
+
+
+def main(argv: list[str]) -> int:
+    if not argv or argv[0] not in COMMANDS:
+        print(f"usage: parsing {{{','.join(COMMANDS)}}} ...", file=sys.stderr)
+        return 2
+    module_name, _, function = COMMANDS[argv[0]].partition(":")
+    module = __import__(module_name)
+    return getattr(module, function or "main")(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+# Generate synthetic test suites shaped like atest.cs / to_parse.cs and measure extraction speed and memory
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from importlib import metadata
+
+from helper import create_globals, globals
+from metrics import METRICS
+from parser import CSharpFile
+from Resolver import CSEvaluator
+
+
+FILES_PER_DIRECTORY = 1000
+DEFAULT_TOLERANCE = 0.10  # relative change tolerated before a metric counts as a regression
+STARTUP_RUNS = 5
+
+# Run in a fresh interpreter: import, load the globals and extract the endpoints of the first method of one file
+_STARTUP_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+from helper import create_globals, globals
+from parser import CSharpFile
+with open(sys.argv[1], "rb") as file:
+    source = file.read()
+method = next(next(CSharpFile(source, create_globals(globals)).get_classes()).get_methods())
+method.endpoints()
+print(time.perf_counter() - started)
+"""
+
+_AREAS = ["Admin", "Share", "Recipients", "Download", "Reports", "User", "AuditLog", "Pricing"]
+_RESOURCES = ["share", "recipients", "external/pricing", "preferences", "blacklist-organizations", "signed-key"]
+_OPERATIONS = [("Get", 200), ("Post", 200), ("Post", 201), ("Put", 204), ("Delete", 204), ("Post", 400)]
+_TOKENS = ["TokenAdminAPI", "TokenBasicUserAPI", "AnyTierUserAPI", "TokenEnterpriseAPI"]
+_GLOBALS = ["GlobalLabShare", "DownloadAPI", "ShareAPI", "RecipientsAPI", "ReportsAPI"]
+
+
+def generate_file(rng: random.Random, number: int) -> str:
+    """One test class: attribute lists, interpolated endpoint properties, helper methods and [Test] methods."""
+    area = rng.choice(_AREAS)
+    resource_path = rng.choice(_RESOURCES)
+    class_name = f"{area}_{resource_path.replace('/', '_').replace('-', '_').title()}_{number}"
+    lines = [
+        "using TransPerfect.Automation.Framework.Swagger;",
+        "using Microsoft.OpenApi.Models;",
+        f"namespace Tests.API.{area};",
+        "",
+        "[Parallelizable(ParallelScope.All)]",
+        '[ReadFrom(',
+        '    "DataProviders/{env}env.json",',
+        '    "DataProviders/{env}{browser}/users.json"',
+        ')]',
+        f"public sealed class {class_name} : APITest",
+        "{",
+        f'    private string Endpoint => $"{{{rng.choice(_GLOBALS)}}}/gl-share/api/{area}/{resource_path}";',
+        f'    private string APIVersion = "?api-version={rng.randint(1, 3)}.0";',
+        '    private string EndpointWithId(string id) => $"{Endpoint}/{id}";',
+        '    private string VersionedEndpoint => Endpoint + APIVersion;',
+        "",
+    ]
+    for test in range(rng.randint(2, 8)):
+        operation, code = rng.choice(_OPERATIONS)
+        tokens = rng.sample(_TOKENS, 2)
+        lines += [
+            "    [Test]",
+            f"    [Data.SetUp(Tokens.{tokens[0]}, Tokens.{tokens[1]})]",
+            f"    [Recycle(Recycled.{tokens[0]})]",
+            f"    [Swagger(Path = Paths.None, Operation = OperationType.{operation}, ResponseCode = {code})]",
+            f"    public void {operation.upper()}_{class_name}_{code}_{number * 100 + test}()",
+            "    {",
+            f"        var token = Get<Token>(Tokens.{tokens[0]});",
+            f'        string suffix = "item{test}";',
+            '        string target = $"{Endpoint}/{suffix}";',
+            "        var request = new Request()",
+            "        {",
+            f"            Id = {rng.randint(1, 10000)},",
+            "            Enabled = true,",
+            "        };",
+        ]
+        if rng.random() < 0.4:
+            lines += [
+                "        string LocalPath(string part) => $\"{Endpoint}/{part}\";",
+                f'        var local = LocalPath("{rng.choice(_RESOURCES)}");',
+            ]
+        target = rng.choice(["target", "Endpoint", "VersionedEndpoint", f'EndpointWithId("{rng.randint(1, 99)}")'])
+        lines += [
+            "",
+            "        Send(",
+            f"            {operation}(request).To({target})",
+            "            with",
+            "            { Authorization = Bearer(token.AccessToken) }",
+            "        );",
+            "",
+            f"        Verify(Response.StatusCode).Is({code});",
+            "    }",
+            "",
+        ]
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(directory: str, files: int, seed: int = 0) -> list[str]:
+    """
+    Write a reproducible corpus of files (same seed and size, same files), FILES_PER_DIRECTORY per subdirectory.
+    An existing corpus with the same parameters is reused.
+    """
+    marker = os.path.join(directory, "corpus.json")
+    params = {"files": files, "seed": seed}
+    paths = [os.path.join(directory, f"{n // FILES_PER_DIRECTORY:03d}", f"Test{n:06d}.cs") for n in range(files)]
+    try:
+        with open(marker, encoding="utf-8") as file:
+            if json.load(file) == params:
+                return paths
+    except (OSError, ValueError):
+        pass
+
+    rng = random.Random(seed)
+    for number, path in enumerate(paths):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(generate_file(rng, number))
+    with open(marker, "w", encoding="utf-8") as file:
+        json.dump(params, file)
+    return paths
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(paths: list[str], repeat: int = 3) -> dict:
+    """Build a CSharpFile for every path, repeat times; reports the fastest run."""
+    environment = create_globals(globals)
+    best = None
+    evaluations = 0
+    for _ in range(max(1, repeat)):
+        METRICS.reset()
+        METRICS.enable()
+        # Every run starts cold; cached call results keep their methods (and parse trees) alive
+        CSEvaluator.call_cache.clear()
+        started = time.perf_counter()
+        for path in paths:
+            METRICS.begin_file(path)
+            with open(path, "rb") as file:
+                CSharpFile(file.read(), environment)
+            METRICS.end_file()
+        seconds = time.perf_counter() - started
+        METRICS.enable(False)
+        if best is None or seconds < best:
+            best = seconds
+            evaluations = METRICS.report()["counters"].get("evaluations", 0)
+    METRICS.reset()
+    return {
+        "files": len(paths),
+        "seconds": round(best, 4),
+        "files_per_second": round(len(paths) / best, 2),
+        "evaluations_per_second": round(evaluations / best, 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def measure_startup(path: str, runs: int = STARTUP_RUNS) -> dict:
+    """
+    Median time from the first import to the first result (the endpoints of a method of path), each run
+    in a new process, and the median of the whole process including interpreter startup.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    in_process, whole = [], []
+    for _ in range(max(1, runs)):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, path], cwd=here,
+                                capture_output=True, text=True, check=True).stdout
+        whole.append(time.perf_counter() - started)
+        in_process.append(float(output.split()[-1]))
+    return {
+        "startup_ms": round(statistics.median(in_process) * 1000, 1),
+        "process_ms": round(statistics.median(whole) * 1000, 1),
+    }
+
+
+def environment_info() -> dict:
+    info = {"python": platform.python_version(), "platform": platform.platform()}
+    for package in ("tree-sitter", "tree-sitter-c-sharp"):
+        try:
+            info[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            info[package] = None
+    return info
+
+
+def compare(result: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """Regressions of result against baseline, beyond the relative tolerance."""
+    regressions = []
+    for key in ("files_per_second", "evaluations_per_second"):
+        if baseline.get(key) and result[key] < baseline[key] * (1 - tolerance):
+            regressions.append(f"{key}: {result[key]} < {baseline[key]} (baseline)")
+    for key in ("peak_rss_mb", "startup_ms"):
+        if baseline.get(key) and result.get(key) and result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {result[key]} > {baseline[key]} (baseline)")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="parsing bench", description="Benchmark CSharpFile on a generated test suite and compare against a baseline.")
+    arg_parser.add_argument("--files", type=int, default=1000, help="number of generated files (10 to 100000)")
+    arg_parser.add_argument("--seed", type=int, default=0, help="generator seed")
+    arg_parser.add_argument("--corpus", default=None, help="directory for the generated corpus, kept for reuse (default: a temporary directory)")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs; the fastest is reported")
+    arg_parser.add_argument("--startup-runs", type=int, default=STARTUP_RUNS, help="fresh processes timed from import to first result (0 = skip)")
+    arg_parser.add_argument("--baseline", default=None, help="baseline JSON to compare against; exits with 1 on a regression")
+    arg_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="relative change tolerated against the baseline")
+    arg_parser.add_argument("--save-baseline", default=None, help="write the result as a new baseline JSON")
+    args = arg_parser.parse_args(argv)
+
+    directory = args.corpus or tempfile.mkdtemp(prefix="parsing-bench-")
+    try:
+        paths = generate_corpus(directory, args.files, args.seed)
+        result = {"seed": args.seed, **run_benchmark(paths, args.repeat)}
+        if args.startup_runs > 0:
+            result.update(measure_startup(paths[0], args.startup_runs))
+        result["environment"] = environment_info()
+    finally:
+        if args.corpus is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print(json.dumps(result, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if (baseline.get("files"), baseline.get("seed")) != (result["files"], result["seed"]):
+            print(f"Baseline was measured on {baseline.get('files')} files with seed {baseline.get('seed')}", file=sys.stderr)
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
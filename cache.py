@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+# Persistent on-disk cache of per-file extraction results, keyed by content
+import hashlib
+import mmap
+import os
+import pickle
+import time
+import zlib
+
+from functools import lru_cache
+from importlib import metadata
+
+from Environment import Environment
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60  # seconds
+
+# Source files whose behaviour changes what ends up in a record
+_EXTRACTOR_MODULES = ["parser.py", "Resolver.py", "Lexer.py", "Scopes.py", "Syntax.py", "Blocks.py", "Dependencies.py", "Environment.py", "Metadata.py", "Symbols.py", "scanner.py"]
+
+
+@lru_cache(maxsize=None)
+def extractor_version() -> str:
+    """
+    Identify the parser that produced a record: the tree-sitter packages plus the extraction code itself.
+    Changing any of them invalidates every cached record.
+    """
+    digest = hashlib.sha256()
+    for package in ("tree-sitter", "tree-sitter-c-sharp"):
+        try:
+            digest.update(f"{package}={metadata.version(package)};".encode())
+        except metadata.PackageNotFoundError:
+            digest.update(f"{package}=?;".encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    for module in _EXTRACTOR_MODULES:
+        with open(os.path.join(here, module), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+
+def globals_fingerprint(env: Environment | None) -> str:
+    """
+    Hash the variables of a globals environment (and its enclosing ones) independent of definition order.
+    """
+    digest = hashlib.sha256()
+    while env is not None:
+        for name in sorted(env.values):
+            digest.update(f"{name}={env.values[name].value!r}:{env.values[name].cstype}\n".encode())
+        digest.update(b"--\n")
+        env = env.enclosing
+    return digest.hexdigest()[:16]
+
+
+class ExtractionCache:
+    """
+    Stores file records in one append-only data file, read through mmap, plus a pickled index
+    of key -> (offset, length, last used time).
+
+    Entries are evicted on save() when they have not been used for max_age seconds,
+    or least recently used first while the data file is over max_bytes.
+    """
+    DATA_FILE = "records.bin"
+    INDEX_FILE = "index.pickle"
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES, max_age: float = DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index: dict[str, tuple[int, int, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._map: mmap.mmap | None = None
+        self._data_size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @property
+    def data_path(self) -> str:
+        return os.path.join(self.directory, self.DATA_FILE)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "rb") as file:
+                self.index = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.index = {}
+        try:
+            self._data_size = os.path.getsize(self.data_path)
+        except OSError:
+            self._data_size = 0
+            self.index = {}
+        # Drop entries pointing past the end of a truncated data file
+        self.index = {k: v for k, v in self.index.items() if v[0] + v[1] <= self._data_size}
+
+    @staticmethod
+    def key(source: bytes, globals_fp: str) -> str:
+        digest = hashlib.sha256(source)
+        digest.update(globals_fp.encode())
+        digest.update(extractor_version().encode())
+        return digest.hexdigest()
+
+    def _mapped(self, end: int) -> mmap.mmap | None:
+        if self._map is None or len(self._map) < end:
+            self._close_map()
+            if self._data_size == 0:
+                return None
+            with open(self.data_path, "rb") as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def get(self, key: str, counted: bool = True) -> dict | None:
+        """The entry under key, or None; counted=False leaves it out of hits and misses (e.g. for the symbol index)."""
+        record = self._read(key)
+        if counted:
+            if record is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return record
+
+    def _read(self, key: str) -> dict | None:
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, length, _ = entry
+        data = self._mapped(offset + length)
+        if data is None:
+            return None
+        try:
+            record = pickle.loads(zlib.decompress(data[offset:offset + length]))
+        except (zlib.error, pickle.UnpicklingError, EOFError):
+            del self.index[key]
+            return None
+        self.index[key] = (offset, length, time.time())
+        return record
+
+    def put(self, key: str, record: dict):
+        blob = zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+        with open(self.data_path, "ab") as file:
+            offset = file.tell()
+            file.write(blob)
+        self._data_size = offset + len(blob)
+        self.index[key] = (offset, len(blob), time.time())
+
+    def save(self):
+        """
+        Evict old entries, compact the data file if anything is dead, and write the index.
+        """
+        now = time.time()
+        live = [(k, v) for k, v in self.index.items() if now - v[2] <= self.max_age]
+        live.sort(key=lambda item: item[1][2], reverse=True)  # most recently used first
+        kept = []
+        total = 0
+        for k, v in live:
+            if total + v[1] > self.max_bytes:
+                break
+            kept.append((k, v))
+            total += v[1]
+
+        if total < self._data_size:
+            self._compact(kept)
+        else:
+            self.index = dict(kept)
+
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(self.index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.index_path)
+
+    def _compact(self, kept: list[tuple[str, tuple[int, int, float]]]):
+        data = self._mapped(self._data_size)
+        index = {}
+        tmp_path = self.data_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            for k, (offset, length, used) in sorted(kept, key=lambda item: item[1][0]):
+                index[k] = (file.tell(), length, used)
+                if data is not None:
+                    file.write(data[offset:offset + length])
+        self._close_map()
+        os.replace(tmp_path, self.data_path)
+        self.index = index
+        self._data_size = os.path.getsize(self.data_path)
+
+    def close(self):
+        self.save()
+        self._close_map()
+
+    def __enter__(self) -> ExtractionCache:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
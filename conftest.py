@@ -0,0 +1,2 @@
+# test_parser.py is a script printing the environments of a sample file, run by hand
+collect_ignore = ["test_parser.py"]
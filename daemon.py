@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+# Long-running process keeping the results of a test repo in memory, answering JSON queries on a Unix socket
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+
+from helper import create_globals, globals
+from Metadata import AttributeIndex
+from parser import ParseLimitError, ParseLimits
+from scanner import DEFAULT_CHUNKSIZE, add_limit_arguments, find_cs_files, iter_scan, limits_from_arguments, read_source
+from Symbols import SymbolIndex
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"parsing-{os.getuid()}.sock")
+DEFAULT_INTERVAL = 1.0  # seconds between polls of the tree
+POOL_THRESHOLD = 32  # fewer changed files than this are re-extracted in this process instead of a worker pool
+
+
+def _stamp(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Workspace:
+    """
+    The file records (see scanner.file_record) of every *.cs file under root, the attribute index built
+    from them and, with index=True, the symbol index of all declarations.
+
+    refresh() re-extracts only the files whose modification time or size changed and, with the symbol
+    index, the files that may resolve a name through a declaration they changed. It prepares new
+    dicts and swaps them in at the end, so answer() can run in another thread meanwhile and only
+    ever sees a complete state.
+    """
+
+    def __init__(self, root: str, globals_str: str = globals, workers: int | None = None,
+                 index: bool = False, metadata_only: bool = False, limits: ParseLimits | None = None):
+        self.root = root
+        self.globals_str = globals_str
+        self.workers = workers
+        self.metadata_only = metadata_only
+        self.limits = limits
+        self.symbols = SymbolIndex(create_globals(globals_str)) if index else None
+        self.stamps: dict[str, tuple[int, int]] = {}
+        self.records: dict[str, dict] = {}
+        self.attributes = AttributeIndex()
+        self.updated = 0.0
+
+    def refresh(self) -> dict:
+        """Bring the records up to date with the files on disk; returns the changed and removed paths."""
+        stamps = {}
+        for path in find_cs_files(self.root):
+            try:
+                stamps[path] = _stamp(path)
+            except OSError:
+                continue  # removed while walking
+        changed = [path for path, stamp in stamps.items() if self.stamps.get(path) != stamp]
+        removed = [path for path in self.stamps if path not in stamps]
+        if not changed and not removed:
+            return {"changed": [], "removed": []}
+
+        extract = changed
+        if self.symbols is not None:
+            before = self.symbols.digests()
+            for path in removed + changed:
+                self.symbols.remove_file(path)
+            for path in changed:
+                try:
+                    with open(path, "rb") as file:
+                        if self.limits is not None:
+                            self.limits.check_size(os.fstat(file.fileno()).st_size)
+                        self.symbols.add_file(path, file.read(), self.limits.parse_timeout if self.limits else None)
+                except ParseLimitError:
+                    continue
+            declarations = SymbolIndex.changes(before, self.symbols.digests())
+            if declarations:
+                # Unchanged files that resolve names through a changed declaration get other values too
+                dependents = self.symbols.dependents(declarations) - set(changed)
+                extract = changed + sorted(path for path in dependents if path in stamps)
+
+        workers = 1 if len(extract) < POOL_THRESHOLD else self.workers
+        records = {path: record for path, record in self.records.items() if path in stamps}
+        for record in iter_scan(extract, self.globals_str, workers, DEFAULT_CHUNKSIZE, self.symbols, self.metadata_only, self.limits):
+            records[record["file"]] = record
+        ordered = [records[path] for path in sorted(records)]
+
+        self.records, self.stamps = records, stamps
+        self.attributes = AttributeIndex.from_records(ordered)
+        self.updated = time.time()
+        logger.info("Re-extracted %d files (%d changed, %d removed)", len(extract), len(changed), len(removed))
+        return {"changed": changed, "removed": removed}
+
+    def answer(self, request: dict):
+        """
+        The result of one query. Raises ValueError for an unknown op and KeyError for a missing argument.
+
+        status                                        files, classes, methods and errors held
+        methods   [method] [class] [attribute] [operation] [response_code] [endpoint]
+                                                      matching test methods, with their endpoints
+        endpoints method [class]                      resolved endpoints of a method
+        file      path                                the record of a file
+        symbol    name                                value of a declaration (needs the symbol index)
+        symbols   prefix                              declarations under a namespace or type (needs the symbol index)
+        """
+        op = request.get("op")
+        if op == "status":
+            records = self.records
+            return {
+                "root": self.root,
+                "files": len(records),
+                "classes": sum(len(record["classes"]) for record in records.values()),
+                "methods": len(self.attributes.entries),
+                "errors": sum("error" in record for record in records.values()),
+                "skipped": sum("skipped" in record for record in records.values()),
+                "updated": self.updated,
+            }
+        if op == "methods":
+            return self.attributes.query(request.get("attribute"), request.get("operation"), request.get("response_code"),
+                                         request.get("endpoint"), request.get("method"), request.get("class"))
+        if op == "endpoints":
+            entries = self.attributes.query(method_name=request["method"], class_name=request.get("class"))
+            return [{key: entry[key] for key in ("file", "class_name", "method_name", "endpoints")} for entry in entries]
+        if op == "file":
+            path = request["path"]
+            return self.records.get(path) or self.records.get(os.path.join(self.root, path))
+        if op == "symbol":
+            if self.symbols is None:
+                raise ValueError("the daemon was started without --index")
+            value = self.symbols.resolve(request["name"])
+            return None if value is None else {"value": value.value, "cstype": value.cstype}
+        if op == "symbols":
+            if self.symbols is None:
+                raise ValueError("the daemon was started without --index")
+            return [{"name": declaration.name, "kind": declaration.kind, "file": declaration.file}
+                    for declaration in self.symbols.under(request["prefix"])]
+        raise ValueError(f"unknown op {op!r}")
+
+
+class Daemon:
+    """
+    Serves a Workspace over a Unix socket, one JSON request per line and one JSON response per line:
+    {"ok": true, "result": ...} or {"ok": false, "error": "..."}. The tree is polled every interval
+    seconds; extraction runs in a thread so queries keep being answered from the previous state.
+    """
+
+    def __init__(self, workspace: Workspace, socket_path: str = DEFAULT_SOCKET, interval: float = DEFAULT_INTERVAL):
+        self.workspace = workspace
+        self.socket_path = socket_path
+        self.interval = interval
+        self._refreshing: asyncio.Lock | None = None
+
+    async def refresh(self) -> dict:
+        async with self._refreshing:
+            return await asyncio.get_running_loop().run_in_executor(None, self.workspace.refresh)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Refresh failed")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                writer.write(json.dumps(await self._respond(line)).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request is a JSON object")
+            if request.get("op") == "refresh":
+                return {"ok": True, "result": await self.refresh()}
+            if request.get("op") in ("symbol", "symbols"):
+                # Resolving evaluates through the symbol index, which refresh() changes in place
+                async with self._refreshing:
+                    return {"ok": True, "result": self.workspace.answer(request)}
+            return {"ok": True, "result": self.workspace.answer(request)}
+        except KeyError as e:
+            return {"ok": False, "error": f"missing argument {e}"}
+        except (ValueError, TypeError) as e:
+            return {"ok": False, "error": str(e)}
+
+    async def serve(self):
+        self._refreshing = asyncio.Lock()
+        started = time.perf_counter()
+        await self.refresh()
+        logger.info("Extracted %d files in %.1fs", len(self.workspace.records), time.perf_counter() - started)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # left over from a daemon that did not shut down
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        watch = asyncio.create_task(self._watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watch.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def request(message: dict, socket_path: str = DEFAULT_SOCKET) -> dict:
+    """Send one request to a running daemon and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as responses:
+            return json.loads(responses.readline())
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="parsing serve", description="Keep the extraction results of a directory in memory, re-extract changed files and answer JSON queries on a Unix socket.")
+    arg_parser.add_argument("root", help="directory to watch")
+    arg_parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Unix socket path (default: {DEFAULT_SOCKET})")
+    arg_parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between polls for changed files")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes for large batches (default: CPU count, 1 = no pool)")
+    arg_parser.add_argument("--globals", dest="globals_file", default=None, help="NAME=value file (like newvars.txt) to use instead of helper.globals")
+    arg_parser.add_argument("--index", action="store_true", help="keep a symbol index of all declarations")
+    arg_parser.add_argument("--metadata-only", action="store_true", help="skip method bodies")
+    add_limit_arguments(arg_parser)
+    arg_parser.add_argument("-v", "--verbose", action="store_true", help="log refreshes")
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    globals_str = read_source(args.globals_file) if args.globals_file else globals
+    workspace = Workspace(args.root, globals_str, args.workers, args.index, args.metadata_only, limits_from_arguments(args))
+    try:
+        asyncio.run(Daemon(workspace, args.socket, args.interval).serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def ask(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="parsing ask", description="Send one query to a running daemon and print the result as JSON.")
+    arg_parser.add_argument("op", help="status, methods, endpoints, file, symbol, symbols or refresh")
+    arg_parser.add_argument("arguments", nargs="*", help="NAME=VALUE, e.g. method=POST_Share_200 or attribute=Test")
+    arg_parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Unix socket path (default: {DEFAULT_SOCKET})")
+    args = arg_parser.parse_args(argv)
+
+    message = {"op": args.op}
+    for argument in args.arguments:
+        name, separator, value = argument.partition("=")
+        if not separator:
+            arg_parser.error(f"expected NAME=VALUE, got {argument!r}")
+        message[name] = value
+    response = request(message, args.socket)
+    if not response["ok"]:
+        print(response["error"], file=sys.stderr)
+        return 1
+    print(json.dumps(response["result"], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
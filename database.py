@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+# Keep scan results in a SQLite database between runs, re-extracting only the files whose content changed
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+from collections.abc import Iterable
+
+from cache import DEFAULT_MAX_AGE, DEFAULT_MAX_BYTES, ExtractionCache, extractor_version
+from helper import globals
+from Metadata import Attribute, swagger_fields
+from parser import ParseLimitError, ParseLimits
+from scanner import (DEFAULT_CHUNKSIZE, add_limit_arguments, find_cs_files, iter_scan, iter_scan_cached,
+                     limits_from_arguments, read_source, scan_fingerprint)
+from Symbols import SymbolIndex
+
+
+SCHEMA_VERSION = 1
+DEFAULT_DATABASE = "parsing.db"
+DEFAULT_BATCH_SIZE = 200  # files written per transaction
+
+# Every table below files carries the file_id of its rows, so a file is replaced or purged with one delete per table
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    hash TEXT NOT NULL,           -- sha256 of the content
+    fingerprint TEXT NOT NULL,    -- parser version, globals and mode it was extracted with
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    state TEXT NOT NULL,          -- ok, error, skipped or downgraded
+    reason TEXT
+);
+CREATE TABLE IF NOT EXISTS declarations (
+    name TEXT PRIMARY KEY,        -- fully qualified, as in the symbol index of the last run with --index
+    kind TEXT NOT NULL,
+    digest TEXT NOT NULL,         -- see SymbolIndex.digests()
+    file TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,           -- sha256 of the content the symbols were read from
+    version TEXT NOT NULL,        -- extractor version
+    data TEXT NOT NULL            -- JSON, see SymbolIndex.file_symbols()
+);
+CREATE TABLE IF NOT EXISTS classes (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    name TEXT NOT NULL,
+    qualified_name TEXT,
+    super_class_name TEXT
+);
+CREATE TABLE IF NOT EXISTS methods (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    class_id INTEGER NOT NULL REFERENCES classes(id),
+    name TEXT NOT NULL,
+    parameters TEXT NOT NULL,     -- JSON list
+    operation TEXT,               -- of the Swagger attribute, normalized (POST)
+    response_code TEXT,
+    swagger_path TEXT
+);
+CREATE TABLE IF NOT EXISTS attributes (
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    class_id INTEGER NOT NULL REFERENCES classes(id),
+    method_id INTEGER REFERENCES methods(id),  -- NULL for an attribute of the class
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    short_name TEXT NOT NULL,
+    arguments TEXT NOT NULL,      -- JSON list of source texts
+    named TEXT NOT NULL           -- JSON object of source texts
+);
+CREATE TABLE IF NOT EXISTS endpoints (
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    method_id INTEGER NOT NULL REFERENCES methods(id),
+    position INTEGER NOT NULL,
+    endpoint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS environment_values (
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    class_id INTEGER REFERENCES classes(id),   -- NULL for a file-level value
+    method_id INTEGER REFERENCES methods(id),  -- NULL for a file or class value
+    name TEXT NOT NULL,
+    value TEXT,
+    cstype TEXT
+);
+CREATE INDEX IF NOT EXISTS declarations_file ON declarations(file);
+CREATE INDEX IF NOT EXISTS classes_file ON classes(file_id);
+CREATE INDEX IF NOT EXISTS classes_name ON classes(name);
+CREATE INDEX IF NOT EXISTS classes_qualified_name ON classes(qualified_name);
+CREATE INDEX IF NOT EXISTS classes_super ON classes(super_class_name);
+CREATE INDEX IF NOT EXISTS methods_file ON methods(file_id);
+CREATE INDEX IF NOT EXISTS methods_class ON methods(class_id);
+CREATE INDEX IF NOT EXISTS methods_name ON methods(name);
+CREATE INDEX IF NOT EXISTS methods_swagger ON methods(operation, response_code);
+CREATE INDEX IF NOT EXISTS attributes_file ON attributes(file_id);
+CREATE INDEX IF NOT EXISTS attributes_method ON attributes(method_id);
+CREATE INDEX IF NOT EXISTS attributes_short_name ON attributes(short_name);
+CREATE INDEX IF NOT EXISTS attributes_name ON attributes(name);
+CREATE INDEX IF NOT EXISTS endpoints_file ON endpoints(file_id);
+CREATE INDEX IF NOT EXISTS endpoints_method ON endpoints(method_id, position);
+CREATE INDEX IF NOT EXISTS endpoints_endpoint ON endpoints(endpoint);
+CREATE INDEX IF NOT EXISTS environment_values_file ON environment_values(file_id);
+CREATE INDEX IF NOT EXISTS environment_values_name ON environment_values(name);
+"""
+
+_FILE_TABLES = ["environment_values", "endpoints", "attributes", "methods", "classes"]
+
+
+def _hash(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def _state(record: dict) -> tuple[str, str | None]:
+    for state in ("error", "skipped", "downgraded"):
+        if state in record:
+            return state, record[state]
+    return "ok", None
+
+
+def _under(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+class SQLiteIndex:
+    """
+    File records (see scanner.file_record) upserted into a SQLite database in WAL mode, so other tools
+    can query them (and read while an update runs) without Python.
+
+    update() stats every file under a root: one whose size and modification time are those stored is
+    skipped unread, one whose content hash is unchanged only gets its new stamp. The others are
+    extracted and written batch_size files per transaction, and files no longer under the root are
+    purged. A file extracted with another parser version, globals or mode (its fingerprint) is
+    extracted again, and so is one that failed or was skipped. With index=True, so are the
+    unchanged files that resolve a name through a declaration that changed since the last run
+    (see SymbolIndex.dependents()); the symbol index is built from the symbols stored for each
+    file's content, so only new and changed files are parsed for it.
+    """
+
+    def __init__(self, path: str = DEFAULT_DATABASE):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints, which is enough for a re-creatable index
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise ValueError(f"{path} has schema version {version}, expected {SCHEMA_VERSION}")
+        self.connection.executescript(_SCHEMA)
+        self.connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def update(self, root: str, globals_str: str = globals, workers: int | None = None,
+               chunksize: int = DEFAULT_CHUNKSIZE, index: bool = False, metadata_only: bool = False,
+               limits: ParseLimits | None = None, cache: ExtractionCache | None = None,
+               batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+        """Bring the database up to date with the *.cs files under root; returns how many files were touched."""
+        root = os.path.abspath(root)
+        # The symbol index is not part of it: only the files depending on a changed declaration are extracted again
+        fingerprint = f"{extractor_version()}:{scan_fingerprint(globals_str, None, metadata_only, limits)}"
+        if index:
+            fingerprint += ":index"
+        stored = {path: row for path, *row in self.connection.execute("SELECT path, id, hash, size, mtime_ns, fingerprint, state FROM files")}
+
+        present: dict[str, None] = {}  # in the order found, which the symbol index keeps
+        changed: dict[str, tuple[str, int, int]] = {}  # path -> hash, size, mtime_ns
+        unchanged: dict[str, tuple[str, int, int]] = {}  # likewise, for files that keep their rows
+        for path in find_cs_files(root):
+            try:
+                stat = os.stat(path)
+                row = stored.get(path)
+                if row is not None and (row[4] != fingerprint or row[5] in ("error", "skipped")):
+                    # Extracted with another parser, globals or mode, or not extracted at all (the limits or
+                    # the machine may differ this time, as in iter_scan_cached): extract again whatever the content
+                    row = None
+                if row is not None and row[2:4] == [stat.st_size, stat.st_mtime_ns]:
+                    present[path] = None
+                    unchanged[path] = (row[1], stat.st_size, stat.st_mtime_ns)
+                    continue
+                digest = _hash(path)
+            except OSError:
+                continue  # removed while walking
+            present[path] = None
+            if row is not None and row[1] == digest:
+                unchanged[path] = (digest, stat.st_size, stat.st_mtime_ns)
+            else:
+                changed[path] = (digest, stat.st_size, stat.st_mtime_ns)
+        removed = {path: row[0] for path, row in stored.items() if _under(path, root) and path not in present}
+
+        symbols = SymbolIndex() if index else None
+        if symbols is not None:
+            parsed = self._add_symbols(symbols, {path: (changed.get(path) or unchanged[path]) for path in present}, limits)
+            before = {name: (kind, digest) for name, kind, digest, file
+                      in self.connection.execute("SELECT name, kind, digest, file FROM declarations") if _under(file, root)}
+            after = symbols.digests()
+            declarations = SymbolIndex.changes(before, after)
+            for path in sorted(symbols.dependents(declarations)) if declarations else ():
+                if path in unchanged:
+                    changed[path] = unchanged.pop(path)
+        restamped = [(size, mtime_ns, stored[path][0]) for path, (_, size, mtime_ns) in unchanged.items()
+                     if stored[path][2:4] != [size, mtime_ns]]
+
+        with self.connection:
+            for file_id in removed.values():
+                self._delete(file_id, purge=True)
+            self.connection.executemany("UPDATE files SET size = ?, mtime_ns = ? WHERE id = ?", restamped)
+
+        paths = list(changed)
+        if cache is not None:
+            records = iter_scan_cached(paths, cache, globals_str, workers, chunksize, symbols, metadata_only, limits)
+        else:
+            records = iter_scan(paths, globals_str, workers, chunksize, symbols, metadata_only, limits)
+        self.write(records, {path: (*stamp, fingerprint) for path, stamp in changed.items()}, batch_size)
+        if symbols is not None:
+            with self.connection:
+                self.connection.executemany("DELETE FROM symbols WHERE path = ?", [(path,) for path in removed])
+                self.connection.executemany(
+                    "INSERT INTO symbols (path, hash, version, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET hash = excluded.hash, version = excluded.version, data = excluded.data",
+                    parsed)
+                self.connection.executemany("DELETE FROM declarations WHERE name = ?", [(name,) for name in before if name not in after])
+                self.connection.executemany(
+                    "INSERT INTO declarations (name, kind, digest, file) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET kind = excluded.kind, digest = excluded.digest, file = excluded.file",
+                    [(name, kind, digest, symbols.declarations[name].file) for name, (kind, digest) in after.items()
+                     if before.get(name) != (kind, digest)])
+        return {"extracted": len(changed), "unchanged": len(present) - len(changed), "removed": len(removed)}
+
+    def _add_symbols(self, index: SymbolIndex, files: dict[str, tuple[str, int, int]],
+                     limits: ParseLimits | None) -> list[tuple[str, str, str, str]]:
+        """
+        Add the symbols of files (path -> hash, size, mtime_ns) to index: those stored for the same content
+        and extractor version as they are, the others parsed. Returns the rows to store for the parsed files.
+        A file over the limits is left out, as in SymbolIndex.build().
+        """
+        version = extractor_version()
+        stored = {path: (digest, data) for path, digest, data
+                  in self.connection.execute("SELECT path, hash, data FROM symbols WHERE version = ?", (version,))}
+        parsed = []
+        for path, (digest, size, _) in files.items():
+            row = stored.get(path)
+            if row is not None and row[0] == digest:
+                index.add_symbols(path, json.loads(row[1]))
+                continue
+            try:
+                if limits is not None:
+                    limits.check_size(size)
+                with open(path, "rb") as file:
+                    symbols = SymbolIndex.file_symbols(file.read(), limits.parse_timeout if limits is not None else None)
+            except (OSError, ParseLimitError):
+                continue
+            index.add_symbols(path, symbols)
+            parsed.append((path, digest, version, json.dumps(symbols)))
+        return parsed
+
+    def write(self, records: Iterable[dict], stamps: dict[str, tuple[str, int, int, str]], batch_size: int = DEFAULT_BATCH_SIZE):
+        """Upsert records, committing every batch_size files; stamps gives the hash, size, mtime and fingerprint of each path."""
+        pending = 0
+        try:
+            for record in records:
+                self._write_file(record, *stamps[record["file"]])
+                pending += 1
+                if pending >= batch_size:
+                    self.connection.commit()
+                    pending = 0
+        finally:
+            self.connection.commit()  # whatever was written before a failure stays
+
+    def _delete(self, file_id: int, purge: bool = False):
+        for table in _FILE_TABLES:
+            self.connection.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
+        if purge:
+            self.connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def _write_file(self, record: dict, digest: str, size: int, mtime_ns: int, fingerprint: str):
+        execute = self.connection.execute
+        state, reason = _state(record)
+        file_id = execute(
+            "INSERT INTO files (path, hash, fingerprint, size, mtime_ns, state, reason) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET hash = excluded.hash, fingerprint = excluded.fingerprint, size = excluded.size, "
+            "mtime_ns = excluded.mtime_ns, state = excluded.state, reason = excluded.reason RETURNING id",
+            (record["file"], digest, fingerprint, size, mtime_ns, state, reason)).fetchone()[0]
+        self._delete(file_id)
+        self._write_values(file_id, None, None, record["environment"])
+        for class_record in record["classes"]:
+            class_id = execute("INSERT INTO classes (file_id, name, qualified_name, super_class_name) VALUES (?, ?, ?, ?)",
+                               (file_id, class_record["class_name"], class_record.get("qualified_name"),
+                                class_record["super_class_name"])).lastrowid
+            self._write_attributes(file_id, class_id, None, class_record.get("parsed_attributes", ()))
+            self._write_values(file_id, class_id, None, class_record["environment"])
+            for method in class_record["methods"]:
+                attributes = [Attribute.from_dict(attribute) for attribute in method.get("parsed_attributes", ())]
+                method_id = execute(
+                    "INSERT INTO methods (file_id, class_id, name, parameters, operation, response_code, swagger_path) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (file_id, class_id, method["method_name"], json.dumps(method["parameters"]), *swagger_fields(attributes))).lastrowid
+                self._write_attributes(file_id, class_id, method_id, method.get("parsed_attributes", ()))
+                self.connection.executemany("INSERT INTO endpoints (file_id, method_id, position, endpoint) VALUES (?, ?, ?, ?)",
+                                            [(file_id, method_id, position, endpoint)
+                                             for position, endpoint in enumerate(method.get("endpoints", ()))])
+                self._write_values(file_id, class_id, method_id, method.get("environment", {}))
+
+    def _write_attributes(self, file_id: int, class_id: int, method_id: int | None, attributes: Iterable[dict]):
+        self.connection.executemany(
+            "INSERT INTO attributes (file_id, class_id, method_id, position, name, short_name, arguments, named) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(file_id, class_id, method_id, position, attribute["name"], Attribute.from_dict(attribute).short_name,
+              json.dumps(attribute["arguments"]), json.dumps(attribute["named"]))
+             for position, attribute in enumerate(attributes)])
+
+    def _write_values(self, file_id: int, class_id: int | None, method_id: int | None, environment: dict[str, dict]):
+        self.connection.executemany(
+            "INSERT INTO environment_values (file_id, class_id, method_id, name, value, cstype) VALUES (?, ?, ?, ?, ?, ?)",
+            [(file_id, class_id, method_id, name, value["value"], value["cstype"]) for name, value in environment.items()])
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> SQLiteIndex:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="parsing db", description="Upsert the classes, methods, attributes, endpoints and environment values of every *.cs file under a directory into a SQLite database, re-extracting only the files that changed since the last run.")
+    arg_parser.add_argument("root", help="directory (or single .cs file) to index")
+    arg_parser.add_argument("-d", "--database", default=DEFAULT_DATABASE, help=f"SQLite database file (default: {DEFAULT_DATABASE})")
+    arg_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="files written per transaction")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count, 1 = no pool)")
+    arg_parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="files handed to a worker at a time")
+    arg_parser.add_argument("--globals", dest="globals_file", default=None, help="NAME=value file (like newvars.txt) to use instead of helper.globals")
+    arg_parser.add_argument("--index", action="store_true", help="index declarations across all files first (a changed declaration then re-extracts the files that use it)")
+    arg_parser.add_argument("--metadata-only", action="store_true", help="skip method bodies")
+    add_limit_arguments(arg_parser)
+    arg_parser.add_argument("--cache", dest="cache_dir", default=None, help="directory of the on-disk result cache (default: no cache)")
+    args = arg_parser.parse_args(argv)
+
+    globals_str = read_source(args.globals_file) if args.globals_file else globals
+    limits = limits_from_arguments(args)
+    root = os.path.abspath(args.root)
+    cache = ExtractionCache(args.cache_dir, DEFAULT_MAX_BYTES, DEFAULT_MAX_AGE) if args.cache_dir else None
+    try:
+        with SQLiteIndex(args.database) as database:
+            result = database.update(root, globals_str, args.workers, args.chunksize, args.index, args.metadata_only,
+                                     limits, cache, args.batch_size)
+    finally:
+        if cache is not None:
+            cache.close()
+    print(f"{args.database}: {result['extracted']} files extracted, {result['unchanged']} unchanged, {result['removed']} removed", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
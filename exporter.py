@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+# Stream one JSON line per class and method as soon as its file is extracted
+import argparse
+import json
+import socket
+import sys
+
+from collections.abc import Iterable, Iterator
+from typing import IO
+
+from cache import DEFAULT_MAX_AGE, DEFAULT_MAX_BYTES, ExtractionCache
+from helper import globals
+from scanner import DEFAULT_CHUNKSIZE, add_limit_arguments, find_cs_files, iter_scan, iter_scan_cached, limits_from_arguments, read_source
+from Symbols import SymbolIndex
+
+
+DEFAULT_BATCH_SIZE = 256  # lines per write
+
+
+def iter_items(file_records: Iterable[dict]) -> Iterator[dict]:
+    """
+    Flatten file records into one record per class and per method (and one per file that failed or was skipped).
+    """
+    for record in file_records:
+        if "error" in record:
+            yield {"type": "error", "file": record["file"], "error": record["error"]}
+        if "skipped" in record:
+            yield {"type": "skipped", "file": record["file"], "reason": record["skipped"]}
+        for class_record in record["classes"]:
+            owner = {
+                "file": record["file"],
+                "class_name": class_record["class_name"],
+                "super_class_name": class_record["super_class_name"],
+            }
+            yield {
+                "type": "class", **owner,
+                "qualified_name": class_record["qualified_name"],
+                "attributes": class_record["attributes"],
+                "environment": class_record["environment"],
+            }
+            for method in class_record["methods"]:
+                yield {
+                    "type": "method", **owner,
+                    "method_name": method["method_name"],
+                    "attributes": method["attributes"],
+                    "parameters": method["parameters"],
+                    "environment": method.get("environment", {}),
+                    "endpoints": method.get("endpoints", []),
+                }
+
+
+class JsonlWriter:
+    """
+    Writes one JSON document per line to a path, an open text or binary file, or a connected socket.
+    Lines are buffered and written batch_size at a time, so memory stays bounded and readers see
+    complete lines as the scan progresses.
+    """
+
+    def __init__(self, target: str | IO | socket.socket, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.batch_size = max(1, batch_size)
+        self.written = 0
+        self._buffer: list[str] = []
+        self._owned = isinstance(target, str)
+        self._target = open(target, "w", encoding="utf-8") if self._owned else target
+
+    def write(self, item: dict):
+        self._buffer.append(json.dumps(item) + "\n")
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def write_all(self, items: Iterable[dict]) -> int:
+        for item in items:
+            self.write(item)
+        self.flush()
+        return self.written
+
+    def flush(self):
+        if not self._buffer:
+            return
+        chunk = "".join(self._buffer)
+        if isinstance(self._target, socket.socket):
+            self._target.sendall(chunk.encode())
+        elif "b" in getattr(self._target, "mode", ""):
+            self._target.write(chunk.encode())
+            self._target.flush()
+        else:
+            self._target.write(chunk)
+            self._target.flush()
+        self.written += len(self._buffer)
+        self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self._target.close()
+
+    def __enter__(self) -> JsonlWriter:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _connect(address: str) -> socket.socket:
+    """HOST:PORT for TCP, anything else is a Unix socket path."""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return socket.create_connection((host, int(port)))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="parsing export", description="Stream one JSON line per class and method of every *.cs file under a directory.")
+    arg_parser.add_argument("root", help="directory (or single .cs file) to scan")
+    arg_parser.add_argument("-o", "--output", default="-", help="output JSONL file (default: stdout)")
+    arg_parser.add_argument("--connect", default=None, help="send the lines to HOST:PORT or a Unix socket path instead")
+    arg_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="lines written at a time")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count, 1 = no pool)")
+    arg_parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="files handed to a worker at a time")
+    arg_parser.add_argument("--globals", dest="globals_file", default=None, help="NAME=value file (like newvars.txt) to use instead of helper.globals")
+    arg_parser.add_argument("--index", action="store_true", help="index declarations across all files first")
+    arg_parser.add_argument("--metadata-only", action="store_true", help="skip method bodies")
+    add_limit_arguments(arg_parser)
+    arg_parser.add_argument("--cache", dest="cache_dir", default=None, help="directory of the on-disk result cache (default: no cache)")
+    args = arg_parser.parse_args(argv)
+
+    globals_str = read_source(args.globals_file) if args.globals_file else globals
+    limits = limits_from_arguments(args)
+    paths = find_cs_files(args.root)
+
+    if args.connect:
+        target = _connect(args.connect)
+    elif args.output == "-":
+        target = sys.stdout
+    else:
+        target = args.output
+
+    cache = ExtractionCache(args.cache_dir, DEFAULT_MAX_BYTES, DEFAULT_MAX_AGE) if args.cache_dir else None
+    try:
+        index = SymbolIndex.build(paths, limits=limits, cache=cache) if args.index else None
+        if cache is not None:
+            records = iter_scan_cached(paths, cache, globals_str, args.workers, args.chunksize, index, args.metadata_only, limits)
+        else:
+            records = iter_scan(paths, globals_str, args.workers, args.chunksize, index, args.metadata_only, limits)
+        with JsonlWriter(target, args.batch_size) as writer:
+            written = writer.write_all(iter_items(records))
+    finally:
+        if cache is not None:
+            cache.close()
+        if isinstance(target, socket.socket):
+            target.close()
+    print(f"Exported {written} records from {len(paths)} files", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
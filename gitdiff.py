@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+# Compare the test methods of two git revisions, extracting only the *.cs files that differ between them
+import argparse
+import json
+import subprocess
+import sys
+
+from cache import DEFAULT_MAX_AGE, DEFAULT_MAX_BYTES, ExtractionCache
+from helper import create_globals, globals
+from Metadata import Attribute, swagger_fields
+from parser import ParseLimits
+from scanner import add_limit_arguments, extract_source, limits_from_arguments, read_source, scan_fingerprint
+
+
+_REGULAR_FILES = {"100644", "100755"}
+
+
+class GitError(Exception):
+    pass
+
+
+def _git(repo: str, *args: str, stdin: bytes | None = None) -> bytes:
+    result = subprocess.run(["git", "-C", repo, *args], input=stdin, capture_output=True)
+    if result.returncode != 0:
+        raise GitError(result.stderr.decode(errors="replace").strip() or f"git {args[0]} failed")
+    return result.stdout
+
+
+def changed_files(repo: str, old: str, new: str, paths: list[str] | None = None) -> list[tuple[str, str | None, str | None]]:
+    """
+    The *.cs files that differ between two revisions as (path, old blob, new blob), a blob being None
+    where the file does not exist. Renames count as a removal and an addition.
+    """
+    output = _git(repo, "diff-tree", "-r", "-z", "--no-renames", old, new, "--", *(paths or ["*.cs"]))
+    fields = output.split(b"\0")
+    changes = []
+    for header, path in zip(fields[0::2], fields[1::2]):
+        old_mode, new_mode, old_blob, new_blob, _ = header.decode().lstrip(":").split(" ")
+        path = path.decode("utf-8", "surrogateescape")
+        if not path.endswith(".cs"):
+            continue
+        # A side where the file does not exist has an all-zero object name and mode
+        changes.append((path, old_blob if old_mode in _REGULAR_FILES else None, new_blob if new_mode in _REGULAR_FILES else None))
+    return changes
+
+
+def read_blobs(repo: str, blobs: list[str]) -> dict[str, bytes]:
+    """The contents of blobs, by object name, through one git cat-file --batch."""
+    if not blobs:
+        return {}
+    output = _git(repo, "cat-file", "--batch", stdin="".join(f"{blob}\n" for blob in blobs).encode())
+    contents = {}
+    position = 0
+    for blob in blobs:
+        header_end = output.index(b"\n", position)
+        header = output[position:header_end].decode().split(" ")
+        if len(header) != 3:
+            raise GitError(f"cannot read blob {blob}: {' '.join(header[1:])}")
+        name, kind, size = header
+        if kind != "blob":
+            raise GitError(f"{blob} is a {kind}, not a blob")
+        start = header_end + 1
+        contents[name] = output[start:start + int(size)]
+        position = start + int(size) + 1  # the content is followed by a newline
+    return contents
+
+
+def _method_entries(record: dict) -> dict[tuple, dict]:
+    """The methods of a file record by (class, method name, parameters), as entries like AttributeIndex's."""
+    entries = {}
+    for class_record in record["classes"]:
+        class_name = class_record.get("qualified_name") or class_record["class_name"]
+        for method in class_record["methods"]:
+            attributes = [Attribute.from_dict(attribute) for attribute in method.get("parsed_attributes", ())]
+            operation, response_code, path = swagger_fields(attributes)
+            entries[(class_name, method["method_name"], tuple(method["parameters"]))] = {
+                "file": record["file"],
+                "class_name": class_name,
+                "method_name": method["method_name"],
+                "parameters": method["parameters"],
+                "attributes": [attribute.to_dict() for attribute in attributes],
+                "operation": operation,
+                "response_code": response_code,
+                "path": path,
+                "endpoints": list(method.get("endpoints", ())),
+            }
+    return entries
+
+
+def compare(old_records: list[dict], new_records: list[dict]) -> dict:
+    """
+    Added, removed and changed methods between the records of the changed files on both sides.
+    Methods are matched by class, name and parameters, so one moved to another changed file is
+    only reported if it changed; a changed method lists the fields that differ.
+    """
+    old_methods: dict[tuple, dict] = {}
+    new_methods: dict[tuple, dict] = {}
+    for record in old_records:
+        old_methods.update(_method_entries(record))
+    for record in new_records:
+        new_methods.update(_method_entries(record))
+
+    changed = []
+    for key, new in new_methods.items():
+        old = old_methods.get(key)
+        if old is None:
+            continue
+        fields = [field for field in ("operation", "response_code", "path", "endpoints", "attributes") if old[field] != new[field]]
+        if fields:
+            changed.append({
+                "file": new["file"], "class_name": new["class_name"], "method_name": new["method_name"],
+                "parameters": new["parameters"], "changed": fields,
+                **{field: {"old": old[field], "new": new[field]} for field in fields},
+            })
+    old_endpoints = {endpoint for entry in old_methods.values() for endpoint in entry["endpoints"]}
+    new_endpoints = {endpoint for entry in new_methods.values() for endpoint in entry["endpoints"]}
+    return {
+        "added": [entry for key, entry in new_methods.items() if key not in old_methods],
+        "removed": [entry for key, entry in old_methods.items() if key not in new_methods],
+        "changed": changed,
+        "endpoints": {"added": sorted(new_endpoints - old_endpoints), "removed": sorted(old_endpoints - new_endpoints)},
+    }
+
+
+class RevisionDiff:
+    """
+    Extracts the *.cs files that differ between two revisions of a repository, reading both versions
+    as blobs (nothing is checked out), and compares their methods. Files the revisions share are never
+    read, so the work grows with the diff, not the repository.
+
+    With a cache, a blob whose content was extracted before (under the same globals and parser
+    version) is answered from it, as in iter_scan_cached; the version on the base branch usually was.
+    Names are resolved within each file and the globals only: a symbol index would need every file.
+    """
+
+    def __init__(self, repo: str, globals_str: str = globals, cache: ExtractionCache | None = None,
+                 limits: ParseLimits | None = None):
+        self.repo = repo
+        self.globals_env = create_globals(globals_str)
+        self.cache = cache
+        self.limits = limits
+        self.fingerprint = scan_fingerprint(globals_str, limits=limits)
+        self.extracted = 0
+
+    def extract(self, path: str, source: bytes) -> dict:
+        key = self.cache.key(source, self.fingerprint) if self.cache is not None else None
+        if key is not None:
+            record = self.cache.get(key)
+            if record is not None:
+                return {"file": path, **record}
+        record = extract_source(path, source, self.globals_env, limits=self.limits)
+        self.extracted += 1
+        if key is not None and "error" not in record and "skipped" not in record:
+            self.cache.put(key, {k: v for k, v in record.items() if k != "file"})
+        return record
+
+    def diff(self, old: str, new: str, paths: list[str] | None = None) -> dict:
+        changes = changed_files(self.repo, old, new, paths)
+        contents = read_blobs(self.repo, sorted({blob for _, *blobs in changes for blob in blobs if blob is not None}))
+        old_records, new_records = [], []
+        for path, old_blob, new_blob in changes:
+            if old_blob is not None:
+                old_records.append(self.extract(path, contents[old_blob]))
+            if new_blob is not None:
+                new_records.append(self.extract(path, contents[new_blob]))
+        failed = [{"file": record["file"], "revision": revision, "error": record.get("error") or record["skipped"]}
+                  for revision, records in ((old, old_records), (new, new_records))
+                  for record in records if "error" in record or "skipped" in record]
+        return {
+            "old": old,
+            "new": new,
+            "files": {
+                "added": [path for path, old_blob, new_blob in changes if old_blob is None and new_blob is not None],
+                "removed": [path for path, old_blob, new_blob in changes if old_blob is not None and new_blob is None],
+                "modified": [path for path, old_blob, new_blob in changes if old_blob is not None and new_blob is not None],
+            },
+            "errors": failed,
+            "methods": compare(old_records, new_records),
+        }
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="parsing diff", description="Report the test methods, Swagger attributes and resolved endpoints that differ between two git revisions, extracting only the *.cs files that changed.")
+    arg_parser.add_argument("old", help="base revision, e.g. main or a commit")
+    arg_parser.add_argument("new", nargs="?", default="HEAD", help="revision to compare with it (default: HEAD)")
+    arg_parser.add_argument("paths", nargs="*", help="only files matching these pathspecs (default: *.cs)")
+    arg_parser.add_argument("-C", "--repo", default=".", help="repository (default: the current directory)")
+    arg_parser.add_argument("--globals", dest="globals_file", default=None, help="NAME=value file (like newvars.txt) to use instead of helper.globals")
+    add_limit_arguments(arg_parser)
+    arg_parser.add_argument("--cache", dest="cache_dir", default=None, help="directory of the on-disk result cache (default: no cache)")
+    arg_parser.add_argument("-o", "--output", default="-", help="output JSON file (default: stdout)")
+    args = arg_parser.parse_args(argv)
+
+    globals_str = read_source(args.globals_file) if args.globals_file else globals
+    cache = ExtractionCache(args.cache_dir, DEFAULT_MAX_BYTES, DEFAULT_MAX_AGE) if args.cache_dir else None
+    try:
+        differ = RevisionDiff(args.repo, globals_str, cache, limits_from_arguments(args))
+        result = differ.diff(args.old, args.new, args.paths)
+    except GitError as e:
+        print(f"git: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if cache is not None:
+            cache.close()
+
+    if args.output == "-":
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+    methods = result["methods"]
+    print(f"{sum(map(len, result['files'].values()))} files differ ({differ.extracted} extracted): {len(methods['added'])} methods added, "
+          f"{len(methods['removed'])} removed, {len(methods['changed'])} changed", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -89,3 +89,4 @@ def create_globals(globals_str: str) -> Environment:
             value = value[1:-1]
         env.define(var_name, Type(value, "string"))
     return env
+
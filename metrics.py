@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+# Phase timings and counters for scans, per file; close to free while disabled
+import contextlib
+import time
+
+
+_NO_PHASE = contextlib.nullcontext()
+
+
+class _Phase:
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.metrics._enter(self.name)
+
+    def __exit__(self, *exc):
+        self.metrics._exit()
+
+
+class Metrics:
+    """
+    Collects time per phase (read, parse, traversal, class_extraction, method_extraction, evaluation)
+    and event counters (evaluations, call cache hits, unresolved names, ERROR nodes, ...).
+
+    Phases nest and each second is attributed to the innermost running phase only, so the phase
+    times of a file add up to its total. Everything between begin_file() and end_file() is also
+    recorded for that file, which is how worker processes hand their numbers back (see add_file()).
+
+    While disabled, phase() returns a shared no-op context manager and callers guard count()
+    with `if METRICS.enabled`, so the hooks cost an attribute lookup.
+    """
+    SLOW_EXPRESSIONS = 10  # kept per file and in the report
+
+    def __init__(self):
+        self.enabled = False
+        self.files: dict[str, dict] = {}
+        self._outside = self._new_file()  # recorded while no file is open
+        self._current = self._outside
+        self._stack: list[list] = []  # [phase, resumed at]
+
+    @staticmethod
+    def _new_file() -> dict:
+        return {"timings": {}, "counters": {}, "expressions": {}}
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.files = {}
+        self._outside = self._new_file()
+        self._current = self._outside
+        self._stack = []
+
+    def phase(self, name: str):
+        """Context manager timing a phase; a no-op while disabled."""
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def _enter(self, name: str):
+        now = time.perf_counter()
+        if self._stack:
+            # Pause the enclosing phase
+            parent = self._stack[-1]
+            self._add_time(parent[0], now - parent[1])
+        self._stack.append([name, now])
+
+    def _exit(self):
+        now = time.perf_counter()
+        name, resumed = self._stack.pop()
+        self._add_time(name, now - resumed)
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def _add_time(self, name: str, seconds: float):
+        timings = self._current["timings"]
+        timings[name] = timings.get(name, 0.0) + seconds
+
+    def count(self, name: str, amount: int = 1):
+        counters = self._current["counters"]
+        counters[name] = counters.get(name, 0) + amount
+
+    def observe_expression(self, expression: str, seconds: float):
+        expressions = self._current["expressions"]
+        if seconds > expressions.get(expression, 0.0):
+            expressions[expression] = seconds
+
+    def begin_file(self, path: str):
+        self._current = self.files[path] = self._new_file()
+
+    def end_file(self) -> dict:
+        """Close the current file and return its numbers (slowest expressions trimmed)."""
+        data = self._current
+        expressions = data["expressions"]
+        data["expressions"] = dict(sorted(expressions.items(), key=lambda item: -item[1])[:self.SLOW_EXPRESSIONS])
+        self._current = self._outside
+        return data
+
+    def add_file(self, path: str, data: dict):
+        """Record the numbers of a file measured elsewhere, e.g. in a worker process."""
+        self.files[path] = data
+
+    def report(self, top: int = 10) -> dict:
+        """Totals, the slowest files and expressions, and the per-file breakdown, as plain data."""
+        timings: dict[str, float] = {}
+        counters: dict[str, int] = {}
+        expressions: dict[str, float] = {}
+        for data in [self._outside, *self.files.values()]:
+            for name, seconds in data["timings"].items():
+                timings[name] = timings.get(name, 0.0) + seconds
+            for name, amount in data["counters"].items():
+                counters[name] = counters.get(name, 0) + amount
+            for expression, seconds in data["expressions"].items():
+                expressions[expression] = max(seconds, expressions.get(expression, 0.0))
+        file_seconds = {path: sum(data["timings"].values()) for path, data in self.files.items()}
+        return {
+            "timings": timings,
+            "counters": counters,
+            "slowest_files": sorted(file_seconds.items(), key=lambda item: -item[1])[:top],
+            "slowest_expressions": sorted(expressions.items(), key=lambda item: -item[1])[:top],
+            "files": self.files,
+        }
+
+    def prometheus(self) -> str:
+        """The totals and per-file times in the Prometheus text exposition format."""
+        report = self.report()
+        lines = ["# HELP parsing_phase_seconds Time spent per extraction phase.",
+                 "# TYPE parsing_phase_seconds counter"]
+        for name, seconds in sorted(report["timings"].items()):
+            lines.append(f'parsing_phase_seconds{{phase="{name}"}} {seconds:.6f}')
+        lines += ["# HELP parsing_events_total Extraction events.", "# TYPE parsing_events_total counter"]
+        for name, amount in sorted(report["counters"].items()):
+            lines.append(f'parsing_events_total{{event="{name}"}} {amount}')
+        lines += ["# HELP parsing_file_seconds Extraction time per file.", "# TYPE parsing_file_seconds gauge"]
+        for path, data in self.files.items():
+            label = path.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            lines.append(f'parsing_file_seconds{{file="{label}"}} {sum(data["timings"].values()):.6f}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
@@ -1,89 +1,291 @@
 from __future__ import annotations
 
 # Parse C Sharp code and extract class names
-import tree_sitter_c_sharp as tscsharp
+import bisect
+import functools
+import itertools
+import mmap
 
 from collections.abc import Iterator
 from Environment import Environment, Type
-from tree_sitter import Language, Parser, Tree, Node
+from tree_sitter import Language, Node, Parser, Query, Tree
 
-from Resolver import CSEvaluator
+from Blocks import BlockBody
+from Dependencies import DependencyGraph
+from Metadata import Attribute, parse_attribute_list
+from metrics import METRICS
+from Resolver import CSEvaluator, _unquote
+from Scopes import CLASS_KINDS, NAMESPACE_KINDS, TYPE_KINDS, FileEnvironment, Symbol, SymbolTable, qualify
+from Syntax import node_text
 
 
+@functools.cache
+def language() -> Language:
+    """The C# grammar, loaded on first use so that importing this module stays cheap."""
+    import tree_sitter_c_sharp as tscsharp
+    return Language(tscsharp.language())
+
+
+def __getattr__(name: str):
+    # CSHARP_LANGUAGE is still importable, it just loads the grammar when first asked for
+    if name == "CSHARP_LANGUAGE":
+        return language()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class Patterns:
+    """
+    Query patterns compiled on first use. Compiling a query costs about 20 ms whatever its size, so the
+    pending Patterns of a group are compiled together into one query, and matches() only returns the
+    matches of this object's own patterns. Patterns used together belong in one group; the others get
+    their own, so a parse never waits for patterns it does not use (ERROR nodes, the symbol index).
+    """
+    _pending: dict[str, list[Patterns]] = {}
+
+    def __init__(self, source: str, group: str = "extraction"):
+        self.source = source
+        self.group = group
+        self.query: Query | None = None
+        self.pattern_indices: frozenset[int] = frozenset()
+        Patterns._pending.setdefault(group, []).append(self)
+
+    def matches(self, node: Node) -> list[tuple[int, dict[str, list[Node]]]]:
+        if self.query is None:
+            Patterns._compile_pending(self.group)
+        indices = self.pattern_indices
+        return [match for match in self.query.matches(node) if match[0] in indices]
+
+    @classmethod
+    def _compile_pending(cls, group: str):
+        batch = cls._pending.pop(group)
+        starts = []
+        offset = 0
+        for patterns in batch:
+            starts.append(offset)
+            offset += len(patterns.source.encode()) + 1
+        query = language().query("\n".join(patterns.source for patterns in batch))
+        owners: list[set[int]] = [set() for _ in batch]
+        for pattern in range(query.pattern_count):
+            owners[bisect.bisect_right(starts, query.start_byte_for_pattern(pattern)) - 1].add(pattern)
+        for patterns, indices in zip(batch, owners):
+            patterns.query = query
+            patterns.pattern_indices = frozenset(indices)
+
+
+class _LazyParser:
+    """Class attribute holding the tree-sitter Parser, created on first access."""
+
+    def __set_name__(self, owner: type, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner: type) -> Parser:
+        parser = Parser(language())
+        setattr(owner, self.name, parser)  # later lookups find the Parser itself
+        return parser
+
+# Containers of top-level declarations; the traversal for file-level declarations only descends into these
+_NAMESPACE_TYPES = {"compilation_unit", "namespace_declaration", "file_scoped_namespace_declaration", "declaration_list"}
+# Walked to find every type declaration, nested ones included
+_TYPE_SCOPES = _NAMESPACE_TYPES | set(TYPE_KINDS)
+
+# Value of a field declared without an initializer
+_DEFAULT_VALUES = {"string": "", "int": "0", "bool": "false"}
+
+# A member of a class body: (kind, declaration, name, type, value); see CSharpClass._members
+Member = tuple[str, Node, "Node | None", "Node | None", "Node | None"]
+
+
+def _declarators(declaration: Node) -> Iterator[tuple[Node, Node | None]]:
+    """The name and initializer (None without one) of each variable a variable_declaration declares."""
+    for declarator in declaration.named_children:
+        if declarator.type != "variable_declarator":
+            continue
+        name = declarator.child_by_field_name("name")
+        value = None
+        for child in declarator.children:
+            if child.type == "=":
+                value = child.next_named_sibling
+                break
+        if name is not None and name.type == "identifier":
+            yield name, value
+
+
+def source_view(source: str | bytes | bytearray | memoryview | mmap.mmap) -> memoryview:
+    """A read-only byte view of the source, without a UTF-8 byte order mark."""
+    if isinstance(source, str):
+        source = source.encode()
+    view = memoryview(source).cast("B")
+    if view[:3] == b"\xef\xbb\xbf":
+        view = view[3:]
+    return view.toreadonly()
+
+
+def _point_at(source: memoryview, offset: int) -> tuple[int, int]:
+    """Row/column (in bytes) of a byte offset, as tree-sitter expects for edits."""
+    prefix = source[:offset].tobytes()
+    row = prefix.count(b"\n")
+    return row, offset - (prefix.rfind(b"\n") + 1)
+
+
+def _map_range(start: int, end: int, edit_start: int, old_end: int, new_end: int) -> tuple[int, int]:
+    """Where a byte range of the old source ends up after replacing [edit_start, old_end)."""
+    delta = new_end - old_end
+    if end <= edit_start:
+        return start, end
+    if start >= old_end:
+        return start + delta, end + delta
+    return start, end + delta
+
+
+def _find_node(root: Node, start: int, end: int, node_type: str) -> Node | None:
+    """Find the node of the given type spanning exactly [start, end)."""
+    node = root.descendant_for_byte_range(start, end)
+    while node is not None:
+        if node.type == node_type and node.start_byte == start and node.end_byte == end:
+            return node
+        if node.start_byte < start or node.end_byte > end:
+            return None
+        node = node.parent
+    return None
+
+
+_call_keys = itertools.count()
+
+
+def _touches(ranges: list[tuple[int, int]], node: Node) -> bool:
+    return any(r_start <= node.end_byte and r_end >= node.start_byte for r_start, r_end in ranges)
+
 
 class CSharpMethod:
-    def __init__(self, node: Node, source_bytes: bytes, class_ref: 'CSharpClass'):
+    # Compiled once, on first use; the calls can be nested anywhere in the body, so tree-sitter searches for them
+    _endpoint_query = Patterns("""
+    (invocation_expression
+      function: (member_access_expression name: (identifier) @method)
+      arguments: (argument_list . (argument (_) @endpoint)))
+    """)
+
+    def __init__(self, node: Node, source_bytes: memoryview, class_ref: 'CSharpClass', lazy: bool = False):
         self.node = node
         self.source = source_bytes
         self.attributes = []
+        self.parsed_attributes: list[Attribute] = []
         self.method_name = ""
         self.class_ref = class_ref
-        self.environment = Environment(class_ref.environment)
         self.parameters = []  # <-- Add this
-        self._extract_attributes(source_bytes)
-        self._extract_method_name()
-        self._load_methodlevel_variables(source_bytes)
-        self._parse_local_methods()  # NEW
-
-    def _extract_attributes(self, source_bytes: bytes):
+        self.body_expression: str | None = None  # text of an arrow body, compiled once for calls
+        self._block_body: BlockBody | None = None  # a block body, compiled on the first call
+        self._calling = False
+        # Keys this method's results in CSEvaluator.call_cache without keeping the method (and its tree) alive
+        self._call_key = next(_call_keys)
+        self._environment: Environment | None = None
+        with METRICS.phase("method_extraction"):
+            self._extract_attributes(source_bytes)
+            self._extract_method_name(source_bytes)
+            self._extract_parameters(source_bytes)
+            # A lazy method is only a handle (name, attributes, parameters, node) until its environment is needed
+            if not lazy:
+                self._analyze()
+
+    @property
+    def environment(self) -> Environment:
+        if self._environment is None:
+            self._analyze()
+        return self._environment
+
+    @property
+    def analyzed(self) -> bool:
+        return self._environment is not None
+
+    @property
+    def byte_range(self) -> tuple[int, int]:
+        return self.node.start_byte, self.node.end_byte
+
+    def _analyze(self):
+        """Evaluate the parameters, locals and local functions of the body and compile an arrow body."""
+        with METRICS.phase("method_extraction"):
+            self._environment = Environment(self.class_ref.environment)
+            self._load_methodlevel_variables(self._local_statements(), self.source)
+            self._parse_local_methods()  # NEW
+            self._extract_body(self.source)
+
+    def _extract_attributes(self, source_bytes: memoryview):
         for child in self.node.children:
             if child.type == "attribute_list":
-                attr_text = source_bytes[child.start_byte:child.end_byte].decode()
-                self.attributes.append(attr_text)
+                self.attributes.append(node_text(source_bytes, child))
+                self.parsed_attributes.extend(parse_attribute_list(child, source_bytes))
 
-    def _extract_method_name(self):
-        for child in self.node.children:
-            if child.type == "identifier" and child.text:
-                self.method_name = child.text.decode()
-
-    def _load_methodlevel_variables(self, source_bytes: bytes):
+    def endpoints(self) -> list[str]:
+        """
+        The request targets of the method: the evaluated argument of every .To(...) call in it,
+        e.g. Post(request).To($"{GlobalLabShare}/api/Share").
+        """
+        endpoints = []
+        for _, captures in self._endpoint_query.matches(self.node):
+            if node_text(self.source, captures["method"][0]) != "To":
+                continue
+            endpoint = _unquote(CSEvaluator.evaluate(node_text(self.source, captures["endpoint"][0]), self.environment))
+            if endpoint not in endpoints:
+                endpoints.append(endpoint)
+        return endpoints
+
+    def _extract_method_name(self, source_bytes: memoryview):
+        name = self.node.child_by_field_name("name")
+        if name is not None:
+            self.method_name = node_text(source_bytes, name)
+
+    def _extract_parameters(self, source_bytes: memoryview):
+        parameter_list = self.node.child_by_field_name("parameters")
+        if parameter_list is None:
+            return
+        for parameter in parameter_list.named_children:
+            name = parameter.child_by_field_name("name") if parameter.type == "parameter" else None
+            if name is not None:
+                self.parameters.append(node_text(source_bytes, name))  # <-- Track parameter name
+
+    def _local_statements(self) -> list[Node]:
+        """
+        The local declaration and local function statements of the body in source order, nested blocks included
+        but not those of lambdas and local functions. Locals are only declared by statements, so expressions
+        (where the lambdas are) are not searched.
+        """
+        body = self.node.child_by_field_name("body")
+        statements = []
+        stack = [body] if body is not None else []
+        while stack:
+            node = stack.pop()
+            if node.type in ("local_declaration_statement", "local_function_statement"):
+                statements.append(node)
+            elif not node.type.endswith("_expression"):
+                stack.extend(reversed(node.named_children))
+        return statements
+
+    def _load_methodlevel_variables(self, statements: list[Node], source_bytes: memoryview):
         # Parse parameters as variables
-        for child in self.node.children:
-            if child.type == "parameter_list":
-                for param in child.children:
-                    if param.type == "parameter":
-                        var_name = None
-                        for param_child in param.children:
-                            if param_child.type == "identifier" and param_child.text:
-                                var_name = param_child.text.decode()
-                        if var_name:
-                            self.parameters.append(var_name)  # <-- Track parameter name
-                            self.environment.define(var_name, Type("", "string"))
+        for var_name in self.parameters:
+            self.environment.define(var_name, Type("", "string"))
         # Parse local variable declarations in the method body
-        for child in self.node.children:
-            if child.type == "block":
-                self._parse_block_variables(child, source_bytes)
-
-    def _parse_block_variables(self, block_node: Node, source_bytes: bytes):
-        # Recursively parse for local variable declarations and local functions
-        for child in block_node.children:
-            if child.type == "local_declaration_statement":
-                for grandchild in child.children:
-                    if grandchild.type == "variable_declaration":
-                        var_type = None
-                        for decl_child in grandchild.children:
-                            if decl_child.type == "predefined_type":
-                                var_type = source_bytes[decl_child.start_byte:decl_child.end_byte].decode().strip()
-                            elif decl_child.type == "variable_declarator":
-                                var_name = None
-                                var_value = ""
-                                for item in decl_child.children:
-                                    if item.type == "identifier":
-                                        var_name = source_bytes[item.start_byte:item.end_byte].decode()
-                                    elif item.type == "equals_value_clause":
-                                        value_text = source_bytes[item.start_byte:item.end_byte].decode()
-                                        value_text = value_text.lstrip('=').strip()
-                                        var_value = CSEvaluator.evaluate(value_text, self.environment)
-                                if var_name:
-                                    cstype = var_type if var_type else "string"
-                                    self.environment.define(var_name, Type(var_value, cstype))
-            elif child.type == "local_function_statement":
+        self._parse_block_variables(statements, source_bytes)
+
+    def _parse_block_variables(self, statements: list[Node], source_bytes: memoryview):
+        # Local declarations and local functions anywhere in the body, but not inside nested functions or lambdas
+        for statement in statements:
+            if statement.type == "local_function_statement":
                 # Local function: treat like a method
-                local_method = CSharpMethod(child, source_bytes, self.class_ref)
+                local_method = CSharpMethod(statement, source_bytes, self.class_ref)
                 self.environment.define(local_method.method_name, Type(local_method, "method"))
-            elif child.type == "block":
-                # Nested block: recurse
-                self._parse_block_variables(child, source_bytes)
+                continue
+            for declaration in statement.named_children:
+                if declaration.type != "variable_declaration":
+                    continue
+                var_type = declaration.child_by_field_name("type")
+                cstype = "string"
+                if var_type is not None and var_type.type == "predefined_type":
+                    cstype = node_text(source_bytes, var_type).strip()
+                for name, value in _declarators(declaration):
+                    var_value = ""
+                    if value is not None:
+                        var_value = CSEvaluator.evaluate(node_text(source_bytes, value), self.environment)
+                    self.environment.define(node_text(source_bytes, name), Type(var_value, cstype))
 
     def _parse_local_methods(self):
         # Already handled in _parse_block_variables for local functions
@@ -97,19 +299,96 @@ class CSharpMethod:
             if isinstance(value, Type) and value.cstype == "method":
                 yield value.value
 
+    def _local_methods(self) -> list['CSharpMethod']:
+        """Local functions found so far, without analyzing a lazy method."""
+        return list(self.get_methods()) if self.analyzed else []
+
+    def _extract_body(self, source_bytes: memoryview):
+        body = self.node.child_by_field_name("body")
+        if body is not None and body.type == "arrow_expression_clause" and body.named_child_count:
+            expression = body.named_children[0]
+            self.body_expression = node_text(source_bytes, expression)
+            self._compiled_body = CSEvaluator.compile(self.body_expression)
+
+    def has_block_body(self) -> bool:
+        return any(child.type == "block" for child in self.node.children)
+
+    @property
+    def block_body(self) -> BlockBody | None:
+        """
+        The compiled block body of a method returning string or another predefined type (the URL helpers);
+        None for other methods, whose results are objects rather than values.
+        """
+        if self._block_body is None:
+            body = self.node.child_by_field_name("body")
+            returns = self.node.child_by_field_name("returns") or self.node.child_by_field_name("type")
+            if body is None or body.type != "block" or returns is None or returns.type != "predefined_type":
+                return None
+            self._block_body = BlockBody(body, self.source, self.parameters)
+        return self._block_body
+
+    def references(self) -> set[str]:
+        """Names a call depends on: what the body refers to, apart from parameters and locals."""
+        if self.body_expression is not None:
+            return set(CSEvaluator.references(self.body_expression)) - set(self.parameters)
+        block_body = self.block_body
+        return block_body.references() if block_body is not None else set()
+
+    def _spans(self) -> Iterator[tuple['CSharpMethod', int, int]]:
+        yield self, self.node.start_byte, self.node.end_byte
+        for local_method in self._local_methods():
+            yield from local_method._spans()
+
+    def _rebind(self, node: Node, source_bytes: memoryview, spans: dict[int, tuple[int, int]]):
+        """
+        Point an unchanged method (and its local functions) at the node for it in a reparsed tree.
+        Its environment is kept as is.
+        """
+        for local_method in self._local_methods():
+            local_node = _find_node(node, *spans[id(local_method)], local_method.node.type)
+            if local_node is not None:
+                local_method._rebind(local_node, source_bytes, spans)
+        self.node = node
+        self.source = source_bytes
+
     def call(self, args, calling_env):
+        arg_values = [CSEvaluator.evaluate(pval, calling_env) for pval in args[:len(self.parameters)]]
+        return self.invoke(arg_values)
+
+    def invoke(self, arg_values: list[str]) -> str | None:
+        """
+        Evaluate the body with the parameters bound to already evaluated argument values: an arrow body,
+        or a block body as far as BlockBody can follow it (None otherwise, and for a recursive call).
+        Results are cached per (method, argument values) in CSEvaluator.call_cache, unless something was unresolved.
+        """
+        block_body = self.block_body if self.body_expression is None else None
+        if (self.body_expression is None and block_body is None) or self._calling:
+            return None
+        key = (self._call_key, tuple(arg_values))
+        result = CSEvaluator.call_cache.get(key)
+        if result is not None:
+            return result
+
         # Create a new environment for the call, with the class environment as enclosing
         call_env = Environment(self.class_ref.environment)
-        for pname, pval in zip(self.parameters, args):
-            arg_val = CSEvaluator.evaluate(pval, calling_env)
+        for pname, arg_val in zip(self.parameters, arg_values):
             call_env.define(pname, Type(arg_val, "string"))
-        # Find the arrow_expression_clause
-        for child in self.node.children:
-            if child.type == "arrow_expression_clause":
-                expr = self.source[child.start_byte:child.end_byte].decode().replace("=>", "").strip()
-                return CSEvaluator.evaluate(expr, call_env)
-        # (Optional: handle block bodies)
-        return None
+        unresolved = CSEvaluator.unresolved_count
+        self._calling = True
+        try:
+            if block_body is None:
+                result = self._compiled_body(call_env)
+            else:
+                if block_body.has_local_functions:
+                    for name, value in self.environment.values.items():
+                        if value.cstype == "method":
+                            call_env.define(name, value)
+                result = block_body.run(call_env)
+        finally:
+            self._calling = False
+        if result is not None and CSEvaluator.unresolved_count == unresolved:
+            CSEvaluator.call_cache.put(key, result)
+        return result
 
 
 class CSharpClass:
@@ -119,228 +398,254 @@ class CSharpClass:
     super_class_name: str  # <-- Add this
     environment: Environment
 
-    def __init__(self, node: Node, source_bytes: bytes, globals: Environment | None = None):
+    def __init__(self, node: Node, source_bytes: memoryview, globals: Environment | None = None, lazy: bool = False,
+                 qualified_name: str | None = None):
         self.node = node
         self.source = source_bytes  # Add this line
+        self.lazy = lazy  # block-bodied methods are analyzed on first use of their environment
         self.attributes = []
+        self.parsed_attributes: list[Attribute] = []
         self.class_name = ""
         self.super_class_name = ""  # <-- Initialize
-        self.environment = Environment(globals)
-        self._extract_attributes(source_bytes)
-        self._extract_class_name()
-        self._extract_super_class_name(source_bytes)  # <-- Add this
-        self._load_classlevel_variables(source_bytes)
-        self._parse_method_declarations()  # NEW
-
-    def _extract_attributes(self, source_bytes: bytes):
+        with METRICS.phase("class_extraction"):
+            self._extract_attributes(source_bytes)
+            self._extract_class_name(source_bytes)
+            self.qualified_name = qualified_name or self.class_name  # with its namespace and enclosing types
+            self._extract_super_class_name(source_bytes)  # <-- Add this
+            # Members inherited from a base class in another file, when the globals include a symbol index
+            if self.super_class_name and globals is not None:
+                globals = globals.inherited_scope(self.super_class_name, globals) or globals
+            self.environment = Environment(globals)
+            self.dependencies = DependencyGraph(self.environment)
+            members = self._members()
+            self._load_classlevel_variables(members, source_bytes)
+            # Block-bodied methods are defined before the fields are resolved, so initializers can call them,
+            # and analyzed after, since their locals may refer to the fields
+            methods = self._parse_method_declarations(members)
+            self._resolve_classlevel_variables()
+            if not self.lazy:
+                for method in methods:
+                    method.environment
+
+    def _extract_attributes(self, source_bytes: memoryview):
         for child in self.node.children:
             if child.type == "attribute_list":
-                attr_text = source_bytes[child.start_byte:child.end_byte].decode()
+                attr_text = node_text(source_bytes, child)
                 self.attributes.append(attr_text)
+                self.parsed_attributes.extend(parse_attribute_list(child, source_bytes))
 
-    def _extract_class_name(self):
-        for child in self.node.children:
-            if child.type == "identifier" and child.text:
-                self.class_name = child.text.decode()
+    def _extract_class_name(self, source_bytes: memoryview):
+        name = self.node.child_by_field_name("name")
+        if name is not None:
+            self.class_name = node_text(source_bytes, name)
 
-    def _extract_super_class_name(self, source_bytes: bytes):
+    def _extract_super_class_name(self, source_bytes: memoryview):
         for child in self.node.children:
             if child.type == "base_list":
                 # base_list: ':' base_type (',' base_type)*
                 for base_child in child.children:
                     # The first identifier under base_list is usually the superclass
-                    if base_child.type == "identifier" and base_child.text:
-                        self.super_class_name = base_child.text.decode()
+                    if base_child.type == "identifier":
+                        self.super_class_name = node_text(source_bytes, base_child)
                         return
                     # Fallback: check for base_type → identifier
                     if base_child.type == "base_type":
                         for t in base_child.children:
-                            if t.type == "identifier" and t.text:
-                                self.super_class_name = t.text.decode()
+                            if t.type == "identifier":
+                                self.super_class_name = node_text(source_bytes, t)
                                 return
 
-    def _load_classlevel_variables(self, source_bytes: bytes):
-        var_decls_types = CSharpFile.var_decl_types
-
-        class_body: Node | None = None
-        for child in self.node.children:
-            if child.type == "declaration_list":
-                class_body = child
-                break
-
+    def _members(self) -> list[Member]:
+        """
+        This class's own fields (one per declarator), properties with a value and methods, in source order.
+        Members are direct children of the class body, so no query is needed (one would also search every method body).
+        """
+        class_body = self.node.child_by_field_name("body")
         if class_body is None:
             raise Exception(f"No Class Body in {self.class_name}")
 
-        for child in class_body.children:
-            # Handle block scoping (if needed, e.g., in method parsing)
-            # if child.type == "{":
-            #     self.environment = Environment()
-            # elif child.type == "}":
-            #     if self.environment.enclosing:
-            #         self.environment = self.environment.enclosing
-
-            if child.type in var_decls_types:
-                if child.type == "field_declaration":
-                    for inner in child.children:
-                        # Variable declaration
-                        if inner.type == "variable_declaration":
-                            var_name = ""
-                            var_value = ""
-                            for declarator in inner.children:
-                                # declarator can be predefined_type or implicit_type (var)
-
-                                if declarator.type == "predefined_type":
-                                    predef_type = source_bytes[declarator.start_byte:declarator.end_byte].decode().strip()
-                                    match predef_type:
-                                        case "string":
-                                            var_value = ""
-                                        case "int":
-                                            var_value = "0"
-                                        case "bool":
-                                            var_value = "false"
-                                elif declarator.type == "implicit_type":
-                                    # For var declarations, we need to look at the initializer to determine the value
-                                    var_value = ""  # Default for var without initializer
-
-                                if declarator.type != "variable_declarator" and declarator.type != "identifier":
-                                    continue
-
-                                if declarator.type == "variable_declarator":
-                                    for item in declarator.children:
-                                        if item.type == "identifier":
-                                            var_name = source_bytes[item.start_byte:item.end_byte].decode()
-                                        elif item.type == "=":
-                                            # Get the value after '='
-                                            # Find the next sibling or look ahead for the value
-                                            equals_pos = item.end_byte
-                                            # Look for the value after the equals sign
-                                            remaining_text = source_bytes[equals_pos:inner.end_byte].decode().strip()
-                                            if remaining_text:
-                                                # Resolve the expression using the evaluator
-                                                var_value = CSEvaluator.evaluate(remaining_text, self.environment)
-                                    else:
-                                        # Check if this item has a value (like literal expressions)
-                                        if hasattr(item, 'text') and item.text:
-                                            var_value = item.text.decode()
-
-                                    if var_name:
-                                        # Create a Type object for the value
-                                        from Environment import Type
-                                        cstype = CSEvaluator._determine_type(var_value)
-                                        type_obj = Type(var_name, cstype)
-                                        self.environment.define(var_name, type_obj)
-                                        f"defined: {var_name} {var_value}"
-                                else:
-                                    # assignment
-                                    var_name = source_bytes[declarator.start_byte:declarator.end_byte].decode()
-                                    raw_value = source_bytes[declarator.end_byte:inner.end_byte].decode().strip().lstrip("=").strip()
-                                    # Resolve the expression using the evaluator
-                                    var_value = CSEvaluator.evaluate(raw_value, self.environment)
-                                    
-                                    if var_name:
-                                        # Create a Type object for the value
-                                        cstype = CSEvaluator._determine_type(var_value)
-                                        type_obj = Type(var_name, cstype)
-                                        self.environment.assign(var_name, type_obj)
-                
-                elif child.type == "property_declaration":
-                    # Handle property declarations with arrow expressions
-                    self._parse_property_declaration(child, source_bytes)
-                
-                elif child.type == "method_declaration":
-                    # Handle method declarations with arrow expressions
-                    self._parse_method_declaration(child, source_bytes)
-                else:
-                    pass
-
-    def _parse_method_declarations(self):
-        """
-        Parse all method_declaration nodes in the class and add them to the environment.
+        members = []
+        for child in class_body.named_children:
+            if child.type == "field_declaration":
+                for declaration in child.named_children:
+                    if declaration.type == "variable_declaration":
+                        var_type = declaration.child_by_field_name("type")
+                        members.extend(("field", child, name, var_type, value) for name, value in _declarators(declaration))
+            elif child.type == "property_declaration":
+                name, value = child.child_by_field_name("name"), child.child_by_field_name("value")
+                if value is not None and value.type == "arrow_expression_clause":
+                    value = value.named_children[0] if value.named_child_count else None
+                elif child.child_by_field_name("accessors") is None:
+                    value = None
+                if name is not None and value is not None:
+                    members.append(("property", child, name, None, value))
+            elif child.type == "method_declaration":
+                members.append(("method", child, None, None, None))
+        return members
+
+    def _load_classlevel_variables(self, members: list[Member], source_bytes: memoryview):
+        """
+        Declare fields and properties with their initializers (evaluated later, in dependency order)
+        and define arrow-bodied methods.
+        """
+        for kind, node, name, var_type, value in members:
+            if kind == "field":
+                self._parse_field_declarator(name, var_type, value, source_bytes)
+            elif kind == "property":
+                # Handle property declarations with arrow expressions or initializers
+                self._parse_property_declaration(name, value, source_bytes)
+            else:
+                # Handle method declarations with arrow expressions
+                self._parse_method_declaration(node, source_bytes)
+
+    def _declare(self, var_name: str, initializer: str):
+        # Placeholder keeps the declaration order of the environment until the graph evaluates it
+        self.environment.define(var_name, Type(initializer, "unknown"))
+        self.dependencies.add(var_name, initializer, ())
+
+    def _parse_field_declarator(self, name: Node, var_type: Node, value: Node | None, source_bytes: memoryview):
+        var_name = node_text(source_bytes, name)
+        if value is not None:
+            initializer = node_text(source_bytes, value)
+        else:
+            initializer = _DEFAULT_VALUES.get(node_text(source_bytes, var_type).strip(), "")
+        self._declare(var_name, initializer)
+
+    def _resolve_classlevel_variables(self):
+        """Build the dependency graph of the declared fields and properties and evaluate each once, in topological order."""
+        for var_name, initializer in list(self.dependencies.initializers.items()):
+            self.dependencies.add(var_name, initializer, self._references(initializer))
+        self.dependencies.evaluate_all()
+
+    def _references(self, expression: str) -> set[str]:
+        """
+        Names an initializer depends on. A call to a method of this class also depends on
+        whatever the method body refers to, apart from its parameters and locals.
+        """
+        found = set()
+        pending = list(CSEvaluator.references(expression))
+        while pending:
+            name = pending.pop()
+            if name in found:
+                continue
+            found.add(name)
+            type_obj = self.environment.values.get(name)
+            if type_obj is not None and type_obj.cstype == "method":
+                pending.extend(type_obj.value.references())
+        return found
+
+    def set_initializer(self, var_name: str, expression: str) -> list[str]:
+        """
+        Change (or add) the initializer of a field or property and re-evaluate it and everything downstream of it.
+        Returns the re-evaluated names.
+        """
+        if var_name not in self.environment.values:
+            self.environment.define(var_name, Type(expression, "unknown"))
+        self.dependencies.add(var_name, expression, self._references(expression))
+        return self.dependencies.reevaluate([var_name])
+
+    def reevaluate(self, changed: list[str]) -> list[str]:
+        """
+        Re-evaluate only the fields and properties downstream of the changed names (e.g. globals that were redefined).
+        Returns the re-evaluated names.
+        """
+        return self.dependencies.reevaluate(changed)
+
+    def _parse_method_declarations(self, members: list[Member]) -> list['CSharpMethod']:
+        """
+        Parse the method_declaration nodes in the class that are not arrow-bodied and add them to the environment.
+        Arrow-bodied methods are defined in declaration order with the class-level variables, so later initializers can call them.
+        The methods are returned as handles, not analyzed yet (in lazy mode they stay so until their environment is used).
+        """
+        methods = []
+        for kind, node, *_ in members:
+            if kind == "method" and not self._is_arrow_method(node):
+                method = CSharpMethod(node, self.source, self, lazy=True)
+                self.environment.define(method.method_name, Type(method, "method"))
+                methods.append(method)
+        return methods
+
+    @staticmethod
+    def _is_arrow_method(node: Node) -> bool:
+        body = node.child_by_field_name("body")
+        return body is not None and body.type == "arrow_expression_clause"
+
+    def _parse_property_declaration(self, name: Node, value: Node, source_bytes: memoryview):
+        """Declare property declarations with arrow expressions or initializers"""
+        var_name = node_text(source_bytes, name)
+        var_value = node_text(source_bytes, value).strip()
+
+        if var_name and var_value:
+            self._declare(var_name, var_value)
+
+    def _parse_method_declaration(self, node: Node, source_bytes: memoryview):
+        """Define arrow-bodied methods so that initializers declared after them can call them"""
+        if self._is_arrow_method(node):
+            method = CSharpMethod(node, source_bytes, self)
+            self.environment.define(method.method_name, Type(method, "method"))
+
+    def _spans(self) -> Iterator[tuple['CSharpClass | CSharpMethod', int, int]]:
+        yield self, self.node.start_byte, self.node.end_byte
+        for method in self.get_methods():
+            yield from method._spans()
+
+    def _rebind(self, node: Node, source_bytes: memoryview, spans: dict[int, tuple[int, int]]) -> bool:
+        """
+        Point an unchanged class and its methods at their nodes in a reparsed tree.
+        Returns False if a method could not be found again.
+        """
+        for method in list(self.get_methods()):
+            method_node = _find_node(node, *spans[id(method)], "method_declaration")
+            if method_node is None:
+                return False
+            method._rebind(method_node, source_bytes, spans)
+        self.node = node
+        self.source = source_bytes
+        return True
+
+    def _apply_edit(self, node: Node, source_bytes: memoryview, spans: dict[int, tuple[int, int]],
+                    ranges: list[tuple[int, int]]) -> list['CSharpMethod'] | None:
+        """
+        Update the class after an edit inside it, rebuilding only the block-bodied methods the edit touched.
+        Returns the rebuilt methods, or None if the class itself has to be rebuilt
+        (the edit touched a field, property, arrow-bodied method or the class header).
         """
+        ranges = [(r_start, r_end) for r_start, r_end in ranges if r_start <= node.end_byte and r_end >= node.start_byte]
+        old_members = [member.type for member in self._member_nodes()]
+        if not self._rebind(node, source_bytes, spans):
+            return None
+        # Members added or removed (e.g. a new method) also require a rebuild
+        if [member.type for member in self._member_nodes()] != old_members:
+            return None
+
+        touched = [method for method in self.get_methods() if _touches(ranges, method.node)]
+        for r_start, r_end in ranges:
+            inside = [m for m in touched if m.node.start_byte <= r_start and r_end <= m.node.end_byte]
+            if not inside or not all(m.has_block_body() for m in inside):
+                return None
+
+        rebuilt = []
+        for method in touched:
+            new_method = CSharpMethod(method.node, source_bytes, self, self.lazy)
+            self.environment.replace_values({
+                (new_method.method_name if name == method.method_name else name):
+                (Type(new_method, "method") if name == method.method_name else value)
+                for name, value in self.environment.values.items()
+            })
+            rebuilt.append(new_method)
+        # Fields and properties calling a rebuilt method (directly or through another method) depend on its body
+        self.dependencies.reevaluate([method.method_name for method in rebuilt])
+        return rebuilt
+
+    def _member_nodes(self) -> list[Node]:
         for child in self.node.children:
             if child.type == "declaration_list":
-                for member in child.children:
-                    if member.type == "method_declaration":
-                        method = CSharpMethod(member, self.source, self)
-                        self.environment.define(method.method_name, Type(method, "method"))
-
-    def _parse_property_declaration(self, node: Node, source_bytes: bytes):
-        """Parse property declarations with arrow expressions"""
-        var_name = ""
-        var_value = ""
-        
-        for child in node.children:
-            if child.type == "identifier":
-                var_name = source_bytes[child.start_byte:child.end_byte].decode()
-            elif child.type == "arrow_expression_clause":
-                # Extract the expression after =>
-                expression_text = source_bytes[child.start_byte:child.end_byte].decode()
-                # Remove the "=>" part
-                var_value = expression_text.replace("=>", "").strip()
-                break
-        
-        if var_name and var_value:
-            try:
-                # Try to resolve the expression
-                resolved_value = CSEvaluator.evaluate(var_value, self.environment)
-                from Environment import Type
-                cstype = CSEvaluator._determine_type(resolved_value)
-                type_obj = Type(resolved_value, cstype)
-                self.environment.define(var_name, type_obj)
-            except Exception as e:
-                print(f"COULD NOT BE RESOLVED: {var_name} = {var_value}")
-                print(f"Error: {e}")
-                # Store the unresolved value
-                from Environment import Type
-                type_obj = Type(var_value, "unknown")
-                print(self.environment.define(var_name, type_obj))
-    
-    def _parse_method_declaration(self, node: Node, source_bytes: bytes):
-        """Parse method declarations with arrow expressions"""
-        var_name = ""
-        var_value = ""
-        parameter_env = Environment()
-        
-        for child in node.children:
-            child_token_name = source_bytes[child.start_byte:child.end_byte].decode()
-            if child.type == "identifier":
-                var_name = source_bytes[child.start_byte:child.end_byte].decode()
-            elif child.type == "arrow_expression_clause":
-                # Extract the expression after =>
-                expression_text = source_bytes[child.start_byte:child.end_byte].decode()
-                # Remove the "=>" part
-                var_value = expression_text.replace("=>", "").strip()
-                break
-            elif child.type == "parameter_list":
-                for grandChild in child.children:
-                    grandChildType = grandChild.type
-                    if grandChildType == "parameter":
-                        param = source_bytes[grandChild.start_byte:grandChild.end_byte].decode()
-                        from Environment import Type
-                        parameter_env.define(param, Type(None, ""))
-
-        
-        if var_name and var_value:
-            try:
-                # Try to resolve the expression
-                resolved_value = CSEvaluator.evaluate(var_value, self.environment)
-                from Environment import Type
-                cstype = CSEvaluator._determine_type(resolved_value)
-                type_obj = Type(resolved_value, cstype)
-                self.environment.define(var_name, type_obj)
-            except Exception as e:
-                print(f"COULD NOT BE RESOLVED: {var_name} = {var_value}")
-                print(f"Error: {e}")
-                # Store the unresolved value
-                from Environment import Type
-                type_obj = Type(var_value, "unknown")
-                print(self.environment.define(var_name, type_obj))
+                return [member for member in child.children if member.is_named]
+        return []
 
     def resolve_all(self):
-        for var_name, type_obj in self.environment.values.items():
-            assert(isinstance(type_obj.value, str))
-            resolved = CSEvaluator.evaluate(type_obj.value, self.environment)
-            type_obj.value = resolved
+        """Evaluate every field and property again, each once, in dependency order."""
+        self.dependencies.reevaluate(self.dependencies.initializers)
 
     def get_methods(self) -> Iterator['CSharpMethod']:
         """
@@ -350,6 +655,50 @@ class CSharpClass:
             if isinstance(value, Type) and isinstance(value.value, CSharpMethod):
                 yield value.value
 
+class ParseLimitError(Exception):
+    """A file went over one of its ParseLimits and was not extracted; the message says which."""
+
+
+class ParseLimits:
+    """
+    Bounds on the work spent on one file: its size in bytes, the time tree-sitter may take to parse it
+    (in seconds), and the share of its bytes inside ERROR nodes. None means no bound.
+    Going over max_bytes or parse_timeout raises ParseLimitError; going over max_error_ratio
+    downgrades the file to metadata-only extraction (method bodies are not evaluated).
+    """
+
+    def __init__(self, max_bytes: int | None = None, parse_timeout: float | None = None,
+                 max_error_ratio: float | None = None):
+        self.max_bytes = max_bytes
+        self.parse_timeout = parse_timeout
+        self.max_error_ratio = max_error_ratio
+
+    def check_size(self, size: int):
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise ParseLimitError(f"{size} bytes is over the limit of {self.max_bytes} bytes")
+
+    def __repr__(self) -> str:
+        return f"ParseLimits({self.max_bytes!r}, {self.parse_timeout!r}, {self.max_error_ratio!r})"
+
+
+def parse_tree(source: memoryview, timeout: float | None = None) -> Tree:
+    """Parse with the shared parser; raises ParseLimitError when it takes longer than timeout seconds."""
+    parser = CSharpFile.parser
+    parser.timeout_micros = int(timeout * 1_000_000) if timeout else 0
+    try:
+        return parser.parse(source)
+    except ValueError:
+        if not timeout:
+            raise
+        # A timeout makes the parse fail; the parser would resume the abandoned parse next time
+        parser.reset()
+        if METRICS.enabled:
+            METRICS.count("parse_timeouts")
+        raise ParseLimitError(f"parsing took longer than {timeout:g}s") from None
+    finally:
+        parser.timeout_micros = 0
+
+
 class CSharpFile:
     """
     Intakes a CS file's source code and global environment with variables defined outside of the file.
@@ -358,31 +707,147 @@ class CSharpFile:
     Skips the evaluation of Class Nodes to let CSharpClass handle it.
 
     Functionality to return all the classes within the file.
+
+    The source may be text, bytes or a memory-mapped file. It is kept as one memoryview shared by
+    every class and method, and only the spans that are needed get decoded.
     """
     var_decl_types = ["field_declaration", "property_declaration", "method_declaration"]  # , "event_field_declaration" ## support not needed now
 
-    language = Language(tscsharp.language())
-    parser = Parser(language)
-
-    def __init__(self, source_code: str, globals: Environment | None = None):
-        self.source = source_code.encode()
-        self.tree: Tree = self.parser.parse(self.source)
-        self.environment = Environment(globals)  # file-level environment
-        self._parse_file_level_declarations()
+    parser = _LazyParser()
+    _error_query = Patterns("(ERROR) @error", group="errors")
+
+    def __init__(self, source_code: str | bytes | memoryview | mmap.mmap, globals: Environment | None = None,
+                 lazy: bool = False, limits: ParseLimits | None = None):
+        self.source = source_view(source_code)
+        self.lazy = lazy
+        self.downgraded: str | None = None  # why a file was extracted as metadata only, see ParseLimits
+        self._text: str | None = None
+        if limits is not None:
+            limits.check_size(len(self.source))
+        with METRICS.phase("parse"):
+            self.tree: Tree = parse_tree(self.source, limits.parse_timeout if limits is not None else None)
+        if METRICS.enabled:
+            METRICS.count("error_nodes", self.count_error_nodes())
+        if limits is not None and limits.max_error_ratio is not None and self.tree.root_node.has_error:
+            ratio = self.error_ratio()
+            if ratio > limits.max_error_ratio:
+                self.lazy = True
+                self.downgraded = f"{ratio:.0%} of the source is in ERROR nodes (limit {limits.max_error_ratio:.0%})"
+        # Declarations by qualified name, and the file-level environment looking up Type.Member names in them
+        self.symbols = SymbolTable(self._build_class)
+        self.environment = FileEnvironment(self.symbols, globals)
+        with METRICS.phase("traversal"):
+            self._parse_file_level_declarations()
+
+    def error_ratio(self) -> float:
+        """Share of the source bytes inside ERROR nodes (nested ones counted once)."""
+        if not self.tree.root_node.has_error or not self.source:
+            return 0.0
+        covered = 0
+        end = 0
+        errors = sorted((node.start_byte, node.end_byte) for _, captures in self._error_query.matches(self.tree.root_node)
+                        for node in captures["error"])
+        for start, stop in errors:
+            start = max(start, end)
+            if stop > start:
+                covered += stop - start
+                end = stop
+        return covered / len(self.source)
+
+    def count_error_nodes(self) -> int:
+        """Number of ERROR nodes tree-sitter inserted to recover from syntax errors."""
+        if not self.tree.root_node.has_error:
+            return 0
+        return sum(len(captures["error"]) for _, captures in self._error_query.matches(self.tree.root_node))
 
     def _parse_file_level_declarations(self):
         """
-        Parse the file for top-level variable and method declarations (outside any class).
-        When a class is found, instantiate it and add to the environment.
+        Declare the namespaces, using directives, types (nested ones too) and enum members of the file in
+        its symbol table and file-level fields in its environment, then build a CSharpClass for every class,
+        struct and record with a body, in source order.
         """
-        for node in self._traverse():
-            if node.type == "class_declaration":
-                csharp_class = CSharpClass(node, self.source, self.environment)
-                self.environment.define(csharp_class.class_name, Type(csharp_class, "class"))
-            elif node.type == "field_declaration":
-                self._parse_variable_declaration(node)
+        self._declare(self.tree.root_node, "")
+        for symbol in list(self.symbols.types()):
+            self._build_class(symbol)
+
+    def _declare(self, node: Node, scope: str):
+        for child in node.named_children:
+            kind = child.type
+            if kind in TYPE_KINDS:
+                self._declare_type(child, scope, [])
+            elif kind in NAMESPACE_KINDS:
+                name = qualify(scope, node_text(self.source, child.child_by_field_name("name")))
+                self.symbols.add(Symbol(name, "namespace", scope))
+                if kind == "file_scoped_namespace_declaration":
+                    scope = name  # the declarations after it are in the namespace
+                    self._declare(child, scope)
+                elif (body := child.child_by_field_name("body")) is not None:
+                    self._declare(body, name)
+            elif kind == "using_directive":
+                self._declare_using(child, scope)
+            elif kind == "field_declaration":
+                self._parse_variable_declaration(child)
             # You can add support for property_declaration or method_declaration at file level if needed
 
+    def _declare_using(self, node: Node, scope: str):
+        """using A.B; imports a namespace, using X = A.B.C; declares an alias (using static is not followed)."""
+        if any(child.type == "static" for child in node.children):
+            return
+        alias = node.child_by_field_name("name")
+        target = [child for child in node.named_children if child != alias]
+        if target:
+            self.symbols.add_using(scope, node_text(self.source, target[-1]), node_text(self.source, alias) if alias is not None else None)
+
+    def _declare_type(self, node: Node, scope: str, type_path: list[str]):
+        name_node = node.child_by_field_name("name")
+        if name_node is None:
+            return
+        name = node_text(self.source, name_node)
+        qualified = qualify(scope, name)
+        kind = TYPE_KINDS[node.type]
+        body = node.child_by_field_name("body")
+        type_path = type_path + [name]
+        self.symbols.add(Symbol(qualified, kind, scope, node if kind in CLASS_KINDS and body is not None else None), type_path)
+        if body is None:
+            return
+        for member in body.named_children:
+            if member.type in TYPE_KINDS:
+                self._declare_type(member, qualified, type_path)
+            elif member.type == "enum_member_declaration":
+                member_name = node_text(self.source, member.child_by_field_name("name"))
+                value = member.child_by_field_name("value")
+                # Like Symbols.Declaration: the value as written, or the member name
+                result = CSEvaluator.evaluate(node_text(self.source, value), self.environment) if value is not None else f'"{member_name}"'
+                self.symbols.add(Symbol(qualify(qualified, member_name), "enum_member", qualified,
+                                        value=Type(result, CSEvaluator._determine_type(result))))
+
+    def _build_class(self, symbol: Symbol) -> CSharpClass | None:
+        """
+        The CSharpClass of a class, struct or record, built on first use: in source order, or earlier when
+        another class refers to its members. A nested type encloses the environment of the type around it.
+        """
+        if symbol.value is not None or symbol.node is None or symbol.building:
+            return symbol.value
+        symbol.building = True
+        environment = self.environment
+        container = self.symbols.get(symbol.container)
+        if container is not None and container.kind in CLASS_KINDS:
+            outer = self._build_class(container)
+            if outer is not None:
+                environment = outer.environment
+        csharp_class = CSharpClass(symbol.node, self.source, environment, self.lazy, symbol.name)
+        symbol.value, symbol.node, symbol.building = csharp_class, None, False
+        self.environment.define(symbol.name, Type(csharp_class, "class"))
+        return csharp_class
+
+    def _nests(self, csharp_class: CSharpClass) -> bool:
+        """Whether a class is nested in another type or has types nested in it."""
+        symbol = self.symbols.get(csharp_class.qualified_name)
+        container = self.symbols.get(symbol.container) if symbol is not None else None
+        if container is not None and container.kind != "namespace":
+            return True
+        return any(member.kind in TYPE_KINDS.values() for member in self.symbols.members(csharp_class.qualified_name))
+
     def _parse_variable_declaration(self, node: Node):
         """
         Parse a field_declaration node at the file level and add variables to the environment.
@@ -392,16 +857,16 @@ class CSharpFile:
                 var_type = None
                 for decl_child in child.children:
                     if decl_child.type == "predefined_type":
-                        var_type = self.source[decl_child.start_byte:decl_child.end_byte].decode().strip()
+                        var_type = node_text(self.source, decl_child).strip()
                     elif decl_child.type == "variable_declarator":
                         var_name = None
                         var_value = ""
                         for item in decl_child.children:
                             if item.type == "identifier":
-                                var_name = self.source[item.start_byte:item.end_byte].decode()
+                                var_name = node_text(self.source, item)
                             elif item.type == "equals_value_clause":
                                 # Get the value after '='
-                                value_text = self.source[item.start_byte:item.end_byte].decode()
+                                value_text = node_text(self.source, item)
                                 # Remove '=' and whitespace
                                 value_text = value_text.lstrip('=').strip()
                                 # Evaluate the value using CSEvaluator if needed
@@ -412,28 +877,119 @@ class CSharpFile:
                             cstype = var_type if var_type else "string"
                             self.environment.define(var_name, Type(var_value, cstype))
 
+    def apply_edit(self, start: int, old_end: int, new_end: int, new_text: str) -> list[CSharpClass | CSharpMethod]:
+        """
+        Replace the source bytes [start, old_end) with new_text (ending at new_end in the new source),
+        reparse incrementally from the old tree and rebuild only the classes and methods the edit changed.
+        Everything else keeps its environment. Returns the rebuilt classes and methods.
+        """
+        new_bytes = new_text.encode()
+        if not 0 <= start <= old_end <= len(self.source) or new_end != start + len(new_bytes):
+            raise ValueError(f"Invalid edit: start={start}, old_end={old_end}, new_end={new_end}, {len(new_bytes)} new bytes")
+
+        # Where every class and method ends up in the new source, taken before the tree is edited
+        spans = {
+            id(obj): _map_range(obj_start, obj_end, start, old_end, new_end)
+            for csharp_class in self.get_classes() for obj, obj_start, obj_end in csharp_class._spans()
+        }
+        old_source = self.source
+        self.source = source_view(b"".join((old_source[:start], new_bytes, old_source[old_end:])))
+        self._text = None
+        self.tree.edit(
+            start_byte=start, old_end_byte=old_end, new_end_byte=new_end,
+            start_point=_point_at(old_source, start),
+            old_end_point=_point_at(old_source, old_end),
+            new_end_point=_point_at(self.source, new_end),
+        )
+        new_tree = self.parser.parse(self.source, self.tree)
+        # changed_ranges only covers structural changes, so add the edited text itself
+        ranges = [(r.start_byte, r.end_byte) for r in self.tree.changed_ranges(new_tree)]
+        ranges.append((start, new_end))
+        self.tree = new_tree
+
+        classes = list(self.get_classes())
+        class_nodes = [node for node in self._traverse(descend=_TYPE_SCOPES)
+                       if TYPE_KINDS.get(node.type) in CLASS_KINDS and node.child_by_field_name("body") is not None]
+        new_nodes = [_find_node(new_tree.root_node, *spans[id(csharp_class)], csharp_class.node.type) for csharp_class in classes]
+        if len(class_nodes) != len(classes) or any(node is None for node in new_nodes):
+            # Classes were added or removed: rebuild the whole file
+            return self._rebuild()
+        # An edit outside the classes (a using directive, an enum, a file-level field) or in a class that
+        # nests or is nested in another type may change what other classes resolve: rebuild the whole file
+        flat = [node for csharp_class, node in zip(classes, new_nodes) if not self._nests(csharp_class)]
+        if not all(any(_touches([edited], node) for node in flat) for edited in ranges):
+            return self._rebuild()
+
+        rebuilt: list[CSharpClass | CSharpMethod] = []
+        for csharp_class, node in zip(classes, new_nodes):
+            if not _touches(ranges, node):
+                csharp_class._rebind(node, self.source, spans)
+                continue
+            methods = csharp_class._apply_edit(node, self.source, spans, ranges)
+            if methods is not None:
+                rebuilt.extend(methods)
+                continue
+            # Other classes of the file may resolve Name.Member through this one
+            name = csharp_class.class_name.encode()
+            if any(other is not node and name in bytes(self.source[other.start_byte:other.end_byte]) for other in new_nodes):
+                return self._rebuild()
+            new_class = CSharpClass(node, self.source, self.environment, self.lazy, csharp_class.qualified_name)
+            if new_class.class_name != csharp_class.class_name:
+                return self._rebuild()  # renamed: its qualified name and the names resolving to it changed
+            self.symbols.get(new_class.qualified_name).value = new_class
+            self.environment.define(new_class.qualified_name, Type(new_class, "class"))
+            rebuilt.append(new_class)
+        return rebuilt
+
+    def _rebuild(self) -> list[CSharpClass]:
+        self.symbols = SymbolTable(self._build_class)
+        self.environment = FileEnvironment(self.symbols, self.environment.enclosing)
+        self._parse_file_level_declarations()
+        return list(self.get_classes())
+
+    @property
+    def text(self) -> str:
+        """The whole source, decoded on first use."""
+        if self._text is None:
+            self._text = str(self.source, "utf-8", "replace")
+        return self._text
+
+    def reevaluate(self, changed: list[str]) -> list[str]:
+        """
+        After globals were redefined, re-evaluate the fields and properties downstream of them in every class.
+        Returns the re-evaluated names.
+        """
+        reevaluated = []
+        for csharp_class in self.get_classes():
+            reevaluated.extend(csharp_class.reevaluate(changed))
+        return reevaluated
+
     def _extract_class_name(self, node: Node) -> str:
         for child in node.children:
-            if child.type == "identifier" and child.text:
-                return child.text.decode()
+            if child.type == "identifier":
+                return node_text(self.source, child)
         return ""
 
     def get_classes(self) -> Iterator['CSharpClass']:
         """
-        Yield all classes in the file, in the order they were added to the environment.
+        Yield all classes (and structs and records) in the file in source order, nested ones after the type around them.
         """
-        for value in self.environment.values.values():
-            if isinstance(value, Type) and isinstance(value.value, CSharpClass):
-                yield value.value
+        for symbol in self.symbols.types():
+            if isinstance(symbol.value, CSharpClass):
+                yield symbol.value
 
-    def _traverse(self) -> Iterator[Node]:
+    def _traverse(self, descend: set[str] | None = None) -> Iterator[Node]:
+        """
+        Yield nodes in document order. With descend, only the children of nodes of those types are visited;
+        every other subtree is skipped after its root.
+        """
         cursor = self.tree.walk()
         reached_root = False
         while not reached_root:
             if cursor.node:
                 yield cursor.node
 
-            if cursor.goto_first_child():
+            if (descend is None or cursor.node.type in descend) and cursor.goto_first_child():
                 continue
 
             if cursor.goto_next_sibling():
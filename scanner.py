@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+# Scan a directory of C# files in parallel and merge the per-file results
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import DEFAULT_MAX_AGE, DEFAULT_MAX_BYTES, ExtractionCache, globals_fingerprint
+from Environment import Environment
+from helper import create_globals, globals
+from metrics import METRICS
+from parser import CSharpClass, CSharpFile, CSharpMethod, ParseLimitError, ParseLimits
+from Symbols import SymbolIndex
+
+
+DEFAULT_CHUNKSIZE = 16
+
+# Per-worker state, set once by _init_worker instead of being pickled with every task
+_worker_globals: Environment | None = None
+_worker_metadata_only = False
+_worker_limits: ParseLimits | None = None
+
+
+def find_cs_files(root: str) -> list[str]:
+    """
+    Return every *.cs file under root, sorted so that results are stable between runs.
+    """
+    if os.path.isfile(root):
+        return [root]
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for filename in filenames:
+            if filename.endswith(".cs"):
+                found.append(os.path.join(dirpath, filename))
+    found.sort()
+    return found
+
+
+def read_source(path: str) -> str:
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as file:
+        return file.read()
+
+
+def environment_record(env: Environment) -> dict[str, dict]:
+    """
+    Flatten the values of a single environment (not its enclosing ones) into plain data.
+    Methods and classes are recorded by name only.
+    """
+    record = {}
+    for var_name, type_obj in env.values.items():
+        value = type_obj.value
+        if isinstance(value, CSharpMethod):
+            value = value.method_name
+        elif isinstance(value, CSharpClass):
+            value = value.class_name
+        elif value is not None and not isinstance(value, str):
+            value = str(value)
+        record[var_name] = {"value": value, "cstype": type_obj.cstype}
+    return record
+
+
+def method_record(method: CSharpMethod, metadata_only: bool = False) -> dict:
+    record = {
+        "method_name": method.method_name,
+        "attributes": list(method.attributes),
+        "parsed_attributes": [attribute.to_dict() for attribute in method.parsed_attributes],
+        "parameters": list(method.parameters),
+    }
+    if not metadata_only:
+        record["environment"] = environment_record(method.environment)
+        record["endpoints"] = method.endpoints()
+        record["local_methods"] = [method_record(local) for local in method.get_methods()]
+    return record
+
+
+def class_record(csharp_class: CSharpClass, metadata_only: bool = False) -> dict:
+    return {
+        "class_name": csharp_class.class_name,
+        "qualified_name": csharp_class.qualified_name,
+        "attributes": list(csharp_class.attributes),
+        "parsed_attributes": [attribute.to_dict() for attribute in csharp_class.parsed_attributes],
+        "super_class_name": csharp_class.super_class_name,
+        "environment": environment_record(csharp_class.environment),
+        "methods": [method_record(method, metadata_only) for method in csharp_class.get_methods()],
+    }
+
+
+def file_record(path: str, cs: CSharpFile, metadata_only: bool = False) -> dict:
+    return {
+        "file": path,
+        "environment": {
+            name: value for name, value in environment_record(cs.environment).items()
+            if value["cstype"] != "class"
+        },
+        "classes": [class_record(csharp_class, metadata_only) for csharp_class in cs.get_classes()],
+    }
+
+
+def extract_file(path: str, globals_env: Environment | None = None, metadata_only: bool = False,
+                 limits: ParseLimits | None = None) -> dict:
+    """
+    Parse one file and return its extraction result as plain (picklable, JSON-able) data.
+    Failures are reported in the record instead of aborting the whole scan.
+    metadata_only leaves out method environments and local methods; method bodies are then never evaluated.
+    A file over a size or parse time limit is recorded as skipped, with the reason; one with too many
+    syntax errors is extracted as metadata only and marked downgraded.
+    """
+    try:
+        with METRICS.phase("read"), open(path, "rb") as file:
+            if limits is not None:
+                limits.check_size(os.fstat(file.fileno()).st_size)  # before reading a huge file
+            source = file.read()
+    except ParseLimitError as e:
+        return {"file": path, "skipped": str(e), "environment": {}, "classes": []}
+    except Exception as e:
+        return {"file": path, "error": f"{type(e).__name__}: {e}", "environment": {}, "classes": []}
+    return extract_source(path, source, globals_env, metadata_only, limits)
+
+
+def extract_source(path: str, source: bytes, globals_env: Environment | None = None, metadata_only: bool = False,
+                   limits: ParseLimits | None = None) -> dict:
+    """Like extract_file, for the content of a file that is not read from disk (e.g. a git blob) recorded as path."""
+    try:
+        if limits is not None:
+            limits.check_size(len(source))
+        cs = CSharpFile(source, globals=globals_env, lazy=metadata_only, limits=limits)
+        if cs.downgraded is None:
+            return file_record(path, cs, metadata_only)
+        return {**file_record(path, cs, True), "downgraded": cs.downgraded}
+    except ParseLimitError as e:
+        return {"file": path, "skipped": str(e), "environment": {}, "classes": []}
+    except Exception as e:
+        return {"file": path, "error": f"{type(e).__name__}: {e}", "environment": {}, "classes": []}
+
+
+def _init_worker(globals_str: str, quiet_stdout: bool = True, index: SymbolIndex | None = None,
+                 metadata_only: bool = False, metrics: bool = False, limits: ParseLimits | None = None):
+    global _worker_globals, _worker_metadata_only, _worker_limits
+    _worker_metadata_only = metadata_only
+    _worker_limits = limits
+    METRICS.enable(metrics)
+    if quiet_stdout:
+        # Nothing printed while extracting may end up in JSON written to stdout
+        sys.stdout = sys.stderr
+    _worker_globals = create_globals(globals_str)
+    if index is not None:
+        # The index is pickled once per worker; its values are resolved lazily against these globals
+        index.bind(_worker_globals)
+        _worker_globals = index.environment
+    CSharpFile.parser  # the grammar is loaded and the tree-sitter Parser created once per process, up front
+
+
+def _extract_in_worker(path: str) -> dict:
+    if not METRICS.enabled:
+        return extract_file(path, _worker_globals, _worker_metadata_only, _worker_limits)
+    # The numbers travel back with the record; collect_metrics() takes them off again
+    METRICS.begin_file(path)
+    record = extract_file(path, _worker_globals, _worker_metadata_only, _worker_limits)
+    record["metrics"] = METRICS.end_file()
+    return record
+
+
+def collect_metrics(records: Iterable[dict]) -> Iterator[dict]:
+    """Move the per-file metrics that workers attached to records into METRICS."""
+    for record in records:
+        if "metrics" in record:
+            METRICS.add_file(record["file"], record.pop("metrics"))
+        yield record
+
+
+def iter_scan(paths: list[str], globals_str: str = globals, workers: int | None = None,
+              chunksize: int = DEFAULT_CHUNKSIZE, index: SymbolIndex | None = None,
+              metadata_only: bool = False, limits: ParseLimits | None = None) -> Iterator[dict]:
+    """
+    Yield one file record per path, in the order of paths.
+    With workers == 1 everything runs in this process, otherwise a process pool is used.
+    With an index, names declared in other files (base class members, constants, enum members) resolve too.
+    """
+    if workers == 1 or len(paths) <= 1:
+        _init_worker(globals_str, quiet_stdout=False, index=index, metadata_only=metadata_only, metrics=METRICS.enabled,
+                     limits=limits)
+        for path in paths:
+            with contextlib.redirect_stdout(sys.stderr):
+                record = _extract_in_worker(path)
+            yield record
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(globals_str, True, index, metadata_only, METRICS.enabled, limits)) as executor:
+        yield from executor.map(_extract_in_worker, paths, chunksize=chunksize)
+
+
+def scan_fingerprint(globals_str: str = globals, index: SymbolIndex | None = None, metadata_only: bool = False,
+                     limits: ParseLimits | None = None) -> str:
+    """Everything besides a file's content and the parser version that changes its record."""
+    fingerprint = globals_fingerprint(create_globals(globals_str))
+    if index is not None:
+        fingerprint += index.fingerprint()
+    if metadata_only:
+        fingerprint += ":metadata"
+    if limits is not None and limits.max_error_ratio is not None:
+        fingerprint += f":errors<={limits.max_error_ratio}"
+    return fingerprint
+
+
+def iter_scan_cached(paths: list[str], cache: ExtractionCache, globals_str: str = globals,
+                     workers: int | None = None, chunksize: int = DEFAULT_CHUNKSIZE,
+                     index: SymbolIndex | None = None, metadata_only: bool = False,
+                     limits: ParseLimits | None = None) -> Iterator[dict]:
+    """
+    Like iter_scan, but files whose content (and globals, index and parser version) are unchanged
+    are answered from the cache; only the misses are parsed. The cache is saved once all records were consumed.
+    """
+    globals_fp = scan_fingerprint(globals_str, index, metadata_only, limits)
+    # Only the keys are collected up front, so records stream out in path order without being held in memory
+    keys = []
+    misses = []
+    for path in paths:
+        try:
+            with open(path, "rb") as file:
+                keys.append(cache.key(file.read(), globals_fp))
+        except OSError:
+            keys.append(None)  # extracted anyway, so the record carries the error
+        if keys[-1] is None or keys[-1] not in cache:
+            cache.misses += 1
+            misses.append(path)
+
+    parsed = iter_scan(misses, globals_str, workers, chunksize, index, metadata_only, limits)
+    missed = set(misses)
+    for path, key in zip(paths, keys):
+        if path in missed:
+            record = next(parsed)
+        else:
+            record = cache.get(key)
+            if record is not None:
+                yield {"file": path, **record}
+                continue
+            # Unreadable cache entry
+            record = next(iter_scan([path], globals_str, 1, chunksize, index, metadata_only, limits))
+        # Skipped files are not cached: a timeout depends on the machine, and the limits may change
+        if key is not None and "error" not in record and "skipped" not in record:
+            cache.put(key, {k: v for k, v in record.items() if k not in ("file", "metrics")})
+        yield record
+    cache.save()
+
+
+def merge_records(root: str, records: list[dict]) -> dict:
+    """
+    Merge per-file records into one result with a summary.
+    """
+    classes = sum(len(record["classes"]) for record in records)
+    methods = sum(len(c["methods"]) for record in records for c in record["classes"])
+    errors = [{"file": record["file"], "error": record["error"]} for record in records if "error" in record]
+    skipped = [{"file": record["file"], "reason": record["skipped"]} for record in records if "skipped" in record]
+    downgraded = [{"file": record["file"], "reason": record["downgraded"]} for record in records if "downgraded" in record]
+    return {
+        "root": root,
+        "summary": {"files": len(records), "classes": classes, "methods": methods, "errors": len(errors),
+                    "skipped": len(skipped), "downgraded": len(downgraded)},
+        "errors": errors,
+        "skipped": skipped,
+        "downgraded": downgraded,
+        "files": records,
+    }
+
+
+def scan(root: str, globals_str: str = globals, workers: int | None = None,
+         chunksize: int = DEFAULT_CHUNKSIZE, cache: ExtractionCache | None = None, index: bool = False,
+         metadata_only: bool = False, limits: ParseLimits | None = None) -> dict:
+    paths = find_cs_files(root)
+    # One pass over every file first, so each file can resolve names declared in the others
+    symbols = SymbolIndex.build(paths, limits=limits, cache=cache) if index else None
+    if cache is not None:
+        records = iter_scan_cached(paths, cache, globals_str, workers, chunksize, symbols, metadata_only, limits)
+    else:
+        records = iter_scan(paths, globals_str, workers, chunksize, symbols, metadata_only, limits)
+    return merge_records(root, list(collect_metrics(records)))
+
+
+def add_limit_arguments(arg_parser: argparse.ArgumentParser):
+    arg_parser.add_argument("--max-file-kb", type=float, default=None, help="skip files larger than this")
+    arg_parser.add_argument("--parse-timeout", type=float, default=None, help="skip files tree-sitter cannot parse within this many seconds")
+    arg_parser.add_argument("--max-error-ratio", type=float, default=None, help="extract files with more than this share of bytes in syntax errors as metadata only")
+
+
+def limits_from_arguments(args: argparse.Namespace) -> ParseLimits | None:
+    if args.max_file_kb is None and args.parse_timeout is None and args.max_error_ratio is None:
+        return None
+    max_bytes = int(args.max_file_kb * 1024) if args.max_file_kb is not None else None
+    return ParseLimits(max_bytes, args.parse_timeout, args.max_error_ratio)
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="parsing scan", description="Extract classes, methods and environments from every *.cs file under a directory.")
+    arg_parser.add_argument("root", help="directory (or single .cs file) to scan")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count, 1 = no pool)")
+    arg_parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="files handed to a worker at a time")
+    arg_parser.add_argument("--globals", dest="globals_file", default=None, help="NAME=value file (like newvars.txt) to use instead of helper.globals")
+    arg_parser.add_argument("--index", action="store_true", help="index declarations across all files first, to resolve base class members, constants and enum members")
+    arg_parser.add_argument("--metadata-only", action="store_true", help="only class environments and method names, attributes and parameters; method bodies are not evaluated")
+    add_limit_arguments(arg_parser)
+    arg_parser.add_argument("--cache", dest="cache_dir", default=None, help="directory of the on-disk result cache (default: no cache)")
+    arg_parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / (1024 * 1024), help="evict least recently used cache entries above this size")
+    arg_parser.add_argument("--cache-max-age", type=float, default=DEFAULT_MAX_AGE / 86400, help="evict cache entries unused for this many days")
+    arg_parser.add_argument("-o", "--output", default="-", help="output JSON file (default: stdout)")
+    arg_parser.add_argument("--metrics", default=None, help="write phase timings and counters (total and per file) to this file")
+    arg_parser.add_argument("--metrics-format", choices=["json", "prometheus"], default="json", help="format of the --metrics file")
+    arg_parser.add_argument("-v", "--verbose", action="store_true", help="log unresolved names and other evaluation diagnostics to stderr")
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(levelname)s %(name)s: %(message)s")
+    if args.metrics:
+        METRICS.enable()
+
+    limits = limits_from_arguments(args)
+    globals_str = globals
+    if args.globals_file:
+        globals_str = read_source(args.globals_file)
+
+    if args.cache_dir:
+        with ExtractionCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024), args.cache_max_age * 86400) as cache:
+            result = scan(args.root, globals_str, args.workers, args.chunksize, cache, args.index, args.metadata_only, limits)
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
+    else:
+        result = scan(args.root, globals_str, args.workers, args.chunksize, index=args.index,
+                      metadata_only=args.metadata_only, limits=limits)
+
+    if args.output == "-":
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as file:
+            if args.metrics_format == "prometheus":
+                file.write(METRICS.prometheus())
+            else:
+                json.dump(METRICS.report(), file, indent=2)
+    summary = result["summary"]
+    print(f"Scanned {summary['files']} files: {summary['classes']} classes, {summary['methods']} methods, {summary['errors']} errors", file=sys.stderr)
+    if summary["skipped"] or summary["downgraded"]:
+        print(f"Over the limits: {summary['skipped']} skipped, {summary['downgraded']} extracted as metadata only", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+from __future__ import annotations
+
+# Flatten scan records into interned, integer-coded columns for suite-wide filters and group-bys
+import argparse
+import functools
+import json
+import sys
+
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+from urllib.parse import urlsplit
+
+from cache import DEFAULT_MAX_AGE, DEFAULT_MAX_BYTES, ExtractionCache
+from helper import globals
+from Metadata import Attribute, normalize_endpoint, normalize_operation, swagger_fields
+from scanner import DEFAULT_CHUNKSIZE, add_limit_arguments, find_cs_files, iter_scan, iter_scan_cached, limits_from_arguments, read_source
+from Symbols import SymbolIndex
+
+
+FORMAT_VERSION = 1
+
+# File states
+OK, ERROR, SKIPPED, DOWNGRADED = range(4)
+_STATES = ["ok", "error", "skipped", "downgraded"]
+
+# table -> its columns; every cell is an int32 (a string ID, a row of another table or a state)
+_TABLES = {
+    "files": ["path", "state", "reason"],
+    "classes": ["file", "name", "qualified_name", "super"],
+    "methods": ["class", "file", "name", "operation", "response_code", "path", "attributes_end", "endpoints_end"],
+    "attributes": ["method", "name", "short_name"],  # rows of a method are contiguous, ending at attributes_end
+    "endpoints": ["method", "endpoint"],  # likewise, ending at endpoints_end
+    "endpoint_keys": ["method", "key"],  # each endpoint, its path and the path's leading segments
+    "class_values": ["class", "name", "value", "cstype"],
+}
+
+# Method columns count_by() groups by, and the string they are shown as
+GROUPS = ["operation", "response_code", "path", "class", "file", "attribute", "endpoint"]
+
+
+@functools.cache
+def _numpy():
+    """numpy if it is installed, else None: the columns are then filtered in pure Python."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class StringTable:
+    """Interned strings by integer ID; ID 0 stands for None."""
+
+    def __init__(self, strings: list[str | None] | None = None):
+        self.strings: list[str | None] = strings if strings is not None else [None]
+        self.ids: dict[str | None, int] = {string: position for position, string in enumerate(self.strings)}
+
+    def intern(self, string: str | None) -> int:
+        found = self.ids.get(string)
+        if found is None:
+            found = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return found
+
+    def id(self, string: str | None) -> int | None:
+        """The ID of a string already interned, or None: nothing refers to it."""
+        return self.ids.get(string)
+
+    def __getitem__(self, string_id: int) -> str | None:
+        return self.strings[string_id]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class Table:
+    """Parallel array('i') columns of one relation."""
+    __slots__ = ("columns",)
+
+    def __init__(self, names: list[str]):
+        self.columns: dict[str, array] = {name: array("i") for name in names}
+
+    def append(self, *values: int) -> int:
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+        return len(self) - 1
+
+    def __getitem__(self, name: str) -> array:
+        return self.columns[name]
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values())))
+
+
+def _view(column: array):
+    """A numpy view of a column, without copying it."""
+    return _numpy().frombuffer(column, dtype=_numpy().int32) if len(column) else _numpy().zeros(0, _numpy().int32)
+
+
+def _rows_where(column: array, ids: list[int]):
+    """The rows of column holding one of ids: a sorted numpy array of row numbers, or a set without numpy."""
+    np = _numpy()
+    if not ids:
+        return np.zeros(0, np.intp) if np is not None else set()
+    if np is not None:
+        values = _view(column)
+        return np.flatnonzero(values == ids[0] if len(ids) == 1 else np.isin(values, ids))
+    wanted = set(ids)
+    return {row for row, value in enumerate(column) if value in wanted}
+
+
+def _take(column: array, rows):
+    """The values of column at rows, deduplicated."""
+    np = _numpy()
+    if np is not None:
+        return np.unique(_view(column)[rows])
+    return {column[row] for row in rows}
+
+
+def _intersect(selected: list):
+    np = _numpy()
+    if np is not None:
+        return functools.reduce(np.intersect1d, selected)
+    return set.intersection(*selected)
+
+
+class ResultStore:
+    """
+    Scan records (see scanner.file_record) flattened into integer columns over one StringTable: files,
+    classes, methods with their Swagger operation, response code and path, their attributes, resolved
+    endpoints and endpoint lookup keys, and the values of class environments. Method environments, local
+    methods and attribute arguments are not kept.
+
+    add_record() copies what it needs out of a record, so a scan can be streamed through the store and
+    neither the records nor the parsed files stay alive. methods_where() and count_by() run over whole
+    columns with numpy when it is installed, else over the arrays in pure Python.
+    """
+
+    def __init__(self):
+        self.strings = StringTable()
+        self.tables: dict[str, Table] = {name: Table(columns) for name, columns in _TABLES.items()}
+        self.files = self.tables["files"]
+        self.classes = self.tables["classes"]
+        self.methods = self.tables["methods"]
+        self.attributes = self.tables["attributes"]
+        self.endpoints = self.tables["endpoints"]
+        self.endpoint_keys = self.tables["endpoint_keys"]
+        self.class_values = self.tables["class_values"]
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> ResultStore:
+        store = cls()
+        for record in records:
+            store.add_record(record)
+        return store
+
+    def add_record(self, record: dict):
+        intern = self.strings.intern
+        if "error" in record:
+            state, reason = ERROR, record["error"]
+        elif "skipped" in record:
+            state, reason = SKIPPED, record["skipped"]
+        elif "downgraded" in record:
+            state, reason = DOWNGRADED, record["downgraded"]
+        else:
+            state, reason = OK, None
+        file = self.files.append(intern(record["file"]), state, intern(reason))
+        for class_record in record["classes"]:
+            owner = self.classes.append(file, intern(class_record["class_name"]), intern(class_record.get("qualified_name")),
+                                        intern(class_record["super_class_name"]))
+            for name, value in class_record["environment"].items():
+                if isinstance(value["value"], str):
+                    self.class_values.append(owner, intern(name), intern(value["value"]), intern(value["cstype"]))
+            for method in class_record["methods"]:
+                self._add_method(file, owner, method)
+
+    def _add_method(self, file: int, owner: int, method: dict):
+        intern = self.strings.intern
+        position = len(self.methods)
+        attributes = [Attribute.from_dict(attribute) for attribute in method.get("parsed_attributes", ())]
+        for attribute in attributes:
+            self.attributes.append(position, intern(attribute.name), intern(attribute.short_name))
+        endpoints = method.get("endpoints", ())
+        for endpoint in endpoints:
+            self.endpoints.append(position, intern(endpoint))
+            keys = {normalize_endpoint(endpoint)}
+            # Like AttributeIndex: the path and each leading part of it, in whole segments
+            path = normalize_endpoint(urlsplit(endpoint).path)
+            while path and path != "/":
+                keys.add(path)
+                path, _, segment = path.rpartition("/")
+                if not segment:
+                    break
+            for key in keys:
+                self.endpoint_keys.append(position, intern(key))
+        operation, response_code, path = swagger_fields(attributes)
+        self.methods.append(owner, file, intern(method["method_name"]), intern(operation), intern(response_code), intern(path),
+                            len(self.attributes), len(self.endpoints))
+
+    def methods_where(self, attribute: str | None = None, operation: str | None = None,
+                      response_code: int | str | None = None, endpoint: str | None = None,
+                      method_name: str | None = None, class_name: str | None = None) -> list[int]:
+        """
+        The method rows matching every given criterion, in the order they were added; the criteria
+        are those of AttributeIndex.query().
+        """
+        string_id = self.strings.id
+        selected = []
+        if method_name is not None:
+            selected.append(self._rows(self.methods["name"], string_id(method_name)))
+        if class_name is not None:
+            class_id = string_id(class_name)
+            owners = self._rows(self.classes["name"], class_id)
+            selected.append(_rows_where(self.methods["class"], list(owners)) if len(owners) else owners)
+        if attribute is not None:
+            attribute_id = string_id(attribute)
+            rows = self._rows(self.attributes["name"], attribute_id, self.attributes["short_name"])
+            selected.append(_take(self.attributes["method"], rows))
+        if operation is not None:
+            selected.append(self._rows(self.methods["operation"], string_id(normalize_operation(operation))))
+        if response_code is not None:
+            selected.append(self._rows(self.methods["response_code"], string_id(str(response_code))))
+        if endpoint is not None:
+            rows = self._rows(self.endpoint_keys["key"], string_id(normalize_endpoint(endpoint)))
+            selected.append(_take(self.endpoint_keys["method"], rows))
+        if not selected:
+            return list(range(len(self.methods)))
+        rows = _intersect(selected)
+        return rows.tolist() if _numpy() is not None else sorted(rows)
+
+    def _rows(self, column: array, string_id: int | None, other: array | None = None):
+        """Rows of column (or of other) equal to string_id; none for a string that was never interned."""
+        if string_id is None:
+            return _rows_where(column, [])
+        rows = _rows_where(column, [string_id])
+        if other is None:
+            return rows
+        also = _rows_where(other, [string_id])
+        np = _numpy()
+        return np.union1d(rows, also) if np is not None else rows | also
+
+    def count_by(self, group: str, rows: list[int] | None = None) -> dict[str | None, int]:
+        """
+        Number of methods (among rows, default all) per value of one of GROUPS, most frequent first.
+        A method counts once per attribute or endpoint it has when grouping by those.
+        """
+        if group not in GROUPS:
+            raise ValueError(f"cannot group by {group!r}, only by {', '.join(GROUPS)}")
+        if group == "attribute":
+            table, column = self.attributes, "short_name"
+        elif group == "endpoint":
+            table, column = self.endpoints, "endpoint"
+        else:
+            table, column = self.methods, group
+        values = table[column]
+        np = _numpy()
+        if np is not None:
+            codes = _view(values)
+            if table is not self.methods and rows is not None:
+                codes = codes[np.isin(_view(table["method"]), rows)]
+            elif rows is not None:
+                codes = codes[np.asarray(rows, dtype=np.intp)]
+            ids, counts = np.unique(codes, return_counts=True)
+            counted = dict(zip(ids.tolist(), counts.tolist()))
+        elif table is not self.methods:
+            wanted = None if rows is None else set(rows)
+            counted = Counter(value for value, method in zip(values, table["method"]) if wanted is None or method in wanted)
+        else:
+            counted = Counter(values if rows is None else (values[row] for row in rows))
+        return {self._label(group, code): count for code, count in sorted(counted.items(), key=lambda item: -item[1])}
+
+    def _label(self, group: str, code: int) -> str | None:
+        if group == "class":
+            return self.strings[self.classes["qualified_name"][code]] or self.strings[self.classes["name"][code]]
+        if group == "file":
+            return self.strings[self.files["path"][code]]
+        return self.strings[code]
+
+    def method_records(self, rows: Iterable[int]) -> list[dict]:
+        """The methods at rows as dicts like AttributeIndex entries, with attribute names only."""
+        strings, methods, classes = self.strings, self.methods, self.classes
+        records = []
+        for row in rows:
+            owner = methods["class"][row]
+            attributes_start = methods["attributes_end"][row - 1] if row else 0
+            endpoints_start = methods["endpoints_end"][row - 1] if row else 0
+            records.append({
+                "file": strings[self.files["path"][methods["file"][row]]],
+                "class_name": strings[classes["name"][owner]],
+                "super_class_name": strings[classes["super"][owner]],
+                "method_name": strings[methods["name"][row]],
+                "attributes": [strings[name] for name in self.attributes["name"][attributes_start:methods["attributes_end"][row]]],
+                "operation": strings[methods["operation"][row]],
+                "response_code": strings[methods["response_code"][row]],
+                "path": strings[methods["path"][row]],
+                "endpoints": [strings[endpoint] for endpoint in self.endpoints["endpoint"][endpoints_start:methods["endpoints_end"][row]]],
+            })
+        return records
+
+    def summary(self) -> dict:
+        states = Counter(self.files["state"])
+        return {
+            "files": len(self.files),
+            "classes": len(self.classes),
+            "methods": len(self.methods),
+            **{_STATES[state]: states[state] for state in (ERROR, SKIPPED, DOWNGRADED)},
+            "strings": len(self.strings),
+            "bytes": sum(column.itemsize * len(column) for table in self.tables.values() for column in table.columns.values()),
+        }
+
+    def save(self, path: str):
+        """One JSON line with the column lengths and the string table, then the raw bytes of each column in order."""
+        header = {
+            "version": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "tables": {name: len(table) for name, table in self.tables.items()},
+            "strings": self.strings.strings,
+        }
+        with open(path, "wb") as file:
+            file.write(json.dumps(header).encode() + b"\n")
+            for table in self.tables.values():
+                for column in table.columns.values():
+                    column.tofile(file)
+
+    @classmethod
+    def load(cls, path: str) -> ResultStore:
+        store = cls()
+        with open(path, "rb") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != FORMAT_VERSION:
+                raise ValueError(f"{path} was saved by another version of the store")
+            store.strings = StringTable(header["strings"])
+            for name, table in store.tables.items():
+                for column in table.columns.values():
+                    column.fromfile(file, header["tables"][name])
+                    if header["byteorder"] != sys.byteorder:
+                        column.byteswap()
+        return store
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="parsing stats", description="Scan a directory into a compact columnar store (or load a saved one), then count or list the test methods matching the given filters.")
+    source = arg_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("root", nargs="?", help="directory (or single .cs file) to scan")
+    source.add_argument("--load", default=None, help="store saved with --save, instead of scanning")
+    arg_parser.add_argument("--attribute", default=None, help="attribute name, e.g. Test or Swagger")
+    arg_parser.add_argument("--operation", default=None, help="Swagger operation, e.g. POST")
+    arg_parser.add_argument("--response-code", default=None, help="Swagger response code, e.g. 200")
+    arg_parser.add_argument("--endpoint", default=None, help="resolved endpoint, or only its path")
+    arg_parser.add_argument("--method", default=None, help="method name")
+    arg_parser.add_argument("--class", dest="class_name", default=None, help="class name")
+    arg_parser.add_argument("--group-by", choices=GROUPS, action="append", default=[], help="count the matching methods per value (repeatable)")
+    arg_parser.add_argument("--list", action="store_true", help="print the matching methods as JSON lines")
+    arg_parser.add_argument("--save", default=None, help="write the store to this file")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count, 1 = no pool)")
+    arg_parser.add_argument("--globals", dest="globals_file", default=None, help="NAME=value file (like newvars.txt) to use instead of helper.globals")
+    arg_parser.add_argument("--index", action="store_true", help="index declarations across all files first")
+    add_limit_arguments(arg_parser)
+    arg_parser.add_argument("--cache", dest="cache_dir", default=None, help="directory of the on-disk result cache (default: no cache)")
+    args = arg_parser.parse_args(argv)
+
+    if args.load:
+        store = ResultStore.load(args.load)
+    else:
+        globals_str = read_source(args.globals_file) if args.globals_file else globals
+        limits = limits_from_arguments(args)
+        paths = find_cs_files(args.root)
+        if args.cache_dir:
+            with ExtractionCache(args.cache_dir, DEFAULT_MAX_BYTES, DEFAULT_MAX_AGE) as cache:
+                index = SymbolIndex.build(paths, limits=limits, cache=cache) if args.index else None
+                store = ResultStore.from_records(iter_scan_cached(paths, cache, globals_str, args.workers, DEFAULT_CHUNKSIZE, index, limits=limits))
+        else:
+            index = SymbolIndex.build(paths, limits=limits) if args.index else None
+            store = ResultStore.from_records(iter_scan(paths, globals_str, args.workers, DEFAULT_CHUNKSIZE, index, limits=limits))
+    if args.save:
+        store.save(args.save)
+
+    rows = store.methods_where(args.attribute, args.operation, args.response_code, args.endpoint, args.method, args.class_name)
+    if args.list:
+        for record in store.method_records(rows):
+            print(json.dumps(record))
+    else:
+        result = {"summary": store.summary(), "matching": len(rows)}
+        for group in args.group_by:
+            result[group] = store.count_by(group, rows)
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
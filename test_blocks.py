@@ -0,0 +1,85 @@
+from helper import create_globals, globals
+from parser import CSharpClass, CSharpFile, CSharpMethod
+
+
+GLOBALS = create_globals(globals)
+
+
+def _class(members: str) -> CSharpClass:
+    cs = CSharpFile(f'public class Paths {{\n    const string Root = "/api";\n{members}\n}}\n', GLOBALS)
+    return next(iter(cs.get_classes()))
+
+
+def _method(csharp_class: CSharpClass, name: str) -> CSharpMethod:
+    return next(method for method in csharp_class.get_methods() if method.method_name == name)
+
+
+def _value(csharp_class: CSharpClass, name: str) -> str:
+    return csharp_class.environment.get(name).value
+
+
+def test_early_return_under_a_null_check():
+    paths = _class('''
+    string Items = Url(null);
+    string Item = Url("7");
+    static string Url(string id) { var path = $"{Root}/items"; if (id == null) { return path; } return $"{path}/{id}"; }''')
+    assert _value(paths, "Items") == '"/api/items"'
+    assert _value(paths, "Item") == '"/api/items/7"'
+
+
+def test_else_branch_and_logical_conditions():
+    paths = _class('''
+    string Both = Pick("a", "b");
+    string Left = Pick("a", "x");
+    string Neither = Pick("x", "y");
+    static string Pick(string first, string second) {
+        if (first == "a" && !(second != "b")) { return "both"; }
+        else if (first == "a" || false) { return "left"; }
+        else { return "neither"; }
+    }''')
+    assert _value(paths, "Both") == '"both"'
+    assert _value(paths, "Left") == '"left"'
+    assert _value(paths, "Neither") == '"neither"'
+
+
+def test_locals_are_reassigned_and_appended_to():
+    paths = _class('''
+    string Path = Build("users");
+    static string Build(string name) {
+        string path = Root;
+        path += "/";
+        path += name;
+        path = path + "/list";
+        return path;
+    }
+    static int Sum() { int total = 1; total += 2; return total; }''')
+    assert _value(paths, "Path") == '"/api/users/list"'
+    assert _method(paths, "Sum").invoke([]) == "3"
+
+
+def test_calls_and_field_updates_do_not_change_the_result():
+    paths = _class('''
+    int counter = 0;
+    string Logged = Log();
+    static string Log() { Console.WriteLine("x"); counter++; if (Verbose()) { Trace(); } return Root; }''')
+    assert _value(paths, "Logged") == '"/api"'
+
+
+def test_unfollowed_statements_give_no_result():
+    paths = _class('''
+    static string Increment() { var n = 1; n++; return $"{Root}/{n}"; }
+    static string Decrement(int n) { --n; return $"{Root}/{n}"; }
+    static string Throws() { throw new Exception(); }
+    static string Loops(int n) { var path = Root; for (var i = 0; i < n; i++) { path += "/x"; } return path; }
+    static string Unknown(string id) { if (id.Length > 2) { return "long"; } return "short"; }''')
+    assert _method(paths, "Increment").invoke([]) is None
+    assert _method(paths, "Decrement").invoke(["1"]) is None
+    assert _method(paths, "Throws").invoke([]) is None
+    assert _method(paths, "Loops").invoke(["2"]) is None
+    assert _method(paths, "Unknown").invoke(['"abc"']) is None
+
+
+def test_references_leave_out_parameters_and_locals():
+    paths = _class('''
+    static string Url(string id) { var path = Base + Root; return path + id; }''')
+    assert _method(paths, "Url").references() == {"Base", "Root"}
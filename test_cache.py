@@ -0,0 +1,101 @@
+import os
+import time
+
+from cache import ExtractionCache
+
+
+def _key(n: int) -> str:
+    return ExtractionCache.key(f"class C{n} {{}}".encode(), "globals")
+
+
+def test_get_counts_hits_and_misses(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    assert cache.get(_key(1)) is None
+    cache.put(_key(1), {"classes": ["C1"]})
+    assert cache.get(_key(1)) == {"classes": ["C1"]}
+    assert cache.get(_key(1), counted=False) == {"classes": ["C1"]}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_depends_on_source_and_globals():
+    assert ExtractionCache.key(b"class A {}", "g") == ExtractionCache.key(b"class A {}", "g")
+    assert ExtractionCache.key(b"class A {}", "g") != ExtractionCache.key(b"class B {}", "g")
+    assert ExtractionCache.key(b"class A {}", "g") != ExtractionCache.key(b"class A {}", "h")
+
+
+def test_records_survive_reopening(tmp_path):
+    with ExtractionCache(str(tmp_path)) as cache:
+        cache.put(_key(1), {"n": 1})
+        cache.put(_key(2), {"n": 2})
+    with ExtractionCache(str(tmp_path)) as cache:
+        assert cache.get(_key(2)) == {"n": 2}
+        assert cache.get(_key(1)) == {"n": 1}
+
+
+def test_save_evicts_entries_older_than_max_age(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_age=60)
+    cache.put(_key(1), {"n": 1})
+    cache.put(_key(2), {"n": 2})
+    offset, length, _ = cache.index[_key(1)]
+    cache.index[_key(1)] = (offset, length, time.time() - 120)
+    cache.close()
+    reopened = ExtractionCache(str(tmp_path), max_age=60)
+    assert _key(1) not in reopened
+    assert reopened.get(_key(2)) == {"n": 2}
+
+
+def test_save_evicts_least_recently_used_over_max_bytes(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    for n in range(3):
+        cache.put(_key(n), {"n": n, "padding": os.urandom(1000)})
+    for n, used in ((0, 30), (1, 10), (2, 20)):
+        offset, length, _ = cache.index[_key(n)]
+        cache.index[_key(n)] = (offset, length, time.time() - used)
+    cache.max_bytes = sum(length for _, length, _ in cache.index.values()) - 1
+    cache.save()
+    assert _key(0) not in cache
+    assert cache.get(_key(1))["n"] == 1
+    assert cache.get(_key(2))["n"] == 2
+
+
+def test_save_compacts_the_data_file(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_age=60)
+    for n in range(3):
+        cache.put(_key(n), {"n": n, "padding": os.urandom(1000)})
+    before = os.path.getsize(cache.data_path)
+    offset, length, _ = cache.index[_key(0)]
+    cache.index[_key(0)] = (offset, length, time.time() - 120)
+    cache.save()
+    assert os.path.getsize(cache.data_path) == before - length
+    assert [cache.get(_key(n))["n"] for n in (1, 2)] == [1, 2]
+    cache.close()
+    assert [ExtractionCache(str(tmp_path)).get(_key(n))["n"] for n in (1, 2)] == [1, 2]
+
+
+def test_truncated_data_file_drops_the_entries_past_its_end(tmp_path):
+    with ExtractionCache(str(tmp_path)) as cache:
+        cache.put(_key(1), {"n": 1})
+        cache.put(_key(2), {"n": 2})
+        end = cache.index[_key(1)][1]
+    with open(os.path.join(str(tmp_path), ExtractionCache.DATA_FILE), "r+b") as file:
+        file.truncate(end)
+    cache = ExtractionCache(str(tmp_path))
+    assert cache.get(_key(1)) == {"n": 1}
+    assert _key(2) not in cache
+
+
+def test_cached_scan_answers_unchanged_files_from_the_cache(tmp_path):
+    from scanner import iter_scan_cached
+
+    path = tmp_path / "Paths.cs"
+    path.write_text('public class Paths { const string Root = "/api"; }')
+    missing = str(tmp_path / "Missing.cs")
+    with ExtractionCache(str(tmp_path / "cache")) as cache:
+        first = list(iter_scan_cached([str(path), missing], cache, workers=1))
+        assert "error" in first[1]
+        assert len(cache.index) == 1  # the unreadable file is not cached
+    with ExtractionCache(str(tmp_path / "cache")) as cache:
+        second = list(iter_scan_cached([str(path), missing], cache, workers=1))
+        assert (cache.hits, cache.misses) == (1, 1)
+    assert second[0]["classes"] == first[0]["classes"]
+    assert "error" in second[1]
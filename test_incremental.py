@@ -0,0 +1,109 @@
+import pytest
+
+from helper import create_globals, globals
+from parser import CSharpClass, CSharpFile, CSharpMethod
+
+
+SOURCE = '''
+public class Paths {
+    const string Root = "/api";
+    string Admin = Root + "/admin";
+    string Share = Join("share");
+
+    static string Join(string name) { var path = Root; return path + "/" + name; }
+    public void Setup() { var token = "abc"; }
+}
+
+public class Other {
+    string Host = "localhost";
+    public void Run() { var port = "80"; }
+}
+'''
+
+GLOBALS = create_globals(globals)
+
+
+def _edit(cs: CSharpFile, old: str, new: str) -> list[CSharpClass | CSharpMethod]:
+    start = cs.source.tobytes().index(old.encode())
+    return cs.apply_edit(start, start + len(old.encode()), start + len(new.encode()), new)
+
+
+def _values(cs: CSharpFile) -> dict[str, dict[str, str]]:
+    """Every class and method environment, with methods by name."""
+    result = {}
+    for csharp_class in cs.get_classes():
+        scopes = [(csharp_class.class_name, csharp_class.environment)]
+        scopes += [(f"{csharp_class.class_name}.{m.method_name}", m.environment) for m in csharp_class.get_methods()]
+        for name, environment in scopes:
+            result[name] = {k: v.value.method_name if isinstance(v.value, CSharpMethod) else str(v.value)
+                            for k, v in environment.values.items()}
+    return result
+
+
+def _classes(cs: CSharpFile) -> dict[str, CSharpClass]:
+    return {csharp_class.class_name: csharp_class for csharp_class in cs.get_classes()}
+
+
+@pytest.fixture
+def cs() -> CSharpFile:
+    return CSharpFile(SOURCE, GLOBALS)
+
+
+def test_method_edit_rebuilds_only_that_method(cs):
+    classes = _classes(cs)
+    rebuilt = _edit(cs, '"abc"', '"xyz"')
+    assert [type(obj).__name__ + ":" + obj.method_name for obj in rebuilt] == ["CSharpMethod:Setup"]
+    assert _classes(cs) == classes  # the same class objects
+    assert _values(cs) == _values(CSharpFile(cs.source, GLOBALS))
+    assert _values(cs)["Paths.Setup"]["token"] == '"xyz"'
+
+
+def test_field_edit_reevaluates_the_fields_depending_on_it(cs):
+    other = _classes(cs)["Other"]
+    rebuilt = _edit(cs, '"/api"', '"/v2"')
+    assert [obj.class_name for obj in rebuilt] == ["Paths"]
+    assert _classes(cs)["Other"] is other
+    values = _values(cs)
+    assert values["Paths"]["Admin"] == '"/v2/admin"'
+    assert values["Paths"]["Share"] == '"/v2/share"'
+    assert values == _values(CSharpFile(cs.source, GLOBALS))
+
+
+def test_edit_of_a_called_method_reevaluates_its_callers(cs):
+    rebuilt = _edit(cs, 'path + "/" + name', 'path + "/v1/" + name')
+    assert [obj.method_name for obj in rebuilt] == ["Join"]
+    assert _values(cs)["Paths"]["Share"] == '"/api/v1/share"'
+
+
+def test_nodes_point_into_the_new_source(cs):
+    _edit(cs, '"abc"', '"a much longer token"')
+    for csharp_class in cs.get_classes():
+        assert cs.source[csharp_class.node.start_byte:csharp_class.node.end_byte].tobytes() == csharp_class.node.text
+        for method in csharp_class.get_methods():
+            assert method.source is cs.source
+            assert cs.source[method.node.start_byte:method.node.end_byte].tobytes() == method.node.text
+
+
+def test_added_method_rebuilds_the_class(cs):
+    rebuilt = _edit(cs, "public void Run()", 'string Port() { return "80"; }\n    public void Run()')
+    assert [obj.class_name for obj in rebuilt] == ["Other"]
+    assert "Port" in _values(cs)["Other"]
+
+
+def test_added_class_rebuilds_the_file(cs):
+    rebuilt = _edit(cs, "public class Other", 'public class Extra { string X = "x"; }\n\npublic class Other')
+    assert sorted(obj.class_name for obj in rebuilt) == ["Extra", "Other", "Paths"]
+    assert _values(cs) == _values(CSharpFile(cs.source, GLOBALS))
+
+
+def test_edit_of_a_class_used_by_another_rebuilds_the_file():
+    cs = CSharpFile(SOURCE + '\npublic class Uses { string Url = Paths.Admin + "/x"; }\n', GLOBALS)
+    _edit(cs, '"/admin"', '"/root"')
+    assert _values(cs)["Uses"]["Url"] == '"/api/root/x"'
+
+
+def test_invalid_edit_is_rejected(cs):
+    with pytest.raises(ValueError):
+        cs.apply_edit(10, 5, 10, "")
+    with pytest.raises(ValueError):
+        cs.apply_edit(10, 12, 20, "ab")
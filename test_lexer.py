@@ -0,0 +1,91 @@
+from Lexer import Hole, identifiers, lex_string, split_top_level, string_segments
+from helper import create_globals, globals
+from parser import CSharpFile
+
+
+def _segments(expression: str) -> list[str | tuple] | None:
+    """string_segments with adjacent text joined, empty text dropped and holes as tuples."""
+    segments = string_segments(expression)
+    if segments is None:
+        return None
+    result: list[str | tuple] = []
+    for segment in segments:
+        if isinstance(segment, Hole):
+            result.append((segment.code, segment.alignment, segment.format))
+        elif result and isinstance(result[-1], str):
+            result[-1] += segment
+        elif segment:
+            result.append(segment)
+    return [segment for segment in result if segment != ""]
+
+
+def test_doubled_braces_are_literal():
+    assert _segments('$"{{a}} {b}"') == ["{a} ", ("b", None, None)]
+    assert _segments('"{{a}}"') == ["{{a}}"]  # not interpolated
+
+
+def test_alignment_and_format_specifiers():
+    assert _segments('$"{x,5:D3}"') == [("x", "5", "D3")]
+    assert _segments('$"{d:HH:mm}!"') == [("d", None, "HH:mm"), "!"]
+    assert _segments('$"{global::X.Y}"') == [("global::X.Y", None, None)]
+    assert _segments('$"{(a ? b : c)}"') == [("(a ? b : c)", None, None)]
+    assert _segments('$"{Get("}", 1)}!"') == [('Get("}", 1)', None, None), "!"]
+
+
+def test_verbatim_strings():
+    assert _segments('@"a\\b"') == ["a\\b"]
+    assert _segments('$@"{Root}\\dir ""q"""') == [("Root", None, None), '\\dir "q"']
+    assert _segments('@$"{Root}\\d"') == [("Root", None, None), "\\d"]
+    assert _segments('"a\\"b"') == ['a\\"b']  # backslash escapes stay as written
+
+
+def test_raw_strings():
+    assert _segments('"""say "hi" """') == ['say "hi" ']
+    assert _segments('$$"""{{Root}}/{raw}"""') == [("Root", None, None), "/{raw}"]
+    assert _segments('$"""{Root}/"{Id}" """') == [("Root", None, None), '/"', ("Id", None, None), '" ']
+    assert _segments('$$"""\n    {{Root}}\n      x\n    """') == [("Root", None, None), "\n  x"]
+
+
+def test_concatenations():
+    assert _segments('"a" + x + $"b{y}"') == ["a", ("x", None, None), "b", ("y", None, None)]
+    assert _segments('"a" + (b + "c")') == ["a", ('(b + "c")', None, None)]
+    assert _segments('Get(x)') is None
+    assert _segments('x') is None
+
+
+def test_lex_string_returns_the_end_of_the_literal():
+    assert lex_string('$"a{b}" + rest', 0) == 7
+    assert lex_string('x = $$"""{{"}}"}}""";', 4) == len('x = $$"""{{"}}"}}"""')
+
+
+def test_split_top_level_skips_literals_and_brackets():
+    assert split_top_level('a, "b,c", f(d, e), $"{x,2}", \',\'', ",") == ["a", '"b,c"', "f(d, e)", '$"{x,2}"', "','"]
+
+
+def test_identifiers_skip_literal_text_and_formats():
+    found: set[str] = set()
+    identifiers('A + $"{B:C} lit {D,E}" + "F" + G', found)
+    assert found == {"A", "B", "D", "E", "G"}
+
+
+def test_field_values():
+    cs = CSharpFile('''
+public class Paths {
+    const string Root = "/api";
+    string Id = "7";
+    string Braces = $"{{literal}} {Root}/x";
+    string Padded = $"{Id,5:D3}!";
+    string Verbatim = $@"{Root}\\dir";
+    string Raw = $$"""
+        {{Root}}/{raw}
+        """;
+}
+''', create_globals(globals))
+    paths = next(iter(cs.get_classes()))
+    values = {name: paths.environment.get(name).value for name in ("Braces", "Padded", "Verbatim", "Raw")}
+    assert values == {
+        "Braces": '"{literal} /api/x"',
+        "Padded": '"  007!"',
+        "Verbatim": '"/api\\dir"',
+        "Raw": '"/api/{raw}"',
+    }